@@ -1,10 +1,16 @@
 import io
+import sys
+from pathlib import Path
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 import os
 
+# Shared processing code lives in the scripts folder of the repository
+sys.path.append(str(Path(__file__).resolve().parents[2] / "scripts"))
+from salt_dilution import calculate_cf, detect_cf_plateaus
+
 # Default values for the new DataFrame
 default_data = {
     'Vol. [ml]': [3000, 3000.2, 3000.4, 3000.6, 3000.8, 3001],
@@ -114,35 +120,32 @@ def main():
                       labels={"x": "Index", ec_column: "EC.T [uS/cm]"})
     
 
-        # Create a list to store selected points' indices
-        selected_points = []
-
-        # Create columns for input boxes for point selection (below the plot)
-        st.write("### Select Points on the Plot")
-        st.write("<p style='color: grey; font-style: italic;'>hint: hover cursor on plot to display index</p>", unsafe_allow_html=True)
-        cols = st.columns(6)
-
-        # For each column, create a text input for the user to specify the index
-        for i, col in enumerate(cols):
+        # Detect the stable plateau after each addition (one per row of the CF table)
+        st.write("### Detected Plateaus")
+        plateau_cols = st.columns(3)
+        n_plateaus = plateau_cols[0].number_input("Number of plateaus", min_value=2, value=len(df_cf), step=1)
+        min_length = plateau_cols[1].number_input("Minimum plateau length (readings)", min_value=2, value=10, step=1)
+        min_ec = plateau_cols[2].number_input("Lowest in-water EC [uS/cm] (0 = automatic)", min_value=0.0, value=0.0,
+                                              help="Readings below this value (sensor in air) are ignored.")
+        df_plateaus = detect_cf_plateaus(df[ec_column], n_plateaus=int(n_plateaus), min_length=int(min_length),
+                                         min_ec=min_ec or None)
+        if len(df_plateaus) < n_plateaus:
+            st.warning(f"Only {len(df_plateaus)} of {n_plateaus} plateaus detected. Please complete the CF table by hand.")
+
+        # Mark the plateaus on the plot
+        for i, plateau in df_plateaus.iterrows():
             label = f"Point {i + 1}"
-            index = col.text_input(f"Index for {label}", value=str(i), key=f"input_{i}")
-            try:
-                index = int(index)
-                if 0 <= index < len(df):
-                    selected_points.append(index)
-                    fig.add_trace(go.Scatter(
-                        x=[index], 
-                        y=[df.loc[index, ec_column]], 
-                        mode='markers+text',
-                        name=label,
-                        text=[f"{label}"],
-                        textposition='top center',
-                        showlegend=False
-                    ))
-                else:
-                    st.warning(f"Index {index} for {label} is out of range. Please enter a valid index.")
-            except ValueError:
-                st.warning(f"Invalid index entered for {label}. Please enter a valid integer.")
+            fig.add_vrect(x0=plateau['start'], x1=plateau['end'], fillcolor='orange', opacity=0.2, line_width=0)
+            fig.add_trace(go.Scatter(
+                x=[(plateau['start'] + plateau['end']) / 2], 
+                y=[plateau['ec_median']], 
+                mode='markers+text',
+                name=label,
+                text=[f"{label}"],
+                textposition='top center',
+                showlegend=False
+            ))
+        st.dataframe(df_plateaus.rename(columns={'ec_median': 'EC median [uS/cm]', 'ec_spread': 'EC spread [uS/cm]'}), hide_index=True)
 
         # Add y-axis slider below the plot
         y_min, y_max = st.slider(
@@ -156,9 +159,10 @@ def main():
         # Display the updated plot with points selected
         st.plotly_chart(fig, use_container_width=True)
 
-        # Display the EC.T values corresponding to the selected indices
-        y_values = [df.loc[index, ec_column] for index in selected_points]
-        df_cf['EC [uS/cm]'][:len(y_values)] = y_values
+        # Pre-fill the CF table with the plateau levels (extra rows are added for more plateaus than default)
+        if not df_plateaus.empty:
+            df_cf = df_cf.reindex(range(max(len(df_cf), len(df_plateaus))))
+            df_cf.loc[:len(df_plateaus) - 1, 'EC [uS/cm]'] = df_plateaus['ec_median'].to_numpy()
 
         # Show the CF DataFrame
         st.write("### CF DataFrame")
@@ -174,6 +178,13 @@ def main():
         else:
             st.markdown("<p style='color: red; font-weight: bold;'>❌ Delta EC values are not consistent within ±0.5</p>", unsafe_allow_html=True)
 
+        # CF regression (concentration against EC) from the table as edited
+        cf = calculate_cf(df_cf, primary_solution)
+        cf_cols = st.columns(3)
+        cf_cols[0].metric("CF [(g/m3)/(uS/cm)]", f"{cf['cf']:.6f}")
+        cf_cols[1].metric("R²", f"{cf['r2']:.4f}")
+        cf_cols[2].metric("Points", cf['n'])
+
         # "Save to Hydrology Shared" Button
         st.write("### Save CF File to \Hydrology_Shared")
         if field_sampling_date and sensor and site:
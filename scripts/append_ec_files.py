@@ -1,33 +1,55 @@
-import pandas as pd
-import glob
+import argparse
 import os
+from pathlib import Path
+from ec_store import ingest_ec_files, iter_ec_partitions
+from project_utils import write_excel_chunks
 
 # Define the directory containing the .xlsx files
-directory = r"H:\tire-toxin\data\Discharge\Manual_salt\EC\raw\northfield\misc\longterm_ec"
-
-# Find all .xlsx files in the directory
-file_paths = glob.glob(os.path.join(directory, "*.xlsx"))
-
-# List to store DataFrames
-dataframes = []
-
-# Load each file and append to the list
-for file in file_paths:
-    df = pd.read_excel(file, usecols=["DT", "RTCTmp", "RawV", "EC", "PrbTmp", "EC.T", "PTVolt", "PTDep"], parse_dates=["DT"])
-    dataframes.append(df)
-
-# Concatenate all DataFrames into one
-if dataframes:
-    final_df = pd.concat(dataframes, ignore_index=True)
-    print("Successfully loaded and concatenated all files.")
-    
-    # Save the final DataFrame to the directory
-    output_path = os.path.join(directory, "northfield_longterm_ec_Dec2024_appended.xlsx")
-    final_df.to_excel(output_path, index=False)
-    print(f"File saved to {output_path}")
-else:
-    final_df = pd.DataFrame()
-    print("No .xlsx files found.")
-
-# Display the first few rows
-print(final_df.head())
+EC_LONGTERM_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Manual_salt\EC\raw\northfield\misc\longterm_ec")
+
+# Name of the long-term record in the EC store
+EC_LONGTERM_RECORD = "northfield_longterm"
+
+# Excel export of the whole record (saved in the same directory, so it is excluded from the inputs)
+EC_LONGTERM_EXPORT = "northfield_longterm_ec_Dec2024_appended.xlsx"
+
+# Columns to keep from each logger export
+EC_LONGTERM_COLUMNS = ["DT", "RTCTmp", "RawV", "EC", "PrbTmp", "EC.T", "PTVolt", "PTDep"]
+
+def find_ec_exports(directory, exclude=()):
+    """Lists the logger exports of a directory, skipping Excel lock files and the given outputs."""
+    exclude = {os.path.abspath(file) for file in exclude}
+    return sorted(file for file in Path(directory).glob("*.xlsx")
+                  if not file.name.startswith('~') and os.path.abspath(file) not in exclude)
+
+def export_record(record_name, output_path):
+    """Streams the record to a single Excel file one monthly partition at a time."""
+    return write_excel_chunks(iter_ec_partitions(record_name, columns=EC_LONGTERM_COLUMNS), output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental append of long-term EC logger exports into the EC store.")
+    parser.add_argument('directory', nargs='?', default=EC_LONGTERM_DIRECTORY, help="Directory of the logger exports.")
+    parser.add_argument('--record', default=EC_LONGTERM_RECORD, help="Record name in the EC store.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--export', action='store_true', help="Also write the whole record to a single Excel file.")
+    args = parser.parse_args()
+
+    output_path = Path(args.directory) / EC_LONGTERM_EXPORT
+    file_paths = find_ec_exports(args.directory, exclude=[output_path])
+    if not file_paths:
+        print("No .xlsx files found.")
+        return
+
+    # Only files missing from the store's manifest are read
+    df_ingested, written_partitions = ingest_ec_files(args.record, file_paths, columns=EC_LONGTERM_COLUMNS,
+                                                      max_workers=args.workers)
+    for row in df_ingested.itertuples():
+        print(f"{os.path.basename(row.path)}: {row.rows} rows ({row.start} to {row.end}).")
+    print(f"{len(df_ingested)} new files of {len(file_paths)}, {len(written_partitions)} partitions written.")
+
+    if args.export:
+        n_rows = export_record(args.record, output_path)
+        print(f"{n_rows} rows saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+from pathlib import Path
+import pandas as pd
+from project_utils import write_excel_chunks
+from salt_dilution import process_campaign, update_cf_catalog
+
+# Number formats of the results table
+DISCHARGE_DECIMALS = {
+    'salt_mass_g': 1,
+    'cf': 6,
+    'cf_r2': 4,
+    'background_ec': 2,
+    'peak_ec': 2,
+    'ec_integral': 1,
+    'discharge_m3s': 4,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Salt dilution discharge for every dump file of a campaign directory.")
+    parser.add_argument('campaign_directory', help="Directory of processed EC dump and baseline files (searched recursively).")
+    parser.add_argument('--output', default=None, help="Results file (.xlsx or .csv). Defaults to discharge_results.xlsx in the campaign directory.")
+    parser.add_argument('--cf-directory', default=None, help="Root of the CF tree.")
+    parser.add_argument('--metadata-directory', default=None, help="Root of the field metadata tree.")
+    parser.add_argument('--background', choices=['baseline', 'edges'], default=None,
+                        help="Background EC method (default: baseline file if found, otherwise the window edges).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--no-cf-catalog', action='store_true',
+                        help="Read the CF files of each dump instead of the CF catalog (nearest calibration fallback is disabled).")
+    args = parser.parse_args()
+
+    # Bring the CF catalog up to date once (only new or changed CF files are read)
+    cf_catalog = None if args.no_cf_catalog else update_cf_catalog(args.cf_directory)
+
+    df_results = process_campaign(args.campaign_directory, cf_directory=args.cf_directory,
+                                  metadata_directory=args.metadata_directory,
+                                  background_method=args.background, max_workers=args.workers,
+                                  cf_catalog=cf_catalog)
+    if df_results.empty:
+        print(f"No dump files found in {args.campaign_directory}.")
+        return
+
+    output_file = Path(args.output) if args.output else Path(args.campaign_directory) / "discharge_results.xlsx"
+    if output_file.suffix.lower() == '.csv':
+        df_results.to_csv(output_file, index=False)
+    else:
+        write_excel_chunks([df_results], output_file, decimals=DISCHARGE_DECIMALS)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(df_results[['site', 'date', 'dump', 'location', 'sensor', 'salt_mass_g', 'cf', 'discharge_m3s', 'error']].to_string(index=False))
+    print(f"{len(df_results)} dump files processed, {(df_results['error'] != '').sum()} failed. Results saved to {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
+import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+import yaml
 from select_saltwaves import select_saltwaves
+from project_utils import get_salt_dump_times
 
 # Specify the folder containing the .xlsx files to be processed
 # data_directory = r'H:\tire-toxin\data\EC\20241113\raw'  # Use raw string for Windows paths
@@ -7,64 +14,239 @@ data_directory = r'C:\Users\oconnorb\projects\tire-toxin\test_data'  # Use raw s
 
 # Determine the output directory as one level up from `raw`, renamed to `processed`
 output_directory = os.path.join(os.path.dirname(data_directory), 'processed')
-os.makedirs(output_directory, exist_ok=True)  # Ensure the output directory exists
 
-# Get list of all .xlsx files in the target directory, excluding files starting with '~'
-files = [f for f in os.listdir(data_directory) if f.endswith('.xlsx') and not f.startswith('~')]
+# Columns of the run log written in manifest mode (status: 'ok', 'partial', 'no_dumps' or 'failed')
+RUN_LOG_COLUMNS = ['entry', 'file', 'station', 'location', 'sensor', 'status', 'files_written', 'output_files', 'seconds', 'error']
 
-# Loop through all .xlsx files in the directory
-for file in files:
-    file_path = os.path.join(data_directory, file)
+def read_manifest(manifest_file):
+    """
+    Reads a batch manifest (CSV or YAML) into a list of entries.
+
+    Each entry names a raw EC file and how to cut it: 'file', 'station', 'location' (e.g. RL, RR, baseline),
+    and optionally 'sensor', 'date', 'initial_dump_number', 'windows' and 'auto'. In a CSV, windows are written
+    as 'start/end' pairs separated by ';' (e.g. '2024-11-04 10:20/2024-11-04 10:45; ...'); in YAML, as a list
+    of [start, end] pairs. Entries without windows are cut automatically from the recorded dump times when
+    'auto' is true. Relative file paths are resolved against the manifest's directory.
+
+    Parameters:
+    - manifest_file (Path or str): Manifest file (.csv, .yaml or .yml).
+
+    Returns:
+    - entries (list): One dict per entry with normalised fields.
+    """
+    manifest_file = Path(manifest_file)
+    if manifest_file.suffix.lower() in ('.yaml', '.yml'):
+        with open(manifest_file) as f:
+            records = yaml.safe_load(f) or []
+        if isinstance(records, dict):
+            records = records.get('files', [])
+    else:
+        records = pd.read_csv(manifest_file, dtype=str, keep_default_na=False).to_dict('records')
+
+    entries = []
+    for record in records:
+        record = {key.strip().lower(): value for key, value in record.items()}
+        windows = record.get('windows') or None
+        if isinstance(windows, str):
+            windows = [tuple(part.strip() for part in window.split('/')) for window in windows.split(';') if window.strip()]
+        file = Path(str(record['file']))
+        entries.append({
+            'file': str(file if file.is_absolute() else manifest_file.parent / file),
+            'station': str(record['station']).strip(),
+            'location': str(record['location']).strip(),
+            'sensor': str(record.get('sensor') or '').strip(),
+            'date': str(record.get('date') or '').strip(),
+            'initial_dump_number': int(record.get('initial_dump_number') or 1),
+            'windows': windows,
+            'auto': str(record.get('auto', '')).strip().lower() in ('y', 'yes', 'true', '1'),
+        })
+    return entries
+
+def process_manifest_entry(entry, output_directory, dump_times=None, min_confidence=0.5, copy_format=None):
+    """
+    Cuts one manifest entry without any UI. Runs in a worker process.
+
+    Returns:
+    - log (dict): One row of the run log (see RUN_LOG_COLUMNS).
+    """
+    log = {'file': entry['file'], 'station': entry['station'], 'location': entry['location'],
+           'sensor': entry['sensor'], 'status': 'ok', 'files_written': 0, 'output_files': '', 'error': ''}
+    start = time.perf_counter()
+    try:
+        if not entry['location'].lower().startswith('baseline') and entry['windows'] is None and dump_times is None:
+            raise ValueError("No dump windows given and automatic detection not requested.")
+        df_cuts = select_saltwaves(
+            entry['file'],
+            entry['station'],
+            entry['location'],
+            initial_dump_number=entry['initial_dump_number'],
+            date=entry['date'],
+            sensor_name=entry['sensor'],
+            output_directory=output_directory,
+            dump_times=dump_times,
+            min_confidence=min_confidence,
+            copy_format=copy_format,
+            windows=entry['windows']
+        )
+        output_files = df_cuts['output_file'].dropna().tolist()
+        log['files_written'] = len(output_files)
+        log['output_files'] = '; '.join(os.path.basename(file) for file in output_files)
+        if dump_times is not None and df_cuts.empty:
+            log['status'] = 'no_dumps'
+            log['error'] = ("No salt dump times recorded for this station." if not len(dump_times)
+                            else "No recorded salt dump time within the file's time range.")
+        elif len(output_files) < len(df_cuts):
+            log['status'] = 'partial'
+            log['error'] = f"{len(df_cuts) - len(output_files)} detected waves below the confidence threshold."
+    except Exception as e:
+        log['status'] = 'failed'
+        log['error'] = f"{type(e).__name__}: {e}"
+    log['seconds'] = round(time.perf_counter() - start, 2)
+    return log
+
+def run_manifest(manifest_file, output_directory, max_workers=None, min_confidence=0.5, copy_format=None):
+    """
+    Processes every manifest entry in a process pool and writes a run log to the output directory.
+
+    Returns:
+    - df_log (pd.DataFrame): The run log.
+    """
+    entries = read_manifest(manifest_file)
+    os.makedirs(output_directory, exist_ok=True)
+
+    # Recorded salt dump times are fetched once per station, before the workers start. A failed lookup (unknown
+    # station, sheet unreachable) only fails the entries of that station.
+    automatic = [entry['auto'] and entry['windows'] is None for entry in entries]
+    salt_dump_times, station_errors = {}, {}
+    for entry, auto in zip(entries, automatic):
+        station = entry['station']
+        if auto and station not in salt_dump_times and station not in station_errors:
+            try:
+                salt_dump_times[station] = get_salt_dump_times(station)
+            except Exception as e:
+                station_errors[station] = f"Salt dump times not available: {type(e).__name__}: {e}"
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            None if auto and entry['station'] in station_errors else
+            executor.submit(process_manifest_entry, entry, output_directory,
+                            salt_dump_times.get(entry['station']) if auto else None, min_confidence, copy_format)
+            for entry, auto in zip(entries, automatic)
+        ]
+        logs = []
+        for entry_idx, (entry, future) in enumerate(zip(entries, futures), start=1):
+            if future is None:
+                log = {'file': entry['file'], 'station': entry['station'], 'location': entry['location'],
+                       'sensor': entry['sensor'], 'status': 'failed', 'files_written': 0, 'output_files': '',
+                       'seconds': 0.0, 'error': station_errors[entry['station']]}
+            else:
+                log = future.result()
+            logs.append(dict(log, entry=entry_idx))
+
+    df_log = pd.DataFrame(logs, columns=RUN_LOG_COLUMNS)
+    log_file = os.path.join(output_directory, f"run_log_{pd.Timestamp.now():%Y%m%d_%H%M%S}.csv")
+    df_log.to_csv(log_file, index=False)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(df_log[['entry', 'file', 'location', 'status', 'files_written', 'error']].to_string(index=False))
+    print(f"{len(df_log)} entries processed, {int(df_log['files_written'].sum())} files written, "
+          f"{(df_log['status'] == 'failed').sum()} failed, {(df_log['status'] == 'no_dumps').sum()} without dumps. "
+          f"Run log saved to {log_file}")
+    return df_log
+
+def run_interactive(data_directory, output_directory):
+    """Prompts for every file and cuts the salt waves on the plot (or from the recorded dump times)."""
+    os.makedirs(output_directory, exist_ok=True)  # Ensure the output directory exists
+
+    # Get list of all .xlsx files in the target directory, excluding files starting with '~'
+    files = [f for f in os.listdir(data_directory) if f.endswith('.xlsx') and not f.startswith('~')]
+
+    # Recorded salt dump times per station (fetched once per station)
+    salt_dump_times = {}
+
+    # Loop through all .xlsx files in the directory
+    for file in files:
+        file_path = os.path.join(data_directory, file)
     
-    # Prompt user whether to process the file
-    process_file = input(f"Would you like to process the file {file}? (y/n): ").strip().lower()
+        # Prompt user whether to process the file
+        process_file = input(f"Would you like to process the file {file}? (y/n): ").strip().lower()
     
-    if process_file == 'y':  # Proceed with processing
-        # Prompt for station name
-        stn = input(f"Enter station name for {file}: ").strip()
+        if process_file == 'y':  # Proceed with processing
+            # Prompt for station name
+            stn = input(f"Enter station name for {file}: ").strip()
         
-        # Prompt for sensor location
-        sensor_location = input(f"Enter sensor location for {file} (e.g., RR, RL, baseline): ").strip()
+            # Prompt for sensor location
+            sensor_location = input(f"Enter sensor location for {file} (e.g., RR, RL, baseline): ").strip()
         
-        if sensor_location.lower() == 'baseline':
-            # Prompt for date, leave blank for automatic detection
-            date = input(f"Enter date for {file} (leave blank for automatic detection): ").strip()
+            if sensor_location.lower() == 'baseline':
+                # Prompt for date, leave blank for automatic detection
+                date = input(f"Enter date for {file} (leave blank for automatic detection): ").strip()
             
-            # Prompt for sensor name, leave blank for automatic detection
-            sensor_name = input(f"Enter sensor name for {file} (leave blank for automatic detection): ").strip()
+                # Prompt for sensor name, leave blank for automatic detection
+                sensor_name = input(f"Enter sensor name for {file} (leave blank for automatic detection): ").strip()
             
-            # Call the base function for baseline processing
-            select_saltwaves(
-                file_path, 
-                stn, 
-                sensor_location, 
-                date=date, 
-                sensor_name=sensor_name, 
-                output_directory=output_directory
-            )
-            print(f"Baseline file {file} processed and saved.")
+                # Call the base function for baseline processing
+                select_saltwaves(
+                    file_path, 
+                    stn, 
+                    sensor_location, 
+                    date=date, 
+                    sensor_name=sensor_name, 
+                    output_directory=output_directory
+                )
+                print(f"Baseline file {file} processed and saved.")
         
-        else:
-            # Prompt for initial dump number
-            initial_dump_number = input(f"Enter initial dump number for {file} (default 1): ")
-            initial_dump_number = int(initial_dump_number) if initial_dump_number else 1
+            else:
+                # Prompt for initial dump number
+                initial_dump_number = input(f"Enter initial dump number for {file} (default 1): ")
+                initial_dump_number = int(initial_dump_number) if initial_dump_number else 1
             
-            # Prompt for date, leave blank for automatic detection
-            date = input(f"Enter date for {file} (leave blank for automatic detection): ").strip()
+                # Prompt for date, leave blank for automatic detection
+                date = input(f"Enter date for {file} (leave blank for automatic detection): ").strip()
             
-            # Prompt for sensor name, leave blank for automatic detection
-            sensor_name = input(f"Enter sensor name for {file} (leave blank for automatic detection): ").strip()
+                # Prompt for sensor name, leave blank for automatic detection
+                sensor_name = input(f"Enter sensor name for {file} (leave blank for automatic detection): ").strip()
+
+                # Prompt for automatic wave detection from the recorded salt dump times
+                dump_times = None
+                auto_detect = input(f"Detect salt waves in {file} from the recorded dump times? (y/n): ").strip().lower()
+                if auto_detect == 'y':
+                    if stn not in salt_dump_times:
+                        salt_dump_times[stn] = get_salt_dump_times(stn)
+                    dump_times = salt_dump_times[stn]
             
-            # Call the base function for interactive selection
-            select_saltwaves(
-                file_path, 
-                stn, 
-                sensor_location, 
-                initial_dump_number=initial_dump_number, 
-                date=date, 
-                sensor_name=sensor_name, 
-                output_directory=output_directory
-            )
-            print(f"File {file} processed and saved.")
+                # Call the base function for interactive (or automatic) selection
+                select_saltwaves(
+                    file_path, 
+                    stn, 
+                    sensor_location, 
+                    initial_dump_number=initial_dump_number, 
+                    date=date, 
+                    sensor_name=sensor_name, 
+                    output_directory=output_directory,
+                    dump_times=dump_times
+                )
+                print(f"File {file} processed and saved.")
+        else:
+            print(f"Skipping {file}.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut salt waves from raw EC files, interactively or from a manifest.")
+    parser.add_argument('--manifest', default=None, help="CSV or YAML manifest for an unattended run (see read_manifest).")
+    parser.add_argument('--data-directory', default=data_directory, help="Folder of raw .xlsx files (interactive mode).")
+    parser.add_argument('--output-directory', default=None, help="Folder for the cut files and the run log.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes (manifest mode).")
+    parser.add_argument('--min-confidence', type=float, default=0.5, help="Lowest confidence of automatically detected waves.")
+    parser.add_argument('--copy-format', choices=['parquet', 'csv'], default=None, help="Also write a compact copy of every cut file.")
+    args = parser.parse_args()
+
+    if args.manifest:
+        manifest_output_directory = args.output_directory or os.path.join(os.path.dirname(os.path.abspath(args.manifest)), 'processed')
+        run_manifest(args.manifest, manifest_output_directory, max_workers=args.workers,
+                     min_confidence=args.min_confidence, copy_format=args.copy_format)
     else:
-        print(f"Skipping {file}.")
+        interactive_output_directory = args.output_directory or os.path.join(os.path.dirname(args.data_directory), 'processed')
+        run_interactive(args.data_directory, interactive_output_directory)
+
+if __name__ == "__main__":
+    main()
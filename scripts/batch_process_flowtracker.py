@@ -0,0 +1,41 @@
+import argparse
+import os
+from pathlib import Path
+import pandas as pd
+from flowtracker import (FLOWTRACKER_DIRECTORY, compare_with_salt_dilution, find_flowtracker_exports,
+                         ingest_flowtracker_exports, summarize_flowtracker_visits)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parses every FlowTracker export into one station table, optionally compared with salt dilution results.")
+    parser.add_argument('directory', nargs='?', default=FLOWTRACKER_DIRECTORY, help="Directory of FlowTracker exports (searched recursively).")
+    parser.add_argument('--output', default=None, help="Station table (.parquet). Defaults to flowtracker_stations.parquet in the directory.")
+    parser.add_argument('--discharge-results', default=None, help="Salt dilution results (.xlsx or .csv, see batch_calculate_discharge.py) to compare with.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    args = parser.parse_args()
+
+    files = find_flowtracker_exports(args.directory)
+    if not files:
+        print(f"No FlowTracker exports found in {args.directory}.")
+        return
+
+    output_file = Path(args.output) if args.output else Path(args.directory) / "flowtracker_stations.parquet"
+    df_flowtracker, errors = ingest_flowtracker_exports(files, output_file=output_file, max_workers=args.workers)
+    for file, error in errors.items():
+        print(f"{os.path.basename(file)}: {error}")
+
+    df_visits = summarize_flowtracker_visits(df_flowtracker)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(df_visits.to_string(index=False))
+    print(f"{len(df_visits)} measurements ({len(df_flowtracker)} stations) from {len(files)} files, {len(errors)} failed. Saved to {output_file}")
+
+    if args.discharge_results:
+        results_file = Path(args.discharge_results)
+        read = pd.read_csv if results_file.suffix.lower() == '.csv' else pd.read_excel
+        df_results = read(results_file, dtype={'date': str})
+        df_comparison = compare_with_salt_dilution(df_results[df_results['error'].fillna('') == ''], df_visits)
+        comparison_file = output_file.with_name("flowtracker_comparison.csv")
+        df_comparison.to_csv(comparison_file, index=False)
+        print(f"{len(df_comparison)} dumps matched with a FlowTracker measurement. Saved to {comparison_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+from project_utils import (
+    iter_stage_file,
+    autodetect_stage_site,
+    ingest_stage_chunks,
+    get_baro_grid,
+)
+
+# Default folder containing the raw HOBO stage downloads (searched recursively)
+STAGE_RAW_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Stage\raw")
+
+def find_stage_files(raw_directory):
+    """
+    Scans the raw stage tree and groups the HOBO exports by auto-detected site.
+
+    Parameters:
+    - raw_directory (Path or str): Root of the raw stage tree.
+
+    Returns:
+    - files_by_site (dict): Site name -> sorted list of file paths.
+    - unmatched_files (list): Files whose site could not be detected.
+    """
+    files_by_site = defaultdict(list)
+    unmatched_files = []
+    for file in sorted(Path(raw_directory).rglob("*.xlsx")):
+        if file.name.startswith('~'):
+            continue
+        site_name = autodetect_stage_site(file)
+        if site_name is None:
+            unmatched_files.append(file)
+        else:
+            files_by_site[site_name].append(file)
+    return dict(files_by_site), unmatched_files
+
+def ingest_site(site_name, files, baro_grid=None, stats_flag=True, dry_run=False):
+    """
+    Ingests every raw file of one site in order. Runs in a worker process.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - files (list): Raw files of the site.
+    - baro_grid (dict): Gridded barometric series shared by the batch (None for BT sites).
+    - stats_flag (bool): Whether statistic columns should be used when available.
+    - dry_run (bool): Process the files without writing to the stage store.
+
+    Returns:
+    - results (list): One summary dict per file.
+    """
+    results = []
+    for file in files:
+        result = {'site': site_name, 'file': file.name, 'rows_added': 0, 'baro_corrected': 0,
+                  'baro_failed': 0, 'partitions_written': 0, 'error': ''}
+        try:
+            # Stream the file chunk by chunk so memory stays flat for long downloads
+            chunks = iter_stage_file(file, stats_flag=stats_flag)
+            summary = ingest_stage_chunks(site_name, chunks, baro_grid=baro_grid, dry_run=dry_run)
+            result['partitions_written'] = len(summary['written_partitions'])
+            result['rows_added'] = summary['new_rows']
+            result['baro_corrected'] = summary['corrected_baro_count']
+            result['baro_failed'] = summary['failed_baro_count']
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        results.append(result)
+    return results
+
+def run_sites(files_by_site, baro_by_site, stats_flag, dry_run, max_workers):
+    """Ingests independent sites in a process pool and returns the per-file results."""
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(ingest_site, site_name, files, baro_by_site.get(site_name), stats_flag, dry_run)
+            for site_name, files in files_by_site.items()
+        ]
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch ingest of raw HOBO stage files into the stage store.")
+    parser.add_argument('raw_directory', nargs='?', default=STAGE_RAW_DIRECTORY, help="Root of the raw stage tree.")
+    parser.add_argument('--no-stats', action='store_true', help="Ignore statistic columns in BT files.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--dry-run', action='store_true', help="Process files without writing to the stage store.")
+    args = parser.parse_args()
+
+    files_by_site, unmatched_files = find_stage_files(args.raw_directory)
+    for file in unmatched_files:
+        print(f"Skipping {file}: site could not be detected.")
+
+    # BT sites first, since they provide the barometric data for the other sites
+    bt_sites = {site: files for site, files in files_by_site.items() if 'BT' in site}
+    other_sites = {site: files for site, files in files_by_site.items() if 'BT' not in site}
+
+    results = run_sites(bt_sites, {}, not args.no_stats, args.dry_run, args.workers)
+
+    # Build each shared baro grid once for the whole batch (sites with the same BT sources share a grid)
+    baro_by_site = {}
+    for site_name in other_sites:
+        baro_by_site[site_name] = get_baro_grid(site_name)
+        if baro_by_site[site_name] is None:
+            print(f"No barometric record found for {site_name}, skipping barometric pressure correction.")
+
+    results += run_sites(other_sites, baro_by_site, not args.no_stats, args.dry_run, args.workers)
+
+    # Per-file summary
+    df_results = pd.DataFrame(results, columns=['site', 'file', 'rows_added', 'baro_corrected',
+                                                'baro_failed', 'partitions_written', 'error'])
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(df_results.to_string(index=False))
+    print(f"{len(df_results)} files processed, {int(df_results['rows_added'].sum())} rows added, "
+          f"{(df_results['error'] != '').sum()} files failed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.styles import Font, Side, Border
+from project_utils import save_formatted_stage_file, DEFAULT_DECIMALS
+
+# Number of rows of synthetic 1-minute stage data to benchmark
+row_counts = [10_000, 50_000, 200_000]
+
+def save_formatted_stage_file_openpyxl(df_corrected, output_file, sheet_name='Sheet1', decimals=None):
+    """Previous openpyxl implementation of save_formatted_stage_file, kept as the benchmark baseline."""
+    if decimals is None:
+        decimals = DEFAULT_DECIMALS
+
+    df_corrected_reset = df_corrected.reset_index()
+    df_corrected_reset.rename(columns={'index': 'Datetime'}, inplace=True)
+
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = sheet_name
+
+    for r_idx, row in enumerate(dataframe_to_rows(df_corrected_reset, index=False, header=True), start=1):
+        worksheet.append(row)
+        if r_idx == 1:
+            for cell in worksheet[r_idx]:
+                cell.font = Font(bold=True)
+
+    for cell in worksheet[1]:
+        cell.border = Border(left=Side(border_style=None), right=Side(border_style=None),
+                             top=Side(border_style=None), bottom=Side(border_style=None))
+
+    for col_idx, col in enumerate(worksheet.columns, start=1):
+        max_length = 0
+        column = col[0].column_letter
+        column_name = worksheet.cell(row=1, column=col_idx).value
+        for cell in col:
+            if cell.value is not None:
+                max_length = max(max_length, len(str(cell.value)))
+        worksheet.column_dimensions[column].width = max_length + 2
+        if column_name in decimals:
+            number_format = f"0.{'0' * decimals[column_name]}"
+            for cell in worksheet.iter_cols(min_col=col_idx, max_col=col_idx, min_row=2):
+                for data_cell in cell:
+                    if isinstance(data_cell.value, (int, float)):
+                        data_cell.number_format = number_format
+
+    workbook.save(output_file)
+
+def make_stage_frame(n_rows):
+    """Builds a synthetic master stage frame with n_rows 1-minute records."""
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2024-01-01', periods=n_rows, freq='1min', name='Datetime')
+    df = pd.DataFrame({
+        'Differential Pressure (kPa)': rng.normal(5, 0.5, n_rows),
+        'Absolute Pressure (kPa)': rng.normal(106, 0.5, n_rows),
+        'Temperature (°C)': rng.normal(8, 2, n_rows),
+        'Barometric Pressure (kPa)': rng.normal(101, 0.3, n_rows),
+        'Water Level (m)': rng.normal(0.5, 0.05, n_rows),
+    }, index=index)
+    df.iloc[::97, 0] = np.nan
+    return df
+
+def run(writer, df, output_file):
+    """Runs one writer and returns (seconds, peak traced memory in MB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    writer(df, output_file)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_directory:
+        print(f"{'rows':>8} | {'openpyxl (s)':>12} {'peak (MB)':>10} | {'streaming (s)':>13} {'peak (MB)':>10}")
+        for n_rows in row_counts:
+            df = make_stage_frame(n_rows)
+            old_file = os.path.join(temp_directory, f"openpyxl_{n_rows}.xlsx")
+            new_file = os.path.join(temp_directory, f"streaming_{n_rows}.xlsx")
+
+            old_time, old_peak = run(save_formatted_stage_file_openpyxl, df, old_file)
+            new_time, new_peak = run(save_formatted_stage_file, df, new_file)
+            print(f"{n_rows:>8} | {old_time:>12.2f} {old_peak:>10.1f} | {new_time:>13.2f} {new_peak:>10.1f}")
+
+            # Check both files hold the same values
+            df_old = pd.read_excel(old_file, index_col=0)
+            df_new = pd.read_excel(new_file, index_col=0)
+            if not np.allclose(df_old.to_numpy(dtype=float), df_new.to_numpy(dtype=float), equal_nan=True) or not (df_old.index == df_new.index).all():
+                print(f"Warning: output of the two writers differs for {n_rows} rows.")
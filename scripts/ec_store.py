@@ -0,0 +1,329 @@
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from project_utils import iter_ec_file, sniff_ec_file
+from partition_store import PARTITION_ROW_GROUP_SIZE, clear_partition_index_cache, read_partition_range, store_lock
+
+# Root directory of the columnar EC store (one sub-directory per record, one Parquet file per month)
+EC_STORE_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Manual_salt\EC\processed\store")
+
+# Datetime column of the stored EC records
+EC_TIME_COLUMN = 'DT'
+
+# Columns of the file manifest (one row per ingested raw file)
+EC_MANIFEST_COLUMNS = ['path', 'size', 'mtime', 'sha256', 'start', 'end', 'rows', 'ingested_at']
+
+def _record_directory(record_name, root=None):
+    """Returns the partition directory for a record."""
+    return Path(root if root is not None else EC_STORE_DIRECTORY) / record_name
+
+def _partition_path(record_name, month, root=None):
+    """Returns the Parquet file path for a record and month ('YYYY-MM')."""
+    return _record_directory(record_name, root) / f"{month}.parquet"
+
+def _manifest_path(record_name, root=None):
+    """Returns the file manifest path of a record."""
+    return _record_directory(record_name, root) / "manifest.csv"
+
+def _spool_directory(record_name, root=None):
+    """Returns the directory where exports are staged by month before they are merged into a record."""
+    return _record_directory(record_name, root) / ".spool"
+
+def ec_record_lock(record_name, root=None, timeout=600, poll_interval=0.5):
+    """Holds the store lock on a record's partitions so concurrent writers are serialized, see partition_store.store_lock."""
+    return store_lock(_record_directory(record_name, root), timeout=timeout, poll_interval=poll_interval)
+
+def list_ec_records(root=None):
+    """Lists the records of the EC store (directories holding at least one monthly partition)."""
+    root = Path(root if root is not None else EC_STORE_DIRECTORY)
+    if not root.exists():
+        return []
+    return sorted(directory.name for directory in root.iterdir() if directory.is_dir() and any(directory.glob("*.parquet")))
+
+def list_ec_partitions(record_name, root=None):
+    """
+    Lists the monthly partitions stored for an EC record.
+
+    Parameters:
+    - record_name (str): EC record name (e.g. 'northfield_longterm').
+    - root (Path or str): Store root directory. Defaults to EC_STORE_DIRECTORY.
+
+    Returns:
+    - partitions (list): Sorted list of month keys ('YYYY-MM') present in the store.
+    """
+    record_directory = _record_directory(record_name, root)
+    if not record_directory.exists():
+        return []
+    return sorted(path.stem for path in record_directory.glob("*.parquet"))
+
+def read_ec_manifest(record_name, root=None):
+    """
+    Reads the manifest of raw files ingested into an EC record.
+
+    Returns:
+    - df_manifest (pd.DataFrame): One row per ingested file (see EC_MANIFEST_COLUMNS), empty if none.
+    """
+    manifest_path = _manifest_path(record_name, root)
+    if not manifest_path.exists():
+        return pd.DataFrame(columns=EC_MANIFEST_COLUMNS)
+    return pd.read_csv(manifest_path, parse_dates=['start', 'end', 'ingested_at'])
+
+def _write_manifest(df_manifest, record_name, root=None):
+    """Writes the manifest atomically (temporary file + rename)."""
+    manifest_path = _manifest_path(record_name, root)
+    os.makedirs(manifest_path.parent, exist_ok=True)
+    temp_path = manifest_path.with_suffix('.csv.tmp')
+    df_manifest[EC_MANIFEST_COLUMNS].to_csv(temp_path, index=False)
+    os.replace(temp_path, manifest_path)
+
+def file_sha256(file, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def spool_ec_export(file, spool_directory, columns=None, chunk_size=50000, spool_name=None):
+    """
+    Reads one raw EC export chunk by chunk into monthly Parquet parts of a spool directory. Runs in a worker process.
+
+    Only one chunk of the file is held in memory at a time; each chunk is split by month and written as
+    {month}_{n}.parquet, sorted on DT, in a sub-directory of its own.
+
+    Parameters:
+    - file (Path or str): Raw EC export (.xlsx), any layout recognised by project_utils.sniff_ec_file.
+    - spool_directory (Path or str): Directory of the parts.
+    - columns (list): Columns to keep besides the datetime column. None keeps every column.
+    - chunk_size (int): Number of rows read at a time.
+    - spool_name (str): Name of the file's sub-directory, unique per file of an ingest. Defaults to the content hash.
+
+    Returns:
+    - spooled (dict): sha256 (content hash), start and end (first and last DT), rows (rows with a timestamp)
+                      and parts (list of (month, part path) in file order).
+    """
+    sha256 = file_sha256(file)
+    file_directory = Path(spool_directory) / (spool_name if spool_name is not None else sha256)
+    shutil.rmtree(file_directory, ignore_errors=True)
+    os.makedirs(file_directory)
+
+    layout = sniff_ec_file(file)
+    read_columns = None if columns is None else [layout['dt_col']] + [col for col in columns if col != EC_TIME_COLUMN]
+    spooled = {'sha256': sha256, 'start': pd.NaT, 'end': pd.NaT, 'rows': 0, 'parts': []}
+    for df_chunk in iter_ec_file(file, columns=read_columns, dt_col=layout['dt_col'], chunk_size=chunk_size,
+                                 header_row=layout['header_row']):
+        df_chunk = df_chunk.rename(columns={layout['dt_col']: EC_TIME_COLUMN})
+        df_chunk = df_chunk[df_chunk[EC_TIME_COLUMN].notna()]
+        if df_chunk.empty:
+            continue
+        spooled['start'] = min(spooled['start'], df_chunk[EC_TIME_COLUMN].min()) if spooled['rows'] else df_chunk[EC_TIME_COLUMN].min()
+        spooled['end'] = max(spooled['end'], df_chunk[EC_TIME_COLUMN].max()) if spooled['rows'] else df_chunk[EC_TIME_COLUMN].max()
+        spooled['rows'] += len(df_chunk)
+        for month, df_month in df_chunk.groupby(df_chunk[EC_TIME_COLUMN].dt.strftime('%Y-%m')):
+            part_path = file_directory / f"{month}_{len(spooled['parts']):05d}.parquet"
+            df_month = df_month.sort_values(EC_TIME_COLUMN, kind='stable')
+            pq.write_table(pa.Table.from_pandas(df_month, preserve_index=False), part_path)
+            spooled['parts'].append((month, str(part_path)))
+    return spooled
+
+def _read_partition(path, columns=None):
+    """Reads one monthly partition."""
+    read_columns = None if columns is None else [EC_TIME_COLUMN] + [col for col in columns if col != EC_TIME_COLUMN]
+    return pq.read_table(path, columns=read_columns).to_pandas()
+
+def _write_partition(df, path):
+    """Writes one monthly partition atomically (temporary file + rename)."""
+    os.makedirs(path.parent, exist_ok=True)
+    temp_path = path.with_suffix('.parquet.tmp')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temp_path, row_group_size=PARTITION_ROW_GROUP_SIZE)
+    os.replace(temp_path, path)
+    clear_partition_index_cache(path)
+
+def append_ec_data(record_name, df, root=None):
+    """
+    Merges EC data into the store, rewriting only the monthly partitions whose content changes.
+
+    New and stored rows are merged in DT order; where a timestamp exists in both, the stored row is kept
+    (overlapping downloads repeat the same readings). Columns missing on either side are filled with NaN.
+
+    Parameters:
+    - record_name (str): EC record name.
+    - df (pd.DataFrame): EC data with a DT column.
+    - root (Path or str): Store root directory. Defaults to EC_STORE_DIRECTORY.
+
+    Returns:
+    - written_partitions (list): Month keys ('YYYY-MM') of the partitions that were written.
+    """
+    df = df[df[EC_TIME_COLUMN].notna()]
+    if df.empty:
+        return []
+
+    written_partitions = []
+    months = df[EC_TIME_COLUMN].dt.strftime('%Y-%m')
+    with ec_record_lock(record_name, root):
+        for month, df_month in df.groupby(months):
+            path = _partition_path(record_name, month, root)
+            df_existing = _read_partition(path) if path.exists() else None
+            if df_existing is not None:
+                df_month = pd.concat([df_existing, df_month], ignore_index=True)
+            # Stable sort keeps stored rows first among equal timestamps
+            df_month = df_month.sort_values(EC_TIME_COLUMN, kind='stable')
+            df_month = df_month[~df_month[EC_TIME_COLUMN].duplicated(keep='first')].reset_index(drop=True)
+            if df_existing is not None and df_month.equals(df_existing):
+                continue
+            _write_partition(df_month, path)
+            written_partitions.append(month)
+
+    return written_partitions
+
+def read_ec_data(record_name, start=None, end=None, columns=None, root=None):
+    """
+    Reads EC data for a record, opening only the monthly partitions and row groups that overlap the requested range.
+
+    Parameters:
+    - record_name (str): EC record name.
+    - start, end (str or pd.Timestamp): Inclusive time range. None reads from the first / to the last record.
+    - columns (list): Columns to read besides DT. None reads every stored column.
+    - root (Path or str): Store root directory. Defaults to EC_STORE_DIRECTORY.
+
+    Returns:
+    - df (pd.DataFrame): EC data sorted on DT (empty if nothing is stored).
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    partitions = list_ec_partitions(record_name, root)
+    if start is not None:
+        partitions = [month for month in partitions if month >= start.strftime('%Y-%m')]
+    if end is not None:
+        partitions = [month for month in partitions if month <= end.strftime('%Y-%m')]
+    tables = [read_partition_range(_partition_path(record_name, month, root), start, end, columns, EC_TIME_COLUMN)
+              for month in partitions]
+    tables = [table for table in tables if table is not None]
+    if not tables:
+        empty_columns = [col for col in (columns or []) if col != EC_TIME_COLUMN]
+        return pd.DataFrame({EC_TIME_COLUMN: pd.Series(dtype='datetime64[ns]'),
+                             **{col: pd.Series(dtype='float64') for col in empty_columns}})
+
+    # Files with different columns may have filled different months, missing columns come back as NaN
+    df = pa.concat_tables(tables, promote_options='default').to_pandas()
+    if columns is not None:
+        df = df.reindex(columns=[EC_TIME_COLUMN] + [col for col in columns if col != EC_TIME_COLUMN])
+    return df
+
+def iter_ec_partitions(record_name, columns=None, root=None):
+    """
+    Yields the record one monthly partition at a time, in time order, so exports keep memory flat.
+
+    Parameters:
+    - record_name (str): EC record name.
+    - columns (list): Columns to read besides DT. None reads every stored column.
+    - root (Path or str): Store root directory. Defaults to EC_STORE_DIRECTORY.
+    """
+    for month in list_ec_partitions(record_name, root):
+        yield _read_partition(_partition_path(record_name, month, root), columns)
+
+def find_new_ec_files(record_name, files, root=None):
+    """
+    Compares raw files against the record's manifest.
+
+    Files whose size and modification time match a manifest entry are skipped without reading them.
+    Changed or unknown files are hashed, and those whose content is already in the manifest are skipped.
+    Copies of the same content among the candidates (e.g. a re-download into another folder) are ingested once.
+
+    Parameters:
+    - record_name (str): EC record name.
+    - files (list): Candidate raw files.
+    - root (Path or str): Store root directory. Defaults to EC_STORE_DIRECTORY.
+
+    Returns:
+    - new_files (list): Files to ingest.
+    - duplicates (dict): Further copies of a new file's content, mapped to the file in new_files they repeat.
+    """
+    df_manifest = read_ec_manifest(record_name, root)
+    known_stats = set(zip(df_manifest['path'].astype(str), df_manifest['size'].astype('int64'), df_manifest['mtime'].astype('float64')))
+    known_hashes = set(df_manifest['sha256'].astype(str))
+
+    new_files = []
+    duplicates = {}
+    new_hashes = {}
+    for file in files:
+        stat = os.stat(file)
+        if (str(Path(file)), stat.st_size, float(stat.st_mtime)) in known_stats:
+            continue
+        sha256 = file_sha256(file)
+        if sha256 in known_hashes:
+            continue
+        if sha256 in new_hashes:
+            duplicates[file] = new_hashes[sha256]
+            continue
+        new_hashes[sha256] = file
+        new_files.append(file)
+    return new_files, duplicates
+
+def ingest_ec_files(record_name, files, root=None, columns=None, max_workers=None):
+    """
+    Incrementally ingests raw EC exports into a record of the EC store.
+
+    Only files not yet in the manifest are read. Workers stream each file chunk by chunk into monthly parts
+    on disk (see spool_ec_export); the parts are then merged into the monthly partitions one file and one month
+    at a time, in order of each file's first timestamp, so memory is bounded by a month of one file rather than
+    by the size of the downloads. The manifest records each file's path, size, modification time, content hash
+    and time range; copies of a file's content are ingested once and recorded with the copy that was read.
+
+    Parameters:
+    - record_name (str): EC record name.
+    - files (list): Raw EC exports (.xlsx).
+    - root (Path or str): Store root directory. Defaults to EC_STORE_DIRECTORY.
+    - columns (list): Columns to keep besides DT. None keeps every column.
+    - max_workers (int): Number of worker processes. None uses the number of CPUs.
+
+    Returns:
+    - df_ingested (pd.DataFrame): Manifest rows of the files ingested by this call.
+    - written_partitions (list): Month keys ('YYYY-MM') of the partitions that were written.
+    """
+    new_files, duplicates = find_new_ec_files(record_name, [Path(file) for file in files], root)
+    if not new_files:
+        return pd.DataFrame(columns=EC_MANIFEST_COLUMNS), []
+
+    spool_directory = _spool_directory(record_name, root)
+    written_partitions = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Each file spools into its own sub-directory, named by its position in new_files
+            futures = [executor.submit(spool_ec_export, file, spool_directory, columns, spool_name=f"{i:05d}")
+                       for i, file in enumerate(new_files)]
+            results = [future.result() for future in futures]
+
+        # Merge the new files in order of their first timestamp (stored rows win on repeated timestamps)
+        order = sorted(range(len(new_files)), key=lambda i: (results[i]['rows'] == 0, results[i]['start']))
+        for i in order:
+            months = {}
+            for month, part_path in results[i]['parts']:
+                months.setdefault(month, []).append(part_path)
+            for month, part_paths in sorted(months.items()):
+                df_month = pd.concat([pq.read_table(path).to_pandas() for path in part_paths], ignore_index=True)
+                for written in append_ec_data(record_name, df_month.sort_values(EC_TIME_COLUMN, kind='stable'), root):
+                    if written not in written_partitions:
+                        written_partitions.append(written)
+    finally:
+        shutil.rmtree(spool_directory, ignore_errors=True)
+
+    ingested_at = pd.Timestamp.now().floor('s')
+    spooled_by_file = dict(zip(new_files, results))
+    spooled_by_file.update({file: spooled_by_file[original] for file, original in duplicates.items()})
+    df_ingested = pd.DataFrame([{
+        'path': str(file), 'size': os.stat(file).st_size, 'mtime': float(os.stat(file).st_mtime),
+        'sha256': spooled['sha256'], 'start': spooled['start'], 'end': spooled['end'], 'rows': spooled['rows'],
+        'ingested_at': ingested_at,
+    } for file, spooled in spooled_by_file.items()], columns=EC_MANIFEST_COLUMNS)
+
+    df_manifest = read_ec_manifest(record_name, root)
+    df_manifest = df_manifest[~df_manifest['path'].astype(str).isin(df_ingested['path'])]
+    _write_manifest(pd.concat([df_manifest, df_ingested], ignore_index=True) if len(df_manifest) else df_ingested, record_name, root)
+    return df_ingested, written_partitions
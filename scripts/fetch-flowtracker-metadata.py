@@ -1,78 +1,109 @@
+import argparse
 import os
-import gspread
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from config import credentials
+from field_forms import exported_submission_ids, load_field_forms, photo_links
 
 # Define the base directory for metadata files
 base_directory = "H:/tire-toxin/data/Discharge/Flowtracker/metadata/"
 
-# List all existing metadata files 
-existing_files = []
-for root, dirs, files in os.walk(base_directory):
-    existing_files.extend(files)
+# FlowTracker columns of the field forms and their names in the metadata file
+FT_COLUMNS = {
+    'Flow_Tracker_Details.Start_Time': 'Start Time',
+    'Flow_Tracker_Details.End_Time': 'End Time',
+    'Flow_Tracker_Details.Initial_Stage__Staff_Gauge_': 'Initial Staff Gauge',
+    'Flow_Tracker_Details.End_Stage__Staff_Gauge_': 'End Staff Gauge',
+    'Flow_Tracker_Details.Initial_Stage__Pressure_Transducer_': 'Initial PT Sensor',
+    'Flow_Tracker_Details.End_Stage__Pressure_Transducer_': 'End PT Sensor',
+    'Flow_Tracker_Details.Initial_Point__Right_Bank_Tie_Point_': 'Right Bank Tie Point',
+    'Flow_Tracker_Details.Initial_Point__Right_Bank_Tape_Reading_': 'Right Bank Tape Reading',
+    'Flow_Tracker_Details.Initial_Point__Right_Bank_Tie_Point__Photo': 'Right Bank Tie Point Photo',
+    'Flow_Tracker_Details.End_Point__Left_Bank__Tape_Reading': 'Left Bank Tape Reading',
+    'Flow_Tracker_Details.Other': 'Other',
+}
 
-# Connect to Google Sheets
-gc = gspread.service_account_from_dict(credentials)
+def extract_visit(submissionid, df_submission):
+    """Collects the metadata of one FlowTracker visit (values are the same across all rows of a submission)."""
+    time = df_submission['Arrival_Time_to_Site'].iloc[0]
 
-# Open the Google Sheet by URL
-sheet_url = "https://docs.google.com/spreadsheets/d/1JLbDJq4qAfAyzEpOuxYYjhfXd4FxvotUc8JaBCsSdKE/edit?gid=748389405"
-sh = gc.open_by_url(sheet_url)
+    # Rows with at least one FlowTracker detail, without duplicates
+    df_ft = df_submission.reindex(columns=list(FT_COLUMNS)).fillna('').astype(str)
+    df_ft = df_ft[df_ft.apply(lambda col: col.str.strip() != '').any(axis=1)]
+    df_ft = df_ft.rename(columns=FT_COLUMNS).drop_duplicates()
 
-# Loop through all worksheets
-for ws in sh.worksheets():
-    # Read worksheet into DataFrame
-    df_ws = pd.DataFrame(ws.get_all_records())
-    
-    # Loop through unique 'submissionid' in df_ws
-    for submissionid in df_ws['submissionid'].unique():
+    return {
+        'submissionid': str(submissionid),
+        'site': df_submission['Site_Name'].iloc[0],
+        'time': time,
+        'date_str': pd.to_datetime(time, errors='coerce').strftime('%Y%m%d'),
+        'weather': df_submission['Weather_Context'].iloc[0],
+        'visit_notes': df_submission['Notes'].iloc[0],
+        'df_ft': df_ft,
+        'photo_links': photo_links(df_submission),
+    }
 
-        # Check if submissioncontains flowtracker
-        if not (df_ws.loc[df_ws['submissionid'] == submissionid, 'Flow_Tracker'].str.lower() == 'yes').any():
-            print(f"Submission {submissionid} has no flowtracker. Skipping.")
-            continue  # Skip this submission
+def write_visit_metadata(visit, column_width=20):
+    """Writes the metadata workbook of one visit and returns its path. Runs in a worker thread."""
+    output_directory = os.path.join(base_directory, visit['site'])
+    os.makedirs(output_directory, exist_ok=True)
+    output_file = os.path.join(output_directory, f"{visit['site']}_{visit['date_str']}_metadata_{visit['submissionid']}.xlsx")
+
+    with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
+        # Write 'submissionid' to A1 and the actual submissionid to B1
+        metadata = pd.DataFrame({
+            'A': ['submissionid:', 'Date:', 'Location:', 'Weather:', 'Visit Notes:', 'Photo Links:'],
+            'B': [visit['submissionid'], visit['time'], visit['site'], visit['weather'], visit['visit_notes'], None]  # Photo links are written as URLs below
+        })
+        metadata.to_excel(writer, sheet_name='Metadata', startrow=0, index=False, header=False)
+
+        # Write the FlowTracker details starting from row 8
+        visit['df_ft'].to_excel(writer, sheet_name='Metadata', startrow=7, index=False)
+
+        # Write photo links to separate columns in the same row as "Photo Links:"
+        worksheet = writer.sheets['Metadata']
+        photo_start_col = 1
+        for col_num, link in enumerate(visit['photo_links'], start=photo_start_col):
+            worksheet.write_url(5, col_num, link, string=f'Photo {col_num - photo_start_col + 1}')  # Row 5 is "Photo Links:"
+
+        worksheet.set_column(0, len(FT_COLUMNS) - 1, column_width)
+
+    return output_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a metadata workbook for every FlowTracker visit of the field forms.")
+    parser.add_argument('--offline', action='store_true', help="Use the local mirror of the field forms without syncing it.")
+    parser.add_argument('--workers', type=int, default=8, help="Number of workbooks written concurrently.")
+    args = parser.parse_args()
 
-        # Check if a metadata file for this submissionid already exists
-        if any(str(submissionid) in file for file in existing_files):
+    # Read the field forms from the local mirror (synced with the Google Sheet first unless offline)
+    df_forms = load_field_forms(offline=args.offline)
+    if df_forms.empty:
+        print("No field form records found.")
+        return
+    df_forms['submissionid'] = df_forms['submissionid'].astype(str)
+
+    # Submissions already exported (hashed set of IDs parsed from the file names)
+    exported_ids = exported_submission_ids(base_directory)
+
+    # FlowTracker flag of every submission in one grouped pass
+    flow_tracker = df_forms['Flow_Tracker'].fillna('').astype(str).str.lower().eq('yes').groupby(df_forms['submissionid']).any()
+    column_width = max(df_forms['Site_Name'].astype(str).str.len().max(), 20)
+
+    visits = []
+    for submissionid, df_submission in df_forms.groupby('submissionid', sort=False):
+        if not flow_tracker[submissionid]:
+            print(f"Submission {submissionid} has no flowtracker. Skipping.")
+            continue
+        if submissionid in exported_ids:
             print(f"Metadata for submissionid {submissionid} already exists. Skipping.")
-            continue  # Skip this submission if the file exists
-
-        # Filter the DataFrame by the current 'submissionid'
-        df_submission = df_ws[df_ws['submissionid'] == submissionid]
-
-        # Extract the necessary variables (Assumption: values are the same across all rows for a submissionid)
-        site = df_submission['Site_Name'].iloc[0]
-        time = df_submission['Arrival_Time_to_Site'].iloc[0]
-        weather = df_submission['Weather_Context'].iloc[0]
-        visit_notes = df_submission['Notes'].iloc[0]
-
-        # Filter for flowtracker rows
-        df_salt_dump = df_submission[pd.to_numeric(df_submission['Salt_Dump.Dump_Number'], errors='coerce').notna()]
-
-        # Select specific columns for salt dump data
-        ft_columns = [
-            'Flow_Tracker_Details.Start_Time',
-            'Flow_Tracker_Details.End_Time',
-            'Flow_Tracker_Details.Initial_Stage__Staff_Gauge_',
-            'Flow_Tracker_Details.End_Stage__Staff_Gauge_',
-            'Flow_Tracker_Details.Initial_Stage__Pressure_Transducer_',
-            'Flow_Tracker_Details.End_Stage__Pressure_Transducer_',
-            'Flow_Tracker_Details.Initial_Point__Right_Bank_Tie_Point_',
-            'Flow_Tracker_Details.Initial_Point__Right_Bank_Tape_Reading_',
-            'Flow_Tracker_Details.Initial_Point__Right_Bank_Tie_Point__Photo',
-            'Flow_Tracker_Details.End_Point__Left_Bank__Tape_Reading',
-            'Flow_Tracker_Details.Other'
-        ]
-
-        # Extract all 'Photo_X' columns and concatenate URLs into one variable
-        photo_links = []
-        photo_cols = [col for col in df_submission.columns if col.startswith('Photo_')]  # Identify 'Photo_X' columns
-        # Check 'Photos_of_Site' column for photo URLs
-        if 'Photos_of_Site' in df_submission.columns:
-            photo_cols.append('Photos_of_Site')
-
-        for col in photo_cols:
-            # Get the unique photo URL(s) for the current column
-            photo_urls = df_submission[col].unique()
-            # Assuming one URL per photo column, you can just add it to the list
-            if len(photo_urls) == 1 and photo_urls[0] != '':
-                photo_links.append(photo_urls[0])
\ No newline at end of file
+            continue
+        # Keep the columns of the submission's worksheet only
+        visits.append(extract_visit(submissionid, df_submission.dropna(axis=1, how='all')))
+
+    # Write the workbooks concurrently
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for visit, output_file in zip(visits, executor.map(write_visit_metadata, visits, [column_width] * len(visits))):
+            print(f"Metadata for submissionid {visit['submissionid']} has been written to {output_file}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+import gspread
+import pandas as pd
+import requests
+from config import credentials
+
+# Google Sheet holding the field form submissions (one worksheet per form version)
+FIELD_FORMS_SHEET_URL = "https://docs.google.com/spreadsheets/d/1JLbDJq4qAfAyzEpOuxYYjhfXd4FxvotUc8JaBCsSdKE/edit?gid=748389405"
+
+# Local SQLite mirror of the sheet
+FIELD_FORMS_DATABASE = Path(r"H:\tire-toxin\data\Discharge\field_forms.sqlite")
+
+# Schema of the mirror: one row per sheet row (the full record as JSON), indexed by submission and by site and time
+FIELD_FORMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS field_forms (
+    worksheet TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    submissionid TEXT,
+    site_name TEXT,
+    visit_time TEXT,
+    record TEXT NOT NULL,
+    PRIMARY KEY (worksheet, row_number)
+);
+CREATE INDEX IF NOT EXISTS field_forms_submissionid ON field_forms (submissionid);
+CREATE INDEX IF NOT EXISTS field_forms_site_time ON field_forms (site_name, visit_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    worksheet TEXT PRIMARY KEY,
+    header TEXT NOT NULL,
+    n_rows INTEGER NOT NULL,
+    synced_at TEXT NOT NULL
+);
+"""
+
+# Number of worksheets requested concurrently (the Sheets API limits the request rate per user)
+SHEET_MAX_WORKERS = 4
+
+# Attempts of a sheet request failing on a rate limit or connection error, and the wait before the first retry
+# (doubled after every failed attempt)
+SHEET_MAX_ATTEMPTS = 5
+SHEET_RETRY_DELAY = 1.0
+
+# Field form columns of the salt dump time index
+SALT_DUMP_COLUMNS = ['Site_Name', 'Salt_Dump.Time_of_Salt_Dump']
+
+# On-disk salt dump time index (see salt_dump_index) and the age after which it is rebuilt from the sheet
+SALT_DUMP_INDEX_FILE = FIELD_FORMS_DATABASE.with_name("salt_dump_times.csv")
+SALT_DUMP_INDEX_TTL = pd.Timedelta(hours=1)
+
+# Salt dump time indexes loaded during this session, by index file: (built_at, df_index)
+_SALT_DUMP_INDEX_CACHE = {}
+
+def open_field_forms_sheet(client=None):
+    """
+    Opens the field forms spreadsheet.
+
+    Parameters:
+    - client: gspread client (or any object with the same open_by_url / worksheets / row_values / get_values /
+              batch_get methods, e.g. a local stub). None authenticates with the service account in config.py.
+
+    Returns:
+    - spreadsheet: Opened spreadsheet.
+    """
+    if client is None:
+        client = gspread.service_account_from_dict(credentials)
+    return client.open_by_url(FIELD_FORMS_SHEET_URL)
+
+def _connect(database=None):
+    """Opens the mirror database, creating its tables if needed."""
+    database = Path(database if database is not None else FIELD_FORMS_DATABASE)
+    os.makedirs(database.parent, exist_ok=True)
+    connection = sqlite3.connect(database)
+    connection.executescript(FIELD_FORMS_SCHEMA)
+    return connection
+
+def _column_letter(n_columns):
+    """Returns the A1 letter of the last of n_columns columns (e.g. 28 -> 'AB')."""
+    return gspread.utils.rowcol_to_a1(1, max(n_columns, 1)).rstrip('0123456789')
+
+def _is_transient(error):
+    """Tells whether a failed sheet request is worth retrying (rate limit, server or connection error)."""
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (requests.exceptions.RequestException, ConnectionError, TimeoutError))
+
+def _request(method, *args, max_attempts=SHEET_MAX_ATTEMPTS, retry_delay=SHEET_RETRY_DELAY):
+    """Calls a worksheet method, retrying transient failures with exponential backoff."""
+    for attempt in range(max_attempts):
+        try:
+            return method(*args)
+        except Exception as e:
+            if attempt == max_attempts - 1 or not _is_transient(e):
+                raise
+            time.sleep(retry_delay * 2 ** attempt)
+
+def _fetch_rows(ws, header, first_row, columns=None):
+    """
+    Requests the data rows of a worksheet from first_row on. Runs in a worker thread.
+
+    Parameters:
+    - ws: Worksheet.
+    - header (list): Header row of the worksheet.
+    - first_row (int): First sheet row to request.
+    - columns (list): Only request these columns (one range per column). None requests every column.
+
+    Returns:
+    - header (list): Names of the requested columns.
+    - values (list): Rows of cell values (as text, trailing empty cells may be omitted).
+    """
+    if columns is None:
+        return header, (_request(ws.get_values, f"A{first_row}:{_column_letter(len(header))}") if header else [])
+
+    positions = [header.index(col) + 1 for col in columns if col in header]
+    if not positions:
+        return [], []
+    ranges = [f"{letter}{first_row}:{letter}" for letter in (_column_letter(position) for position in positions)]
+    value_ranges = _request(ws.batch_get, ranges)
+
+    # Each range comes back as one cell per row, without the trailing empty cells
+    n_rows = max(len(value_range) for value_range in value_ranges)
+    cells = [[row[0] if row else '' for row in value_range] + [''] * (n_rows - len(value_range)) for value_range in value_ranges]
+    return [header[position - 1] for position in positions], [list(row) for row in zip(*cells)]
+
+def _visit_time(value):
+    """Returns the arrival time of a record as a sortable ISO string, or None."""
+    time = pd.to_datetime(value, errors='coerce')
+    return time.strftime('%Y-%m-%d %H:%M:%S') if pd.notna(time) else None
+
+def sync_field_forms(client=None, database=None, full=False, max_workers=SHEET_MAX_WORKERS):
+    """
+    Brings the local mirror up to date with the field forms sheet.
+
+    Form submissions are appended to the worksheets, so only the rows below those already mirrored are
+    requested. A worksheet whose header changed, or every worksheet if full is True, is pulled again entirely
+    (use full to pick up edits of existing rows). Worksheets are requested concurrently, and requests failing
+    on a rate limit or connection error are retried with exponential backoff.
+
+    Parameters:
+    - client: gspread client or stub (see open_field_forms_sheet).
+    - database (Path or str): Mirror database. Defaults to FIELD_FORMS_DATABASE.
+    - full (bool): Pull every row again.
+    - max_workers (int): Number of worksheets requested concurrently.
+
+    Returns:
+    - new_rows (dict): Worksheet title -> number of rows added to the mirror.
+    """
+    spreadsheet = open_field_forms_sheet(client)
+    worksheets = _request(spreadsheet.worksheets)
+    new_rows = {}
+    with closing(_connect(database)) as connection, connection:
+        sync_state = {worksheet: (json.loads(header), n_rows) for worksheet, header, n_rows
+                      in connection.execute("SELECT worksheet, header, n_rows FROM sync_state")}
+
+        def fetch(ws):
+            """Requests the header and the rows not mirrored yet of a worksheet. Runs in a worker thread."""
+            header = _request(ws.row_values, 1)
+            stored_header, n_synced = sync_state.get(ws.title, (None, 0))
+            if full or stored_header != header:
+                n_synced = 0
+            # Data rows start on sheet row 2
+            return header, n_synced, _fetch_rows(ws, header, n_synced + 2)[1]
+
+        # Worksheets are requested concurrently, the mirror is written from this thread only
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = list(executor.map(fetch, worksheets))
+
+        for ws, (header, n_synced, values) in zip(worksheets, fetched):
+            if n_synced == 0:
+                connection.execute("DELETE FROM field_forms WHERE worksheet = ?", (ws.title,))
+            first_row = n_synced + 2
+            records = []
+            for offset, row in enumerate(values):
+                if not any(str(value).strip() for value in row):
+                    continue
+                record = dict(zip(header, list(row) + [''] * (len(header) - len(row))))
+                records.append((ws.title, first_row + offset, str(record.get('submissionid', '')), record.get('Site_Name'),
+                                _visit_time(record.get('Arrival_Time_to_Site')), json.dumps(record)))
+            connection.executemany("INSERT OR REPLACE INTO field_forms VALUES (?, ?, ?, ?, ?, ?)", records)
+            connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                               (ws.title, json.dumps(header), n_synced + len(values), pd.Timestamp.now().isoformat(timespec='seconds')))
+            new_rows[ws.title] = len(records)
+    return new_rows
+
+def read_field_forms(site_name=None, start=None, end=None, submissionids=None, worksheet=None, database=None):
+    """
+    Reads field form records from the local mirror through its indexes (no network access).
+
+    Parameters:
+    - site_name (str): Site_Name value of the sheet (e.g. 'Northfield'). None reads every site.
+    - start, end (str or pd.Timestamp): Inclusive range of Arrival_Time_to_Site. None leaves that side open.
+    - submissionids (list): Only read these submissions.
+    - worksheet (str): Only read this worksheet.
+    - database (Path or str): Mirror database. Defaults to FIELD_FORMS_DATABASE.
+
+    Returns:
+    - df_forms (pd.DataFrame): One row per sheet row with the sheet's columns (as text, '' for empty cells) and
+                               a 'worksheet' column, in sheet order. Empty if nothing matches.
+    """
+    conditions, parameters = [], []
+    if site_name is not None:
+        conditions.append("site_name = ?")
+        parameters.append(site_name)
+    if start is not None:
+        conditions.append("visit_time >= ?")
+        parameters.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+    if end is not None:
+        conditions.append("visit_time <= ?")
+        parameters.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+    if submissionids is not None:
+        submissionids = [str(submissionid) for submissionid in submissionids]
+        conditions.append(f"submissionid IN ({', '.join('?' * len(submissionids))})")
+        parameters.extend(submissionids)
+    if worksheet is not None:
+        conditions.append("worksheet = ?")
+        parameters.append(worksheet)
+    query = "SELECT worksheet, record FROM field_forms"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY worksheet, row_number"
+
+    with closing(_connect(database)) as connection:
+        rows = connection.execute(query, parameters).fetchall()
+    return pd.DataFrame([{**json.loads(record), 'worksheet': worksheet} for worksheet, record in rows])
+
+def load_field_forms(site_name=None, start=None, end=None, submissionids=None, offline=False, client=None, database=None):
+    """
+    Syncs the local mirror (unless offline) and reads field form records from it, see read_field_forms.
+
+    If the sheet cannot be reached, the records already mirrored are used.
+
+    Parameters:
+    - offline (bool): Do not contact the sheet, only read the mirror.
+    - client: gspread client or stub (see open_field_forms_sheet).
+
+    Other parameters and the return value are those of read_field_forms.
+    """
+    database = Path(database if database is not None else FIELD_FORMS_DATABASE)
+    if not offline:
+        try:
+            sync_field_forms(client, database)
+        except Exception as e:
+            if not database.exists():
+                raise
+            print(f"Field forms sync failed ({type(e).__name__}: {e}). Using the local mirror.")
+    return read_field_forms(site_name=site_name, start=start, end=end, submissionids=submissionids, database=database)
+
+def exported_submission_ids(directory):
+    """
+    Returns the submission IDs already exported to a directory tree, as a set for constant-time lookups.
+
+    Exported files are named {site}_{date}_metadata_{submissionid}.xlsx (see fetch-ec-metadata.py).
+    """
+    return {match.group(1) for file in Path(directory).rglob("*.xlsx")
+            if (match := re.search(r"_metadata_(.+)\.xlsx$", file.name))}
+
+def photo_links(df_submission):
+    """Returns the photo URLs of a submission ('Photo_X' columns, then 'Photos_of_Site'), one per column holding a single URL."""
+    photo_cols = [col for col in df_submission.columns if col.startswith('Photo_')]
+    if 'Photos_of_Site' in df_submission.columns:
+        photo_cols.append('Photos_of_Site')
+
+    links = []
+    for col in photo_cols:
+        photo_urls = df_submission[col].dropna().unique()
+        if len(photo_urls) == 1 and photo_urls[0] != '':
+            links.append(photo_urls[0])
+    return links
+
+def fetch_field_form_columns(columns, client=None, max_workers=SHEET_MAX_WORKERS):
+    """
+    Requests some columns of every worksheet directly from the sheet (the local mirror is not used).
+
+    Only the header row and the given columns are transferred, with the worksheets requested concurrently and
+    transient failures retried with exponential backoff.
+
+    Parameters:
+    - columns (list): Sheet column names. Worksheets without any of them are skipped.
+    - client: gspread client or stub (see open_field_forms_sheet).
+    - max_workers (int): Number of worksheets requested concurrently.
+
+    Returns:
+    - df_forms (pd.DataFrame): One row per sheet row with the columns found (as text, '' for empty cells) and
+                               a 'worksheet' column, in sheet order.
+    """
+    spreadsheet = open_field_forms_sheet(client)
+    worksheets = _request(spreadsheet.worksheets)
+
+    def fetch(ws):
+        """Requests the header and the columns of a worksheet. Runs in a worker thread."""
+        return _fetch_rows(ws, _request(ws.row_values, 1), 2, columns)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = list(executor.map(fetch, worksheets))
+
+    frames = [pd.DataFrame(values, columns=header).assign(worksheet=ws.title)
+              for ws, (header, values) in zip(worksheets, fetched) if header and values]
+    if not frames:
+        return pd.DataFrame(columns=list(columns) + ['worksheet'])
+    return pd.concat(frames, ignore_index=True)
+
+def _build_salt_dump_index(df_forms):
+    """Parses the non-empty dump times of field form records (each worksheet has its own time format)."""
+    frames = []
+    if not df_forms.empty and set(SALT_DUMP_COLUMNS) <= set(df_forms.columns):
+        for worksheet, df_ws in df_forms.groupby('worksheet', sort=False):
+            frames.append(pd.DataFrame({
+                'site_name': df_ws['Site_Name'].to_numpy(),
+                'time': pd.to_datetime(df_ws['Salt_Dump.Time_of_Salt_Dump'], errors='coerce').to_numpy(),
+                'worksheet': worksheet,
+            }))
+    df_index = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['site_name', 'time', 'worksheet'])
+    df_index['time'] = pd.to_datetime(df_index['time'])
+    return df_index.dropna(subset=['time']).reset_index(drop=True)
+
+def salt_dump_index(refresh=False, ttl=SALT_DUMP_INDEX_TTL, offline=False, client=None, database=None, index_file=None):
+    """
+    Returns the salt dump times recorded in the field forms for every site.
+
+    The index is served from memory, then from its file on disk, as long as it is younger than the TTL.
+    Otherwise (or with refresh) it is rebuilt from the two columns it needs, requested directly from the sheet
+    (see fetch_field_form_columns), and saved. If the sheet cannot be reached, or offline is set, the index is
+    built from the local mirror instead; offline also serves an existing index regardless of its age.
+
+    Parameters:
+    - refresh (bool): Rebuild the index even if a recent one exists.
+    - ttl (pd.Timedelta): Age after which the index is rebuilt.
+    - offline (bool): Do not contact the sheet.
+    - client: gspread client or stub (see open_field_forms_sheet).
+    - database (Path or str): Mirror database used offline. Defaults to FIELD_FORMS_DATABASE.
+    - index_file (Path or str): Index file. Defaults to SALT_DUMP_INDEX_FILE.
+
+    Returns:
+    - df_index (pd.DataFrame): site_name (Site_Name value of the sheet), time (pd.Timestamp) and worksheet of
+                               every recorded dump, in sheet order.
+    """
+    index_file = Path(index_file if index_file is not None else SALT_DUMP_INDEX_FILE)
+    cache_key = str(index_file)
+
+    if not refresh:
+        now = pd.Timestamp.now()
+        cached = _SALT_DUMP_INDEX_CACHE.get(cache_key)
+        if cached is not None and (offline or now - cached[0] < ttl):
+            return cached[1]
+        if index_file.exists():
+            built_at = pd.Timestamp.fromtimestamp(index_file.stat().st_mtime)
+            if offline or now - built_at < ttl:
+                df_index = pd.read_csv(index_file, parse_dates=['time'], dtype={'site_name': str, 'worksheet': str})
+                _SALT_DUMP_INDEX_CACHE[cache_key] = (built_at, df_index)
+                return df_index
+
+    df_forms = None
+    if not offline:
+        try:
+            df_forms = fetch_field_form_columns(SALT_DUMP_COLUMNS, client)
+        except Exception as e:
+            database = Path(database if database is not None else FIELD_FORMS_DATABASE)
+            if not database.exists():
+                raise
+            print(f"Field forms request failed ({type(e).__name__}: {e}). Using the local mirror.")
+    if df_forms is None:
+        df_forms = read_field_forms(database=database)
+    df_index = _build_salt_dump_index(df_forms)
+
+    # Written to a temporary file first so readers never see a partial index
+    os.makedirs(index_file.parent, exist_ok=True)
+    temporary_file = index_file.with_name(index_file.name + ".tmp")
+    df_index.to_csv(temporary_file, index=False)
+    os.replace(temporary_file, index_file)
+    _SALT_DUMP_INDEX_CACHE[cache_key] = (pd.Timestamp.now(), df_index)
+    return df_index
+
+def clear_salt_dump_index_cache():
+    """Drops the salt dump time indexes held in memory (the index files are kept)."""
+    _SALT_DUMP_INDEX_CACHE.clear()
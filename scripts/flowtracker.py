@@ -0,0 +1,261 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Root of the FlowTracker data (exports per site and visit, and the metadata written by fetch-flowtracker-metadata.py)
+FLOWTRACKER_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Flowtracker")
+
+# Export files read by the bulk parser: FlowTracker2 Excel exports and FlowTracker ASCII discharge files
+FLOWTRACKER_EXPORT_SUFFIXES = ('.xlsx', '.dis')
+
+# Station table columns and the header names they appear under (lower case, units removed)
+FLOWTRACKER_STATION_ALIASES = {
+    'station': ['station', 'station #', 'station number', 'st'],
+    'time': ['time', 'clock'],
+    'location': ['location', 'loc', 'distance', 'tape'],
+    'method': ['method'],
+    'depth': ['depth', 'total depth'],
+    'fraction_depth': ['% depth', '%dep', 'fraction depth'],
+    'velocity': ['mean velocity', 'meanv', 'mean v', 'velocity', 'vel'],
+    'correction_factor': ['correction factor', 'corrfact', 'corr fact'],
+    'area': ['area'],
+    'discharge': ['discharge', 'flow', 'q'],
+    'percent_discharge': ['% discharge', '% flow', '%q', '% q'],
+}
+
+# Summary fields and the labels they appear under (lower case, units removed)
+FLOWTRACKER_SUMMARY_ALIASES = {
+    'site_name': ['site name', 'site'],
+    'start_time': ['start time', 'start date and time', 'start date', 'date'],
+    'end_time': ['end time', 'end date and time'],
+    'total_discharge': ['total discharge', 'discharge', 'total q'],
+    'total_area': ['total area', 'area'],
+    'total_width': ['total width', 'width'],
+    'mean_velocity': ['mean velocity', 'mean v'],
+    'mean_depth': ['mean depth'],
+}
+
+# Columns of the FlowTracker station table built by ingest_flowtracker_exports
+FLOWTRACKER_COLUMNS = (
+    ['site', 'date', 'file', 'start_time', 'end_time', 'total_discharge', 'total_area', 'total_width']
+    + list(FLOWTRACKER_STATION_ALIASES) + ['midsection_discharge']
+)
+
+# Export file names ({site}_{date}..., e.g. northfield_20241104_FT.xlsx)
+FLOWTRACKER_FILE_PATTERN = re.compile(r"^(?P<site>.+?)_(?P<date>\d{8})")
+
+def _normalize_label(value):
+    """Lower-cases a header or summary label and drops units in brackets and trailing colons."""
+    label = re.sub(r"[\(\[].*?[\)\]]", "", str(value)).strip().rstrip(':').strip().lower()
+    return re.sub(r"\s+", " ", label)
+
+def _find_station_table(rows):
+    """
+    Locates the station table in a list of rows.
+
+    Returns:
+    - header_row (int or None): Position of the header row, or None if no table is found.
+    - columns (dict): Station column name -> cell position in the header row.
+    """
+    for row_idx, row in enumerate(rows):
+        labels = [_normalize_label(value) if value is not None and str(value).strip() else None for value in row]
+        columns = {}
+        for name, aliases in FLOWTRACKER_STATION_ALIASES.items():
+            # Aliases are in order of preference (e.g. mean velocity over point velocity)
+            position = next((labels.index(alias) for alias in aliases if alias in labels), None)
+            if position is not None:
+                columns[name] = position
+        if {'location', 'depth', 'velocity'} <= set(columns):
+            return row_idx, columns
+    return None, {}
+
+def _summary_fields(rows):
+    """Collects the summary fields of label/value pairs ('Label', value) or 'Label: value' cells."""
+    summary = {}
+    for row in rows:
+        cells = [value for value in row if value is not None and str(value).strip() != '']
+        pairs = list(zip(cells[:-1], cells[1:]))
+        pairs += [tuple(str(cell).split(':', 1)) for cell in cells if isinstance(cell, str) and re.match(r"^[^:]+:\s*\S", cell)]
+        for label, value in pairs:
+            label = _normalize_label(label)
+            for name, aliases in FLOWTRACKER_SUMMARY_ALIASES.items():
+                if name not in summary and label in aliases:
+                    summary[name] = value.strip() if isinstance(value, str) else value
+    return summary
+
+def _read_rows(file):
+    """Reads an export as lists of rows: one list per worksheet of an Excel file, one list for a text file."""
+    file = Path(file)
+    if file.suffix.lower() == '.xlsx':
+        sheets = pd.read_excel(file, sheet_name=None, header=None, dtype=object)
+        return [df.astype(object).where(df.notna(), None).values.tolist() for df in sheets.values()]
+    lines = file.read_text(encoding='latin-1').splitlines()
+    # ASCII exports separate columns with tabs, commas or runs of spaces
+    return [[re.split(r"\t|,|\s{2,}", line.strip()) for line in lines if line.strip()]]
+
+def read_flowtracker_export(file):
+    """
+    Reads the station table and measurement summary of one FlowTracker export.
+
+    FlowTracker2 Excel exports are searched sheet by sheet; for a FlowTracker ASCII discharge file (.DIS), the
+    summary is read from the .SUM file of the same name if it exists. Metric units (m, m/s, m3/s) are assumed,
+    as required by the WSC procedure.
+
+    Parameters:
+    - file (Path or str): Export file.
+
+    Returns:
+    - summary (dict): Summary fields found (see FLOWTRACKER_SUMMARY_ALIASES).
+    - df_stations (pd.DataFrame): One row per station with the station columns found (see FLOWTRACKER_STATION_ALIASES).
+
+    Raises:
+    - ValueError: If no station table (location, depth and velocity columns) is found.
+    """
+    file = Path(file)
+    summary, df_stations = {}, None
+    for rows in _read_rows(file):
+        header_row, columns = _find_station_table(rows)
+        summary_rows = rows if header_row is None else rows[:header_row]
+        for name, value in _summary_fields(summary_rows).items():
+            summary.setdefault(name, value)
+        if header_row is not None and df_stations is None:
+            data = [row for row in rows[header_row + 1:] if any(value is not None and str(value).strip() for value in row)]
+            df_stations = pd.DataFrame({name: [row[position] if position < len(row) else None for row in data]
+                                        for name, position in columns.items()})
+
+    sum_file = file.with_suffix('.SUM') if file.with_suffix('.SUM').exists() else file.with_suffix('.sum')
+    if file.suffix.lower() == '.dis' and sum_file.exists():
+        for name, value in _summary_fields(_read_rows(sum_file)[0]).items():
+            summary.setdefault(name, value)
+
+    if df_stations is None:
+        raise ValueError(f"No station table found in {file.name}.")
+
+    # Station rows hold numeric locations, totals and notes below the table are dropped
+    numeric = [col for col in df_stations.columns if col not in ('method', 'time')]
+    df_stations[numeric] = df_stations[numeric].apply(pd.to_numeric, errors='coerce')
+    df_stations = df_stations[df_stations['location'].notna()].reset_index(drop=True)
+    return summary, df_stations
+
+def midsection_discharge(location, depth, velocity):
+    """
+    Station discharges with the mid-section method: q_i = v_i * d_i * (b_(i+1) - b_(i-1)) / 2.
+
+    The first and last stations (edges) use the half distance to their only neighbour.
+
+    Parameters:
+    - location (array-like): Station locations across the section [m], in measurement order.
+    - depth (array-like): Station depths [m].
+    - velocity (array-like): Mean velocities in the vertical [m/s].
+
+    Returns:
+    - discharge (np.ndarray): Station discharges [m3/s].
+    """
+    location = np.asarray(location, dtype='float64')
+    if len(location) < 2:
+        return np.zeros(len(location))
+    previous = np.r_[location[0], location[:-1]]
+    following = np.r_[location[1:], location[-1]]
+    width = np.abs(following - previous) / 2
+    return np.asarray(velocity, dtype='float64') * np.asarray(depth, dtype='float64') * width
+
+def _summary_time(summary, name):
+    """Returns a summary time field as a Timestamp, NaT if it is missing or cannot be parsed."""
+    time = pd.to_datetime(summary.get(name), errors='coerce')
+    return pd.NaT if time is None else time
+
+def _flowtracker_job(file):
+    """Reads one export into station rows of the FlowTracker table. Runs in a worker process."""
+    file = Path(file)
+    summary, df_stations = read_flowtracker_export(file)
+    match = FLOWTRACKER_FILE_PATTERN.match(file.name)
+    start_time = _summary_time(summary, 'start_time')
+
+    df = df_stations.reindex(columns=list(FLOWTRACKER_STATION_ALIASES))
+    df['midsection_discharge'] = midsection_discharge(df['location'], df['depth'], df['velocity'])
+    df['site'] = match.group('site') if match else summary.get('site_name')
+    df['date'] = match.group('date') if match else (start_time.strftime('%Y%m%d') if pd.notna(start_time) else None)
+    df['file'] = str(file)
+    df['start_time'] = start_time
+    df['end_time'] = _summary_time(summary, 'end_time')
+    for name in ('total_discharge', 'total_area', 'total_width'):
+        df[name] = pd.to_numeric(summary.get(name), errors='coerce')
+    return df[FLOWTRACKER_COLUMNS]
+
+def find_flowtracker_exports(directory):
+    """Lists the FlowTracker exports of a directory tree (Excel lock files and metadata workbooks excluded)."""
+    return sorted(file for file in Path(directory).rglob("*")
+                  if file.suffix.lower() in FLOWTRACKER_EXPORT_SUFFIXES and not file.name.startswith('~')
+                  and '_metadata_' not in file.name)
+
+def ingest_flowtracker_exports(files, output_file=None, max_workers=None):
+    """
+    Parses FlowTracker exports in parallel into one station table across all visits.
+
+    Parameters:
+    - files (list): Export files (see find_flowtracker_exports).
+    - output_file (Path or str): Parquet file the table is written to. None only returns it.
+    - max_workers (int): Number of worker processes. None uses the number of CPUs.
+
+    Returns:
+    - df_flowtracker (pd.DataFrame): One row per station (see FLOWTRACKER_COLUMNS).
+    - errors (dict): File -> error message for the exports that could not be parsed.
+    """
+    frames, errors = [], {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {file: executor.submit(_flowtracker_job, file) for file in files}
+        for file, future in futures.items():
+            try:
+                frames.append(future.result())
+            except Exception as e:
+                errors[str(file)] = f"{type(e).__name__}: {e}"
+
+    df_flowtracker = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FLOWTRACKER_COLUMNS)
+    if output_file is not None:
+        df_flowtracker.to_parquet(output_file, index=False)
+    return df_flowtracker, errors
+
+def summarize_flowtracker_visits(df_flowtracker):
+    """
+    Reduces the station table to one row per measurement.
+
+    Returns:
+    - df_visits (pd.DataFrame): site, date, file, start_time, total_discharge (reported), midsection_discharge
+                                (sum over the stations), n_stations, total_width and max_depth.
+    """
+    grouped = df_flowtracker.groupby(['site', 'date', 'file'], sort=True, dropna=False)
+    return grouped.agg(
+        start_time=('start_time', 'first'),
+        total_discharge=('total_discharge', 'first'),
+        midsection_discharge=('midsection_discharge', 'sum'),
+        n_stations=('location', 'size'),
+        total_width=('location', lambda location: location.max() - location.min()),
+        max_depth=('depth', 'max'),
+    ).reset_index()
+
+def compare_with_salt_dilution(df_results, df_visits):
+    """
+    Joins salt dilution discharge results with the FlowTracker measurements of the same site visit.
+
+    Parameters:
+    - df_results (pd.DataFrame): Salt dilution results (see salt_dilution.DISCHARGE_COLUMNS).
+    - df_visits (pd.DataFrame): FlowTracker measurements (see summarize_flowtracker_visits).
+
+    Returns:
+    - df_comparison (pd.DataFrame): One row per dump and FlowTracker measurement of the visit, with the ratio of
+                                    the salt dilution discharge to the FlowTracker discharge (reported total, or
+                                    the mid-section sum if no total was reported).
+    """
+    df_visits = df_visits.assign(flowtracker_discharge=df_visits['total_discharge'].fillna(df_visits['midsection_discharge']))
+    df_visits = df_visits[['site', 'date', 'file', 'start_time', 'flowtracker_discharge']].rename(
+        columns={'site': 'flowtracker_site', 'file': 'flowtracker_file', 'start_time': 'flowtracker_start'})
+
+    # Join keys: site names in lower case and dates as YYYYMMDD strings on both sides
+    keys = ['site_key', 'date_key']
+    df_results = df_results.assign(site_key=df_results['site'].astype(str).str.lower(), date_key=df_results['date'].astype(str))
+    df_visits = df_visits.assign(site_key=df_visits['flowtracker_site'].astype(str).str.lower(), date_key=df_visits['date'].astype(str))
+    df_comparison = df_results.merge(df_visits.drop(columns='date'), on=keys, how='inner').drop(columns=keys)
+    df_comparison['discharge_ratio'] = df_comparison['discharge_m3s'] / df_comparison['flowtracker_discharge']
+    return df_comparison
@@ -0,0 +1,107 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pyarrow.parquet as pq
+
+# Rows per Parquet row group, so range queries can read a small part of a monthly partition
+PARTITION_ROW_GROUP_SIZE = 65536
+
+# Sorted time index of each partition read so far: path -> (file signature, times, row group offsets)
+_PARTITION_INDEX_CACHE = {}
+
+@contextmanager
+def store_lock(directory, timeout=600, poll_interval=0.5):
+    """
+    Holds an exclusive lock file on a directory of partitions so concurrent writers are serialized.
+
+    Parameters:
+    - directory (Path or str): Partition directory of a record (created if needed).
+    - timeout (float): Seconds to wait for the lock before giving up.
+    - poll_interval (float): Seconds between attempts to take the lock.
+
+    Raises:
+    - TimeoutError: If the lock could not be taken within the timeout.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+    lock_path = directory / ".lock"
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {directory.name} within {timeout} s. Remove {lock_path} if no other ingest is running.")
+            time.sleep(poll_interval)
+
+    try:
+        os.write(lock_fd, str(os.getpid()).encode())
+        yield
+    finally:
+        os.close(lock_fd)
+        os.remove(lock_path)
+
+def partition_time_index(path, time_column='Datetime'):
+    """
+    Returns the sorted time index of a partition, cached until the file changes.
+
+    Parameters:
+    - path (Path): Partition file.
+    - time_column (str): Name of the datetime column.
+
+    Returns:
+    - times (np.ndarray): datetime64[ns] timestamps of every row.
+    - row_group_offsets (np.ndarray): First row of each row group, followed by the number of rows.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _PARTITION_INDEX_CACHE.get(str(path))
+    if cached is None or cached[0] != signature:
+        parquet_file = pq.ParquetFile(path)
+        times = parquet_file.read(columns=[time_column]).column(0).to_numpy().astype('datetime64[ns]')
+        row_counts = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+        cached = (signature, times, np.concatenate([[0], np.cumsum(row_counts)]).astype('int64'))
+        _PARTITION_INDEX_CACHE[str(path)] = cached
+    return cached[1], cached[2]
+
+def clear_partition_index_cache(path=None):
+    """Drops the cached time index of one partition, or of every partition if no path is given."""
+    if path is None:
+        _PARTITION_INDEX_CACHE.clear()
+    else:
+        _PARTITION_INDEX_CACHE.pop(str(path), None)
+
+def read_partition_range(path, start=None, end=None, columns=None, time_column='Datetime'):
+    """
+    Reads the rows of a partition within a time range, decoding only the row groups that contain them.
+
+    The range is located by binary search on the partition's cached time index, so partitions must be
+    sorted on the time column (as written by the stores).
+
+    Parameters:
+    - path (Path): Partition file.
+    - start, end (pd.Timestamp): Inclusive time range. None leaves that side open.
+    - columns (list): Columns to read besides the time column. None reads every column.
+    - time_column (str): Name of the datetime column.
+
+    Returns:
+    - table (pa.Table or None): Rows within the range, or None if there are none.
+    """
+    times, row_group_offsets = partition_time_index(path, time_column)
+    lo = np.searchsorted(times, np.datetime64(start, 'ns'), side='left') if start is not None else 0
+    hi = np.searchsorted(times, np.datetime64(end, 'ns'), side='right') if end is not None else len(times)
+    if hi <= lo:
+        return None
+
+    parquet_file = pq.ParquetFile(path)
+    if columns is not None:
+        available = set(parquet_file.schema_arrow.names)
+        columns = [time_column] + [col for col in columns if col != time_column and col in available]
+    first_group = int(np.searchsorted(row_group_offsets, lo, side='right') - 1)
+    last_group = int(np.searchsorted(row_group_offsets, hi - 1, side='right') - 1)
+    table = parquet_file.read_row_groups(range(first_group, last_group + 1), columns=columns)
+    return table.slice(lo - row_group_offsets[first_group], hi - lo)
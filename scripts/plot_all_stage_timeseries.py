@@ -1,34 +1,43 @@
-import pandas as pd
+import argparse
 import matplotlib.pyplot as plt
-
-# List of stage files to be read
-stage_files = [
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\northfield_poolBT_stage_master.xlsx",
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\cat_beacons_stage_master.xlsx",
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\chase_ds_stage_master.xlsx",
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\chase_us_stage_master.xlsx",
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\chase_usBT_stage_master.xlsx",
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\northfield_bridge_stage_master.xlsx",
-    "h:\\tire-toxin\\data\\Discharge\\Stage\\processed\\northfield_bridgeBT_stage_master.xlsx"
+from project_utils import decimate_minmax
+from record_query import query_record
+
+# List of stage sites to be read from the stage store
+stage_sites = [
+    "northfield_poolBT",
+    "cat_beacons",
+    "chase_ds",
+    "chase_us",
+    "chase_usBT",
+    "northfield_bridge",
+    "northfield_bridgeBT"
 ]
 
-# Dictionary to hold each DataFrame
-dfs = {}
+# Maximum number of points drawn per site (long records are decimated, keeping the peaks)
+MAX_PLOT_POINTS = 20000
+
+parser = argparse.ArgumentParser(description="Plots the water level record of every stage site.")
+parser.add_argument('--start', default=None, help="Start of the plotted range (e.g. 2024-11-01). Defaults to the first record.")
+parser.add_argument('--end', default=None, help="End of the plotted range. Defaults to the last record.")
+args = parser.parse_args()
+
+# Dictionary to hold each record's arrays
+records = {}
 
-# Loop through each file and read it into a DataFrame
-for file in stage_files:
-    # Get the base name (before '_stage') to use as the key
-    key = file.split("\\")[-1].split('_stage')[0]
-    # Read the Excel file into a DataFrame
-    dfs[key] = pd.read_excel(file, index_col=0, parse_dates=True)
+# Loop through each site and read the water level within the range (only the partitions and row groups it covers)
+for key in stage_sites:
+    records[key] = query_record(key, start=args.start, end=args.end, columns=['Water Level (m)'], kind='stage', as_arrays=True)
 
-    # Create a plot
+# Create a plot
 plt.figure(figsize=(10, 6))
 
-# Loop through each DataFrame and plot the 'Water Level (m)' column
-for key, df in dfs.items():
-    if 'Water Level (m)' in df.columns:
-        plt.plot(df.index, df['Water Level (m)'], label=key)
+# Loop through each record and plot the 'Water Level (m)' column
+for key, arrays in records.items():
+    water_level = arrays['Water Level (m)']
+    if len(water_level):
+        indices = decimate_minmax(water_level, MAX_PLOT_POINTS)
+        plt.plot(arrays['Datetime'][indices], water_level[indices], label=key)
 
 # Add labels and title
 plt.xlabel('Datetime')
@@ -41,4 +50,4 @@ plt.legend(title='Sites')
 
 # Display the plot
 plt.tight_layout()
-plt.show()
\ No newline at end of file
+plt.show()
@@ -5,12 +5,13 @@ from pathlib import Path
 import os
 from project_utils import (
     read_stage_file,
-    calculate_differential_pressure,
-    calculate_water_level,
-    save_formatted_stage_file,
+    process_stage_window,
+    apply_water_level_offsets,
     autodetect_stage_site,
-    read_baro_file,
+    save_stage_master,
+    STAGE_MASTER_DIRECTORY,
 )
+from stage_store import read_stage_data, stage_memory_report
 
 st.title("CHRL Tire-Toxin Stage Data Processing")
 
@@ -70,91 +71,67 @@ if uploaded_file is not None and st.session_state.process_clicked:
     df_new = read_stage_file(temp_file_path, stats_flag=stats_flag)
     
     st.write(df_new)
+    with st.expander("Memory usage"):
+        st.dataframe(stage_memory_report(df_new))
     
     # # CORRECTION FOR NORTHFIELD WATER LEVEL (see project data notes)
     # if site_name == 'northfield_poolBT':
     #     correction_time = pd.to_datetime("2024-12-17 13:42:00")
     #     df_new.loc[df_new.index > correction_time, 'Water Level (m)'] += 0.5550484190348302
 
-    # Generate the output file path
-    output_directory = Path(r"H:\tire-toxin\data\Discharge\Stage\processed")
-    output_filepath = output_directory / f"{site_name}_stage_master.xlsx"
-
-    # Load existing master file or create a new one
-    if output_filepath.exists():
-        df_master = pd.read_excel(output_filepath, header=0, index_col=0, parse_dates=True)
-        df_master.index.name = df_master.index.name or 'Datetime'
-        df_master.index = pd.to_datetime(df_master.index, errors='coerce')
-        df_unique = df_new[~df_new.index.isin(df_master.index)]
-        # CORRECTION FOR NORTHFIELD WATER LEVEL (see project data notes)
-        if site_name == 'northfield_poolBT':
-            correction_time = pd.to_datetime("2024-12-17 13:42:00")
-            df_unique.loc[df_unique.index > correction_time, 'Water Level (m)'] += df_master['Water Level (m)'].iloc[-1]
-            st.write(rf'last in master = {df_master['Water Level (m)'].iloc[-1]}')
-        df_master = pd.concat([df_master, df_unique])
-        is_new_master_file = False
-        
-
-        
+    # CORRECTION FOR NORTHFIELD WATER LEVEL (see project data notes)
+    df_new, water_level_offset = apply_water_level_offsets(site_name, df_new)
+    if water_level_offset is not None:
+        st.write(rf'last in master = {water_level_offset}')
+
+    # Correct only the new rows and the stored rows they overlap (incremental ingest)
+    df_window, df_unique, summary = process_stage_window(site_name, df_new)
+    is_new_master_file = summary['high_water_mark'] is None
+    if is_new_master_file:
+        st.warning('An existing master record was not found. A new one will be created upon saving.')
     else:
-        df_master = df_new
-        is_new_master_file = True
-        st.warning('An existing master file was not found. A new one will be created upon saving.')
+        st.info(f"Existing master record ends at {summary['high_water_mark']}.")
 
     if 'BT' not in site_name:
-        # Load appropriate master file with baro data
-        df_baro = read_baro_file(site_name)
-        if df_baro is not None:
-            # Apply barometric pressure correction
-            st.write("Applying barometric pressure correction and calculating differential pressure...")
-            df_master, corrected_baro_count, failed_baro_count = calculate_differential_pressure(df_master, df_baro)
-            st.success(f"- Differential Pressure calculations made: {corrected_baro_count}")
-            st.warning(f"- Failed calculations due to missing barometric data: {failed_baro_count}")
-            
-            # Calculate water level
-            st.write("Calculating water level...")
-            df_master, corrected_water_level_count = calculate_water_level(df_master)
-            st.info(f"- Water Level calculations made: {corrected_water_level_count}")
+        if summary['baro_site_found']:
+            st.success(f"- Differential Pressure calculations made: {summary['corrected_baro_count']}")
+            st.warning(f"- Failed calculations due to missing barometric data: {summary['failed_baro_count']}")
+            st.info(f"- Water Level calculations made: {summary['corrected_water_level_count']}")
         else:
             st.warning(f"No BT file with barometric data found for {site_name}, skipping barometric pressure correction.")
 
     # Handle duplicate timestamps
-    len_preclean = len(df_master)
-    df_master = df_master.groupby(df_master.index).mean()
-    if len_preclean - len(df_master) > 0:
+    if summary['duplicates_averaged'] > 0:
         st.warning(
-            f"{len_preclean - len(df_master)} duplicate timestamps were averaged during processing."
+            f"{summary['duplicates_averaged']} duplicate timestamps were averaged during processing."
         )
-        
-    # quick removal of fill values
-    n_fill = (df_master['Water Level (m)'] < -200).sum() + (df_master['Water Level (m)'] > 10).sum()
-    df_master.loc[df_master['Water Level (m)'] < -200, :] = pd.NA
-    df_master.loc[df_master['Water Level (m)'] > 10, :] = pd.NA
-    st.warning(f'{n_fill} fill values have been removed.')
-
-    # Ensure the combined dataset is sorted
-    df_master.sort_index(inplace=True)
+    st.warning(f"{summary['fill_values_removed']} fill values have been removed.")
 
     # Completion messages
-    if df_unique.empty:
+    if df_unique.empty and not summary['recorrected_rows']:
         st.warning('No new data detected!')
     else:
-        st.warning(f'{len(df_unique)} new datapoints detected. Click button below to save to master file.')
+        if not df_unique.empty:
+            st.warning(f'{len(df_unique)} new datapoints detected. Click button below to save to master file.')
+        if summary['recorrected_rows']:
+            st.warning(f"{summary['recorrected_rows']} existing datapoints were re-corrected. Click button below to save to master file.")
 
-    if 'Water Level (m)' in df_master.columns:
+    if 'Water Level (m)' in df_window.columns:
         st.write("### Water Level Time Series Plot")
         fig, ax = plt.subplots(figsize=(10, 6))
 
         # If it's new data (no preexisting master file), plot only the new data
         if is_new_master_file:
-            df_master['Water Level (m)'].plot(ax=ax, label="Water Level (New)", color='red', alpha=0.7)
+            df_window['Water Level (m)'].plot(ax=ax, label="Water Level (New)", color='red', alpha=0.7)
         else:
-            # Plot preexisting data (blue)
-            df_master.loc[~df_master.index.isin(df_unique.index), 'Water Level (m)'].plot(ax=ax, label="Water Level (Existing)", color='blue', alpha=0.7)
+            # Plot preexisting data (blue) for the 30 days leading into the new data
+            context_start = df_window.index.min() - pd.Timedelta(days=30)
+            df_context = read_stage_data(site_name, start=context_start, end=df_window.index.max(), columns=['Water Level (m)'])
+            df_context.loc[~df_context.index.isin(df_unique.index), 'Water Level (m)'].plot(ax=ax, label="Water Level (Existing)", color='blue', alpha=0.7)
 
             # Plot new data (red) if there are any new data points
             if not df_unique.empty:
-                df_master.loc[df_master.index.isin(df_unique.index), 'Water Level (m)'].plot(ax=ax, label="Water Level (New)", color='red', alpha=0.7)
+                df_window.loc[df_window.index.isin(df_unique.index), 'Water Level (m)'].plot(ax=ax, label="Water Level (New)", color='red', alpha=0.7)
 
         ax.set_title(f"Water Level Time Series for {site_name}")
         ax.set_xlabel("Datetime")
@@ -163,8 +140,11 @@ if uploaded_file is not None and st.session_state.process_clicked:
 
         st.pyplot(fig)
 
+    # Optional export of the formatted Excel master (the Parquet stage store is the system of record)
+    export_excel = st.checkbox(f"Also export formatted Excel master to {STAGE_MASTER_DIRECTORY}")
+
     if st.button(f"Save to {site_name} Master Stage File"):
-        os.makedirs(output_directory, exist_ok=True)
-        # save_formatted_excel(df_master, output_filepath)
-        save_formatted_stage_file(df_master, output_filepath)
-        st.success(f"Subset saved to {output_filepath}")
+        written_partitions = save_stage_master(site_name, df_window, export_excel=export_excel)
+        st.success(f"Master record for {site_name} saved to the stage store ({len(written_partitions)} monthly partitions updated).")
+        if export_excel:
+            st.success(f"Excel master exported to {STAGE_MASTER_DIRECTORY / f'{site_name}_stage_master.xlsx'}")
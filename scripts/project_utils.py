@@ -1,12 +1,39 @@
 import os
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl import Workbook
+import itertools
+import numpy as np
+from openpyxl import load_workbook
 import pandas as pd
+import xlsxwriter
 from pathlib import Path
-from openpyxl.utils import get_column_letter
-import gspread
-from config import credentials
-from openpyxl.styles import Font, Side, Border
+from openpyxl.utils import get_column_letter, column_index_from_string
+from field_forms import salt_dump_index
+from stage_store import append_stage_data, get_high_water_mark, import_stage_master, read_stage_data, stage_site_exists, stage_site_signature, stage_memory_report, to_stage_frame
+
+# Directory holding the stage master files (legacy Excel masters and optional Excel exports)
+STAGE_MASTER_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Stage\processed")
+
+# BT site providing the barometric data for each non-BT stage site
+BARO_SITES = {
+    'chase_us': 'chase_usBT',
+    'chase_ds': 'chase_usBT',
+    'cat_beacons': 'cat_beaconsBT',
+    'northfield_bridge': 'northfield_poolBT',
+}
+
+# BT sites providing barometric data for each non-BT stage site, in priority order. Gaps in a source
+# are filled from the next one (offset-aligned on their overlap), see get_baro_grid. The first source
+# is the site's BT logger from BARO_SITES; fallbacks are limited to BT loggers at the same site, since
+# barometric pressure at another site is not checked to track the local pressure closely enough.
+BARO_SOURCES = {
+    'chase_us': ['chase_usBT'],
+    'chase_ds': ['chase_usBT'],
+    'cat_beacons': ['cat_beaconsBT'],
+    # northfield_bridgeBT is at the bridge itself, but northfield_poolBT stays primary (see BARO_SITES)
+    'northfield_bridge': ['northfield_poolBT', 'northfield_bridgeBT'],
+}
+
+# Gridded barometric series built during this session with the signature of their sources, see get_baro_grid
+_BARO_GRID_CACHE = {}
 
 # Default decimal formatting
 DEFAULT_DECIMALS = {
@@ -17,9 +44,13 @@ DEFAULT_DECIMALS = {
     'Barometric Pressure (kPa)': 3
 }
 
-def save_formatted_stage_file(df_corrected, output_file, sheet_name='Sheet1', decimals=None):
+def save_formatted_stage_file(df_corrected, output_file, sheet_name='Sheet1', decimals=None, width_sample_size=10000, chunk_size=10000):
     """
-    Formats and saves a DataFrame to an Excel file with OpenPyxl, applying number formatting for display.
+    Formats and saves a DataFrame to an Excel file with XlsxWriter in constant-memory mode.
+
+    Rows are streamed to disk one at a time, number formats are applied once per column and
+    column widths are estimated from an evenly spaced sample, so peak memory does not grow
+    with the number of rows.
 
     Parameters:
     - df_corrected (pd.DataFrame): Data to write to Excel.
@@ -27,11 +58,9 @@ def save_formatted_stage_file(df_corrected, output_file, sheet_name='Sheet1', de
     - sheet_name (str): Name of the sheet in the Excel file.
     - decimals (dict): A dictionary specifying the number of decimal places for each column.
                        If None, defaults to DEFAULT_DECIMALS.
+    - width_sample_size (int): Number of rows sampled to estimate column widths.
+    - chunk_size (int): Number of rows converted and written per chunk.
     """
-    
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
     # Use default decimals if none provided
     if decimals is None:
         decimals = DEFAULT_DECIMALS
@@ -40,138 +69,706 @@ def save_formatted_stage_file(df_corrected, output_file, sheet_name='Sheet1', de
     df_corrected_reset = df_corrected.reset_index()
     df_corrected_reset.rename(columns={'index': 'Datetime'}, inplace=True)
 
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = sheet_name
+    # Evenly spaced sample of rows for the column width estimate
+    n_rows = len(df_corrected_reset)
+    sample_positions = np.unique(np.linspace(0, n_rows - 1, min(n_rows, width_sample_size)).astype(int))
+    df_sample = df_corrected_reset.iloc[sample_positions]
 
-    # Write DataFrame rows to the worksheet
-    for r_idx, row in enumerate(dataframe_to_rows(df_corrected_reset, index=False, header=True), start=1):
-        worksheet.append(row)
+    chunks = (df_corrected_reset.iloc[chunk_start:chunk_start + chunk_size] for chunk_start in range(0, max(n_rows, 1), chunk_size))
+    write_excel_chunks(chunks, output_file, sheet_name=sheet_name, decimals=decimals, df_sample=df_sample)
 
-        # Apply header formatting
-        if r_idx == 1:
-            for cell in worksheet[r_idx]:
-                cell.font = Font(bold=True)
-    
-    # Remove header row borders
-    for cell in worksheet[1]:
-        cell.border = Border(left=Side(border_style=None), 
-                             right=Side(border_style=None), 
-                             top=Side(border_style=None), 
-                             bottom=Side(border_style=None))
-
-    # Adjust column widths and apply number formatting
-    for col_idx, col in enumerate(worksheet.columns, start=1):
-        max_length = 0
-        column = col[0].column_letter  # Get the column name
-        column_name = worksheet.cell(row=1, column=col_idx).value
+def write_excel_chunks(chunks, output_file, sheet_name='Sheet1', decimals=None, df_sample=None, width_sample_size=10000,
+                       metadata_rows=None, header_row=0, header_bold=True):
+    """
+    Streams DataFrame chunks into one Excel sheet with XlsxWriter in constant-memory mode.
 
-        # Adjust column widths
-        for cell in col:
-            if cell.value is not None:
-                max_length = max(max_length, len(str(cell.value)))
-        
-        worksheet.column_dimensions[column].width = max_length + 2  # Add padding
+    Parameters:
+    - chunks (iterable): DataFrames with identical columns, written in order below the header row.
+    - output_file (Path or str): Path to save the Excel file.
+    - sheet_name (str): Name of the sheet in the Excel file.
+    - decimals (dict): Number of decimal places per column, applied as column-level number formats.
+    - df_sample (pd.DataFrame): Rows used to estimate column widths. Defaults to an evenly spaced
+                                sample of the first chunk.
+    - width_sample_size (int): Number of rows sampled from the first chunk when df_sample is None.
+    - metadata_rows (list): Rows of plain values written above the header (e.g. logger metadata).
+    - header_row (int): Zero-based row of the column headers. Must be below the metadata rows.
+    - header_bold (bool): Whether the header row is bold.
+
+    Returns:
+    - n_rows (int): Number of data rows written.
+    """
+    decimals = decimals or {}
+    chunks = iter(chunks)
+    first_chunk = next(chunks, None)
+
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+
+    # Create a new workbook that flushes each row to disk once it is complete
+    workbook = xlsxwriter.Workbook(str(output_file), {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True}) if header_bold else None
+
+    # Metadata rows above the header (rows must be written in order in constant-memory mode)
+    metadata_rows = metadata_rows or []
+    if len(metadata_rows) > header_row:
+        raise ValueError(f"{len(metadata_rows)} metadata rows do not fit above header row {header_row}.")
+    for r_idx, row in enumerate(metadata_rows):
+        for col_idx, value in enumerate(row):
+            if value is not None and not (isinstance(value, float) and value != value):
+                worksheet.write(r_idx, col_idx, value)
+
+    if first_chunk is None:
+        workbook.close()
+        return 0
+
+    if df_sample is None:
+        sample_positions = np.unique(np.linspace(0, len(first_chunk) - 1, min(len(first_chunk), width_sample_size)).astype(int))
+        df_sample = first_chunk.iloc[sample_positions]
+
+    # Column-level formats and widths, and how each column is converted and written
+    column_kinds = []
+    for col_idx, column_name in enumerate(first_chunk.columns):
+        series = first_chunk[column_name]
+        column_format = None
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            column_kinds.append('datetime')
+            column_format = workbook.add_format({'num_format': 'yyyy-mm-dd h:mm:ss'})
+        elif pd.api.types.is_numeric_dtype(series) or (pd.api.types.is_object_dtype(series) and pd.to_numeric(series, errors='coerce').notna().sum() == series.notna().sum()):
+            # Numeric columns (including object columns holding only numbers and missing values)
+            column_kinds.append('number')
+        else:
+            column_kinds.append('other')
 
         # Apply number formatting if column has a decimal specification
         if column_name in decimals:
-            number_format = f"0.{'0' * decimals[column_name]}"
-            for cell in worksheet.iter_cols(min_col=col_idx, max_col=col_idx, min_row=2):
-                for data_cell in cell:
-                    if isinstance(data_cell.value, (int, float)):
-                        data_cell.number_format = number_format
+            column_format = workbook.add_format({'num_format': f"0.{'0' * decimals[column_name]}"})
+
+        # Adjust column widths
+        sample_lengths = df_sample[column_name].dropna().astype(str).str.len()
+        max_length = max(len(str(column_name)), int(sample_lengths.max()) if len(sample_lengths) else 0)
+        worksheet.set_column(col_idx, col_idx, max_length + 2, column_format)  # Add padding
+
+    # Write the header row
+    worksheet.write_row(header_row, 0, [str(column_name) for column_name in first_chunk.columns], header_format)
+
+    # Stream the data rows chunk by chunk; missing values are left blank
+    n_rows = 0
+    for df_chunk in itertools.chain([first_chunk], chunks):
+        column_values = []
+        column_writers = []
+        for column_name, kind in zip(df_chunk.columns, column_kinds):
+            series = df_chunk[column_name]
+            if kind == 'datetime':
+                # Excel serial dates (days since 1899-12-30), written as numbers with a datetime format
+                serial = (series.dt.tz_localize(None) - pd.Timestamp('1899-12-30')) / pd.Timedelta(days=1)
+                column_values.append(serial.to_numpy(dtype='float64').tolist())
+                column_writers.append(worksheet.write_number)
+            elif kind == 'number':
+                column_values.append(pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64').tolist())
+                column_writers.append(worksheet.write_number)
+            else:
+                column_values.append(series.tolist())
+                column_writers.append(worksheet.write)
+
+        for r_idx, row in enumerate(zip(*column_values), start=header_row + n_rows + 1):
+            for col_idx, value in enumerate(row):
+                if value is not None and value == value:
+                    column_writers[col_idx](r_idx, col_idx, value)
+        n_rows += len(df_chunk)
 
     # Save workbook to file
-    workbook.save(output_file)
+    workbook.close()
+    return n_rows
 
-def read_stage_file(file, stats_flag=True):
-    # Determine file type (bluetooth / non-bluetooth) and load file accordingly
-    first_row = pd.read_excel(file, nrows=1, header=None)
-    # Define the column order for master files
-    master_cols = ['Differential Pressure (kPa)', 'Absolute Pressure (kPa)', 'Temperature (°C)', 'Barometric Pressure (kPa)', 'Water Level (m)']
-    
-    # logics for identifying different input file structures
-    if "Plot Title" in str(first_row.iloc[0, 0]): # Non-BT
-        print("Non-BT File Identified. Reading File")
-        # Define the column names you want to read from file and read in data
-        colnames = ['Datetime', 'Absolute Pressure (kPa)', 'Temperature (°C)']
-        df = pd.read_excel(file, header=1, index_col=0, parse_dates=True, usecols="B:D", names=colnames)
-        # Add any missing columns filled with nan
-        for col in master_cols:
-            if col not in df.columns:
-                df[col] = pd.NA
-        # Reorder columns to match final column order
-        df = df[master_cols]
-
-    elif "Date-Time" in str(first_row.iloc[0, 1]) and "Absolute Pressure , kPa" in str(first_row.iloc[0, 3]): # BT sensor without stats
-        print("BT File (no stats) Detected!")
-        colnames = ['Datetime', 'Differential Pressure (kPa)', 'Absolute Pressure (kPa)',
-                     'Temperature (°C)', 'Water Level (m)', 'Barometric Pressure (kPa)']
-        df = pd.read_excel(file, header=0, index_col=0, parse_dates=True, usecols="B:G", names=colnames)
-        # Add any missing columns filled with nan
-        for col in master_cols:
-            if col not in df.columns:
-                df[col] = pd.NA
-        # Reorder columns to match final column order
-        df = df[master_cols]
-        
-    elif "Date-Time" in str(first_row.iloc[0, 1]) and "Differential Pressure - Max , kPa" in str(first_row.iloc[0, 3]) and stats_flag==True: # BT sensor with stats
-        print("BT File (with stats) Detected!")
-        colnames = ['Datetime', 'Differential Pressure (kPa)', 'Absolute Pressure (kPa)',
-                     'Temperature (°C)', 'Water Level (m)', 'Barometric Pressure (kPa)']
-        df = pd.read_excel(file, header=0, index_col=0, parse_dates=True, usecols="B,F,K,P,S,R", names=colnames)
-        # Add any missing columns filled with nan
-        for col in master_cols:
-            if col not in df.columns:
-                df[col] = pd.NA
-        # Reorder columns to match final column order
-        df = df[master_cols]
-        
-    elif "Date-Time" in str(first_row.iloc[0, 1]) and "Differential Pressure - Max , kPa" in str(first_row.iloc[0, 3]) and stats_flag==False: # BT sensor with stats (ignore stats)
-        print("BT File (with stats) Detected!")
-        colnames = ['Datetime', 'Differential Pressure (kPa)', 'Absolute Pressure (kPa)',
-                     'Temperature (°C)', 'Water Level (m)', 'Barometric Pressure (kPa)']
-        df = pd.read_excel(file, header=0, index_col=0, parse_dates=True, usecols="B,C,H,M,S,R", names=colnames)
-        # Add any missing columns filled with nan
-        for col in master_cols:
-            if col not in df.columns:
-                df[col] = pd.NA
-        # Reorder columns to match final column order
-        df = df[master_cols]
-    
-    else:
-        raise ValueError("Unknown file format")
-
-    return df
-
-def read_baro_file(site_name):
-    master_directory = Path(r"H:\tire-toxin\data\Discharge\Stage\processed")
-    # Determine the baro file path (if applicable)
-    if site_name in ['chase_us', 'chase_ds']:
-        baro_file = master_directory / f"chase_usBT_stage_master.xlsx"
-    elif site_name == "cat_beacons":
-        baro_file = master_directory / f"cat_beaconsBT_stage_master.xlsx"
-    elif site_name == "northfield_bridge":
-        baro_file = master_directory / "northfield_poolBT_stage_master.xlsx"
+def compile_stage_column_plan(columns):
+    """
+    Compiles a column mapping into the zero-based sheet positions and names used to pick cells from each row.
+
+    Parameters:
+    - columns (dict): Mapping of Excel column letters to column names, e.g. {'B': 'Datetime', 'C': 'Absolute Pressure (kPa)'}.
+
+    Returns:
+    - plan (tuple): (positions, names) sorted by sheet position.
+    """
+    plan = sorted((column_index_from_string(letter) - 1, name) for letter, name in columns.items())
+    positions = tuple(position for position, _ in plan)
+    names = [name for _, name in plan]
+    return positions, names
+
+def register_stage_format(name, signature, header_row, columns, message, stats=None, position=None):
+    """
+    Registers a HOBO stage export layout so read_stage_file can recognise it from its first row.
+
+    Parameters:
+    - name (str): Short identifier of the layout.
+    - signature (list): (column position, text) pairs that must all appear in the first row of the sheet.
+    - header_row (int): Zero-based row of the column headers; data starts on the following row.
+    - columns (dict): Mapping of Excel column letters to names. The 'Datetime' column becomes the index.
+    - message (str): Message printed when the layout is detected.
+    - stats (bool): If set, the layout only matches when read_stage_file's stats_flag equals this value.
+    - position (int): Position in the registry (layouts are checked in order). Appends by default.
+    """
+    descriptor = {
+        'name': name,
+        'signature': list(signature),
+        'header_row': header_row,
+        'plan': compile_stage_column_plan(columns),
+        'message': message,
+        'stats': stats,
+    }
+    STAGE_FILE_FORMATS.insert(len(STAGE_FILE_FORMATS) if position is None else position, descriptor)
+
+def detect_stage_format(first_row, stats_flag=True):
+    """
+    Classifies a stage export from the values of its first row.
+
+    Parameters:
+    - first_row (tuple): Cell values of the first sheet row.
+    - stats_flag (bool): Whether statistic columns should be used when available.
+
+    Returns:
+    - descriptor (dict or None): The matching entry of STAGE_FILE_FORMATS, or None if no layout matches.
+    """
+    for descriptor in STAGE_FILE_FORMATS:
+        if descriptor['stats'] is not None and descriptor['stats'] != stats_flag:
+            continue
+        if all(position < len(first_row) and text in str(first_row[position])
+               for position, text in descriptor['signature']):
+            return descriptor
+    return None
+
+# Registry of known HOBO stage export layouts
+STAGE_FILE_FORMATS = []
+register_stage_format(
+    'non_bt', [(0, "Plot Title")], header_row=1,
+    columns={'B': 'Datetime', 'C': 'Absolute Pressure (kPa)', 'D': 'Temperature (°C)'},
+    message="Non-BT File Identified. Reading File",
+)
+register_stage_format(
+    'bt', [(1, "Date-Time"), (3, "Absolute Pressure , kPa")], header_row=0,
+    columns={'B': 'Datetime', 'C': 'Differential Pressure (kPa)', 'D': 'Absolute Pressure (kPa)',
+             'E': 'Temperature (°C)', 'F': 'Water Level (m)', 'G': 'Barometric Pressure (kPa)'},
+    message="BT File (no stats) Detected!",
+)
+register_stage_format(
+    'bt_stats', [(1, "Date-Time"), (3, "Differential Pressure - Max , kPa")], header_row=0,
+    columns={'B': 'Datetime', 'F': 'Differential Pressure (kPa)', 'K': 'Absolute Pressure (kPa)',
+             'P': 'Temperature (°C)', 'R': 'Water Level (m)', 'S': 'Barometric Pressure (kPa)'},
+    message="BT File (with stats) Detected!", stats=True,
+)
+register_stage_format(
+    'bt_stats_ignored', [(1, "Date-Time"), (3, "Differential Pressure - Max , kPa")], header_row=0,
+    columns={'B': 'Datetime', 'C': 'Differential Pressure (kPa)', 'H': 'Absolute Pressure (kPa)',
+             'M': 'Temperature (°C)', 'R': 'Water Level (m)', 'S': 'Barometric Pressure (kPa)'},
+    message="BT File (with stats) Detected!", stats=False,
+)
+
+def iter_sheet_rows(file, chunk_size=50000):
+    """
+    Streams the rows of the first sheet of a workbook in read-only mode, in lists of at most chunk_size rows.
+
+    Parameters:
+    - file (Path, str or file-like): Excel workbook (.xlsx).
+    - chunk_size (int): Maximum number of rows per yielded list.
+
+    Yields:
+    - rows (list): Tuples of cell values. The first list holds the first rows of the sheet (headers
+                   and metadata included), so callers can inspect them before parsing data.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(values_only=True)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        workbook.close()
+
+def iter_sheet_records(file, select, chunk_size=50000):
+    """
+    Streams data records from the first sheet of a workbook, picking cells at fixed positions from every data row.
+
+    Parameters:
+    - file (Path, str or file-like): Excel workbook (.xlsx).
+    - select (callable): Called with an iterator over the sheet rows. It consumes the header/metadata
+                         rows and returns the zero-based positions of the cells to pick from each data row.
+    - chunk_size (int): Maximum number of sheet rows per yielded list of records.
+
+    Yields:
+    - records (list): Lists of picked cell values (rows where all picked cells are empty are skipped).
+    """
+    rows = itertools.chain.from_iterable(iter_sheet_rows(file, chunk_size))
+    positions = select(rows)
+
+    width = max(positions) + 1
+    while True:
+        records = []
+        n_read = 0
+        for row in itertools.islice(rows, chunk_size):
+            n_read += 1
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            record = [row[position] for position in positions]
+            if any(value is not None for value in record):
+                records.append(record)
+        if n_read == 0:
+            break
+        if records:
+            yield records
+
+def iter_stage_file(file, stats_flag=True, float_dtype='float64', chunk_size=50000):
+    """
+    Reads a HOBO stage export as a stream of typed DataFrame chunks with bounded memory.
+
+    The workbook is opened once in read-only mode, the layout is classified from the first row
+    against STAGE_FILE_FORMATS, and the matching column plan picks the cells of every data row.
+    Rows sharing the last timestamp of a chunk are carried into the next chunk, so duplicated
+    timestamps are never split across chunks.
+
+    Parameters:
+    - file (Path, str or file-like): HOBO export (.xlsx).
+    - stats_flag (bool): Whether statistic columns should be used when available.
+    - float_dtype (str): 'float64' (default) or 'float32' for the master columns.
+    - chunk_size (int): Approximate number of rows per chunk.
+
+    Yields:
+    - df (pd.DataFrame): Stage data with a datetime64 index named 'Datetime' and typed float master
+                         columns in master order (see stage_store.to_stage_frame).
+    """
+    detected = {}
+
+    def select(rows):
+        # Determine file type (bluetooth / non-bluetooth) from the first row
+        descriptor = detect_stage_format(next(rows, ()), stats_flag)
+        if descriptor is None:
+            raise ValueError("Unknown file format")
+        print(descriptor['message'])
+        detected['names'] = descriptor['plan'][1]
+
+        # Skip the remaining rows up to and including the header row
+        for _ in range(descriptor['header_row']):
+            next(rows, None)
+        return descriptor['plan'][0]
+
+    carry = None
+    for records in iter_sheet_records(file, select, chunk_size):
+        # Validate and type the chunk (missing master columns are added as NaN, in master order)
+        df = pd.DataFrame.from_records(records, columns=detected['names']).set_index('Datetime')
+        df = to_stage_frame(df, float_dtype=float_dtype)
+        if carry is not None:
+            df = pd.concat([carry, df])
+        # Hold back the rows of the last timestamp until the next chunk
+        tail = df.index == df.index[-1]
+        carry, df = df[tail], df[~tail]
+        if not df.empty:
+            yield df
+
+    if carry is not None and not carry.empty:
+        yield carry
+
+def register_ec_format(name, header_row, dt_col, ec_col, position=None):
+    """
+    Registers an EC logger export layout for sniff_ec_file.
+
+    Parameters:
+    - name (str): Layout name.
+    - header_row (int): Zero-based row of the column headers (rows above it hold logger metadata).
+    - dt_col (str): Header of the datetime column.
+    - ec_col (str): Header of the temperature-compensated EC column.
+    - position (int): Index in EC_FILE_FORMATS to insert at (layouts are tried in order). Defaults to the end.
+    """
+    descriptor = {'name': name, 'header_row': header_row, 'dt_col': dt_col, 'ec_col': ec_col}
+    if position is None:
+        EC_FILE_FORMATS.append(descriptor)
     else:
-        baro_file = None
-        df_baro = None
+        EC_FILE_FORMATS.insert(position, descriptor)
+    return descriptor
+
+# Known EC export layouts, tried in order by sniff_ec_file
+EC_FILE_FORMATS = []
+register_ec_format('at', header_row=0, dt_col='DT', ec_col='EC.T')
+register_ec_format('qiquac', header_row=3, dt_col='DateTime', ec_col='EC.T(uS/cm)')
+register_ec_format('qiquac_no_metadata', header_row=0, dt_col='DateTime', ec_col='EC.T(uS/cm)')
+register_ec_format('processed', header_row=0, dt_col='Datetime', ec_col='EC.T')
+
+def sniff_ec_file(file, n_rows=20):
+    """
+    Identifies the layout of an EC logger export from its first rows only.
+
+    The first n_rows rows are streamed in read-only mode and matched against EC_FILE_FORMATS. If no known
+    layout matches, the first row holding a datetime (after 2020) in any column is taken as the first data
+    row, using one vectorized datetime conversion per column of the prefix.
+
+    Parameters:
+    - file (Path, str or file-like): EC export (.xlsx).
+    - n_rows (int): Number of rows read for the sniff.
+
+    Returns:
+    - layout (dict): 'name' (layout name, or 'detected'), 'header_row', 'dt_col', 'ec_col' (None if no EC.T
+                     column is found), 'columns' (header names) and 'metadata' (rows above the header,
+                     without trailing empty rows).
+
+    Raises:
+    - ValueError: If no datetime values are found in the first n_rows rows.
+    """
+    rows = iter_sheet_rows(file, chunk_size=n_rows)
+    try:
+        prefix = next(rows, [])
+    finally:
+        rows.close()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    def header_names(row_idx):
+        return [str(value).strip() if value is not None else None for value in prefix[row_idx]]
+
+    def layout(name, header_row, dt_col, ec_col):
+        metadata = [list(row) for row in prefix[:header_row]]
+        while metadata and all(value is None for value in metadata[-1]):
+            metadata.pop()
+        return {'name': name, 'header_row': header_row, 'dt_col': dt_col, 'ec_col': ec_col,
+                'columns': header_names(header_row), 'metadata': metadata}
+
+    # Known layouts by signature
+    for descriptor in EC_FILE_FORMATS:
+        if descriptor['header_row'] < len(prefix):
+            names = header_names(descriptor['header_row'])
+            if descriptor['dt_col'] in names and descriptor['ec_col'] in names:
+                return layout(descriptor['name'], descriptor['header_row'], descriptor['dt_col'], descriptor['ec_col'])
+
+    # Fall back to the first row holding a datetime
+    width = max((len(row) for row in prefix), default=0)
+    df_prefix = pd.DataFrame([tuple(row) + (None,) * (width - len(row)) for row in prefix], dtype=object)
+    is_datetime = pd.DataFrame({
+        col: pd.to_datetime(df_prefix[col], errors='coerce', format='mixed').dt.year.gt(2020)
+        for col in df_prefix.columns
+    })
+    datetime_rows = np.flatnonzero(is_datetime.any(axis=1).to_numpy())
+    if len(datetime_rows) == 0 or datetime_rows[0] == 0:
+        raise ValueError("No datetime values found in the file. Please check the file format.")
+
+    first_data_row = int(datetime_rows[0])
+    header_row = first_data_row - 1
+    names = header_names(header_row)
+    dt_col = names[int(np.flatnonzero(is_datetime.iloc[first_data_row].to_numpy())[0])]
+    ec_col = next((name for name in names if name is not None and name.startswith('EC.T')), None)
+    return layout('detected', header_row, dt_col, ec_col)
+
+def iter_ec_file(file, columns=None, dt_col='DT', chunk_size=50000, header_row=0):
+    """
+    Reads an EC logger export (e.g. AT-series 'DT'/'EC.T') as typed DataFrame chunks.
+
+    Parameters:
+    - file (Path, str or file-like): EC export (.xlsx).
+    - columns (list): Columns to read. None reads every named column.
+    - dt_col (str): Datetime column, parsed to datetime64 (tz-naive).
+    - chunk_size (int): Number of rows per chunk.
+    - header_row (int): Zero-based row of the column headers (see sniff_ec_file). Rows above it are skipped.
+
+    Yields:
+    - df (pd.DataFrame): Chunk with dt_col as datetime64 and the other columns float64 where numeric,
+                         indexed by row number in the file.
+
+    Raises:
+    - ValueError: If a requested column is not in the header row.
+    """
+    selected = {}
+
+    def select(rows):
+        for _ in range(header_row):
+            next(rows, None)
+        header = [str(value) if value is not None else None for value in next(rows, ())]
+        names = [name for name in header if name is not None] if columns is None else list(columns)
+        missing = [name for name in names if name not in header]
+        if missing:
+            raise ValueError(f"Columns not found in {file}: {missing}")
+        selected['names'] = names
+        return [header.index(name) for name in names]
+
+    n_rows = 0
+    for records in iter_sheet_records(file, select, chunk_size):
+        df = pd.DataFrame.from_records(records, columns=selected['names'])
+        df.index = pd.RangeIndex(n_rows, n_rows + len(df))
+        n_rows += len(df)
+        for col in df.columns:
+            if col == dt_col:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+                if df[col].dt.tz is not None:
+                    df[col] = df[col].dt.tz_localize(None)
+            else:
+                values = pd.to_numeric(df[col], errors='coerce')
+                # Keep text columns (e.g. logger notes) as they are; numbers are float64 in every chunk
+                if values.notna().sum() == df[col].notna().sum():
+                    df[col] = values.astype('float64')
+        yield df
+
+def write_ec_dump(df, output_file, metadata_rows=None, header_row=None, copy_format=None):
+    """
+    Writes one salt wave window in a single pass: logger metadata rows, a plain header row and the data.
+
+    Parameters:
+    - df (pd.DataFrame): Window of the EC export (columns as in the source file).
+    - output_file (Path or str): Excel file to write (.xlsx).
+    - metadata_rows (list): Logger metadata rows written above the header (see sniff_ec_file).
+    - header_row (int): Zero-based row of the column headers. Defaults to the row after the metadata.
+    - copy_format (str): Also write a compact copy next to the Excel file: 'parquet', 'csv' or None.
+
+    Returns:
+    - written_files (list): Paths of the files written.
+    """
+    metadata_rows = metadata_rows or []
+    if header_row is None:
+        header_row = len(metadata_rows)
+
+    write_excel_chunks([df], output_file, metadata_rows=metadata_rows, header_row=header_row, header_bold=False)
+    written_files = [Path(output_file)]
+
+    # Compact copy of the data alone, for the discharge computation
+    if copy_format == 'parquet':
+        written_files.append(Path(output_file).with_suffix('.parquet'))
+        df.to_parquet(written_files[-1], index=False)
+    elif copy_format == 'csv':
+        written_files.append(Path(output_file).with_suffix('.csv'))
+        df.to_csv(written_files[-1], index=False)
+    elif copy_format is not None:
+        raise ValueError(f"Invalid copy format: {copy_format}. Expected 'parquet', 'csv' or None.")
+    return written_files
+
+def unstack_ec_timestamps(df, dt_col='Datetime', interval=pd.Timedelta(seconds=5)):
+    """
+    Spreads "stacked" EC readings back over the logging gap they belong to.
+
+    When a logger stops recording and later dumps its buffer, the buffered rows are all stamped
+    with the time of the dump. Each contiguous run of identical timestamps is retimed onto the
+    logger's grid, starting one interval after the preceding reading (as in TM7_timestamp_correction.m).
+    Rows of a run that do not fit into the gap keep their original timestamp. Values are not changed.
+
+    Parameters:
+    - df (pd.DataFrame): EC data in logger order with a datetime column.
+    - dt_col (str): Datetime column.
+    - interval (pd.Timedelta or None): Logger interval. None uses the median step between distinct readings.
+
+    Returns:
+    - df_corrected (pd.DataFrame): Copy of the data with the stacked runs retimed.
+    - report (pd.DataFrame): One row per stacked run: first row position, number of rows, gap start and end,
+                             gap length (s), number of grid slots in the gap, rows retimed and rows left stacked.
+    """
+    report_columns = ['start_row', 'n_rows', 'gap_start', 'gap_end', 'gap_seconds', 'grid_slots', 'rows_retimed', 'rows_unresolved']
+    df_corrected = df.copy()
+    times = pd.to_datetime(df[dt_col]).to_numpy(dtype='datetime64[ns]')
+    n = len(times)
+    if n < 2:
+        return df_corrected, pd.DataFrame(columns=report_columns)
+
+    # Contiguous runs of identical timestamps, found in one pass
+    run_starts = np.flatnonzero(np.r_[True, times[1:] != times[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, n])
+    stacked = run_lengths > 1
+    starts, lengths = run_starts[stacked], run_lengths[stacked]
+    if len(starts) == 0:
+        return df_corrected, pd.DataFrame(columns=report_columns)
+
+    if interval is None:
+        steps = np.diff(times[run_starts])
+        interval = pd.Timedelta(np.median(steps)) if len(steps) else pd.Timedelta(seconds=5)
+    step = np.timedelta64(pd.Timedelta(interval).value, 'ns')
+
+    # The gap runs from the reading before the run to the run's timestamp (no gap for a run at the first row)
+    gap_end = times[starts]
+    gap_start = np.where(starts > 0, times[np.maximum(starts - 1, 0)], gap_end)
+    grid_slots = np.maximum((gap_end - gap_start) // step, 0).astype(np.int64)
+    rows_retimed = np.minimum(lengths, grid_slots)
+
+    # Row positions and offsets within each run, built with array arithmetic
+    run_ids = np.repeat(np.arange(len(starts)), rows_retimed)
+    offsets = np.arange(len(run_ids)) - np.repeat(np.cumsum(rows_retimed) - rows_retimed, rows_retimed)
+    positions = starts[run_ids] + offsets
+    new_times = times.copy()
+    new_times[positions] = gap_start[run_ids] + (offsets + 1) * step
+
+    col_position = df_corrected.columns.get_loc(dt_col)
+    df_corrected[dt_col] = pd.to_datetime(df_corrected[dt_col])
+    df_corrected.iloc[:, col_position] = new_times
+
+    report = pd.DataFrame({
+        'start_row': starts,
+        'n_rows': lengths,
+        'gap_start': gap_start,
+        'gap_end': gap_end,
+        'gap_seconds': (gap_end - gap_start) / np.timedelta64(1, 's'),
+        'grid_slots': grid_slots,
+        'rows_retimed': rows_retimed,
+        'rows_unresolved': lengths - rows_retimed,
+    }, columns=report_columns)
+    return df_corrected, report
+
+def decimate_minmax(values, max_points=2000):
+    """
+    Selects the samples to plot so a long series keeps its shape with a bounded number of points.
+
+    The series is split into about max_points / 2 equal bins and the minimum and maximum of each bin are kept,
+    so peaks and spikes survive the decimation. Missing values are never selected unless a bin has nothing else.
+
+    Parameters:
+    - values (array-like): Values in plotting order.
+    - max_points (int): Upper bound on the number of selected samples.
+
+    Returns:
+    - indices (np.ndarray): Sorted positions of the selected samples (every position if the series is short enough).
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+
+    bin_size = int(np.ceil(n / max((max_points - 2) // 2, 1)))
+    n_bins = int(np.ceil(n / bin_size))
+    padded = np.full(n_bins * bin_size, np.nan)
+    padded[:n] = values
+    bins = padded.reshape(n_bins, bin_size)
+
+    # Missing values rank last for both the minimum and the maximum
+    missing = np.isnan(bins)
+    bin_starts = np.arange(n_bins) * bin_size
+    idx_min = bin_starts + np.argmin(np.where(missing, np.inf, bins), axis=1)
+    idx_max = bin_starts + np.argmax(np.where(missing, -np.inf, bins), axis=1)
+
+    indices = np.unique(np.concatenate([[0, n - 1], idx_min, idx_max]))
+    return indices[indices < n]
+
+def read_stage_file(file, stats_flag=True, float_dtype='float64'):
+    """
+    Reads a HOBO stage export in a single streaming pass (the chunks of iter_stage_file, concatenated).
+
+    Parameters:
+    - file (Path, str or file-like): HOBO export (.xlsx).
+    - stats_flag (bool): Whether statistic columns should be used when available.
+    - float_dtype (str): 'float64' (default) or 'float32' for the master columns.
+
+    Returns:
+    - df (pd.DataFrame): Stage data with a datetime64 index named 'Datetime' and typed float master
+                         columns in master order (see stage_store.to_stage_frame).
+    """
+    chunks = list(iter_stage_file(file, stats_flag=stats_flag, float_dtype=float_dtype))
+    if not chunks:
+        return to_stage_frame(pd.DataFrame(index=pd.DatetimeIndex([], name='Datetime')), float_dtype=float_dtype)
+    return pd.concat(chunks)
+
+def import_legacy_stage_master(site_name, master_directory=None, root=None):
+    """
+    Imports a site's legacy *_stage_master.xlsx file into the stage store if the site is not stored yet.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - master_directory (Path or str): Directory of the legacy Excel masters. Defaults to STAGE_MASTER_DIRECTORY.
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+
+    Returns:
+    - exists (bool): True if the site has a record in the store after the call.
+    """
+    if stage_site_exists(site_name, root):
+        return True
+
+    master_directory = Path(master_directory if master_directory is not None else STAGE_MASTER_DIRECTORY)
+    legacy_file = master_directory / f"{site_name}_stage_master.xlsx"
+    if not legacy_file.exists():
+        return False
+
+    print(f"Importing {legacy_file} into the stage store.")
+    import_stage_master(site_name, legacy_file, root=root)
+    return True
+
+def load_stage_master(site_name, master_directory=None, root=None, start=None, end=None, columns=None):
+    """
+    Loads a site's master stage record from the Parquet stage store.
+
+    Sites that only have a legacy *_stage_master.xlsx file are imported into the store on first use.
+
+    Parameters:
+    - site_name (str): Stage site name (e.g. 'chase_us', 'chase_usBT').
+    - master_directory (Path or str): Directory of the legacy Excel masters. Defaults to STAGE_MASTER_DIRECTORY.
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+    - start, end (str or pd.Timestamp): Optional inclusive time range to read.
+    - columns (list): Optional subset of master columns to read.
 
-    if baro_file is not None and baro_file.exists():
-        df_baro = pd.read_excel(baro_file, header=0, index_col=0, parse_dates=True)
-        if df_baro.index.name != 'Datetime':
-            df_baro.index.name = 'Datetime'
+    Returns:
+    - df_master (pd.DataFrame or None): Master stage data indexed by Datetime, or None if the site has no record.
+    """
+    if not import_legacy_stage_master(site_name, master_directory, root):
+        return None
+
+    return read_stage_data(site_name, start=start, end=end, columns=columns, root=root)
+
+def save_stage_master(site_name, df_master, root=None, export_excel=False, master_directory=None):
+    """
+    Saves master stage data to the Parquet stage store and optionally exports the formatted Excel master.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - df_master (pd.DataFrame): Stage data indexed by Datetime. Only the monthly partitions whose content
+                                changes are rewritten.
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+    - export_excel (bool): Also write the full site record to {site_name}_stage_master.xlsx.
+    - master_directory (Path or str): Directory of the Excel export. Defaults to STAGE_MASTER_DIRECTORY.
+
+    Returns:
+    - written_partitions (list): Month keys ('YYYY-MM') of the partitions that were written.
+    """
+    written_partitions = append_stage_data(site_name, df_master, root=root)
+
+    # Gridded barometric series built from this site are now out of date
+    if 'BT' in site_name and written_partitions:
+        clear_baro_grid_cache()
 
-    return df_baro
+    if export_excel:
+        master_directory = Path(master_directory if master_directory is not None else STAGE_MASTER_DIRECTORY)
+        save_formatted_stage_file(read_stage_data(site_name, root=root), master_directory / f"{site_name}_stage_master.xlsx")
+
+    return written_partitions
+
+def read_baro_file(site_name, root=None, start=None, end=None):
+    # Determine the BT site carrying the barometric data (if applicable)
+    baro_site = BARO_SITES.get(site_name)
+    if baro_site is None:
+        return None
+
+    return load_stage_master(baro_site, root=root, start=start, end=end, columns=['Barometric Pressure (kPa)'])
+
+def prepare_baro_series(df_baro):
+    """
+    Reduces a barometric DataFrame to a sorted, duplicate-free float series for correction lookups.
+
+    Parameters:
+    - df_baro (pd.DataFrame): DataFrame containing a 'Barometric Pressure (kPa)' column with a datetime index.
+
+    Returns:
+    - baro (pd.Series): Valid barometric pressures indexed by unique, sorted timestamps. Duplicate
+                        timestamps are averaged so that lookups do not depend on file order.
+    """
+    baro = pd.to_numeric(df_baro['Barometric Pressure (kPa)'], errors='coerce').astype('float64')
+    baro.index = pd.DatetimeIndex(pd.to_datetime(df_baro.index)).astype('datetime64[ns]')
+    baro = baro[baro.notna() & baro.index.notna()]
+    # groupby sorts the index and collapses duplicated baro timestamps deterministically
+    baro = baro.groupby(level=0).mean()
+    baro.index.name = 'Datetime'
+    return baro
 
-def calculate_differential_pressure(df, df_baro):
+def calculate_differential_pressure(df, df_baro, tolerance=pd.Timedelta(minutes=10)):
     """
     Calculates Differential Pressure (kPa) based on Absolute Pressure and Barometric Pressure.
 
+    All missing rows are matched to the nearest barometric reading in a single vectorized sorted merge.
+
     Parameters:
     - df (pd.DataFrame): DataFrame containing 'Absolute Pressure (kPa)' and 'Differential Pressure (kPa)' columns.
     - df_baro (pd.DataFrame): DataFrame containing the barometric pressure data for the correction in a 'Barometric Pressure (kPa)' column.
+    - tolerance (pd.Timedelta): Maximum distance to the nearest barometric reading, default is 10 minutes.
 
     Returns:
     - df (pd.DataFrame): DataFrame with 'Differential Pressure (kPa)' filled for missing values.
@@ -181,50 +778,258 @@ def calculate_differential_pressure(df, df_baro):
     corrected_baro_count = 0
     failed_baro_count = 0
 
-    duplicated_rows = df_baro[df_baro.index.duplicated(keep=False)]
+    # Apply correction only to rows where 'Differential Pressure (kPa)' is missing
+    if 'Differential Pressure (kPa)' not in df.columns:
+        return df, corrected_baro_count, failed_baro_count
 
-    # Sort the duplicated rows by index
-    duplicated_rows_sorted = duplicated_rows.sort_index()
+    # Proceed only for rows where Absolute Pressure is available
+    absolute_pressure = pd.to_numeric(df['Absolute Pressure (kPa)'], errors='coerce').to_numpy(dtype='float64')
+    missing_data_mask = df['Differential Pressure (kPa)'].isna().to_numpy() & ~np.isnan(absolute_pressure)
+    if not missing_data_mask.any():
+        return df, corrected_baro_count, failed_baro_count
 
-    # Export the sorted duplicated rows to an Excel file
-    duplicated_rows_sorted.to_excel('duplicated_rows_sorted.xlsx', index=True)
+    baro = prepare_baro_series(df_baro)
+    baro_times = baro.index.asi8
+    baro_values = baro.to_numpy()
 
-    # Apply correction only to rows where 'Differential Pressure (kPa)' is missing
-    if 'Differential Pressure (kPa)' in df.columns:
-        missing_data_mask = df['Differential Pressure (kPa)'].isna()
-
-        # If there are rows with missing data
-        if missing_data_mask.any():
-            for idx, row in df[missing_data_mask].iterrows():
-                # Proceed only if Absolute Pressure is available
-                if pd.notna(row['Absolute Pressure (kPa)']):
-                    row_time = pd.to_datetime(row.name)
-
-                    # Attempt to find the nearest time
-                    nearest_idx = df_baro.index.get_indexer([row_time], method='nearest')[0]
-                    nearest_time = df_baro.index[nearest_idx]
-
-                    # Check if the nearest time is within the 10-minute threshold
-                    if abs(nearest_time - row_time) <= pd.Timedelta(minutes=10):
-                        barometric_pressure = df_baro.loc[nearest_time, 'Barometric Pressure (kPa)']
-
-                        # Calculate Differential Pressure
-                        diff_pressure = row['Absolute Pressure (kPa)'] - barometric_pressure
-                        df.at[idx, 'Differential Pressure (kPa)'] = diff_pressure
-                        corrected_baro_count += 1
-                    else:
-                        # Nearest time is outside the valid range
-                        failed_baro_count += 1
+    # Positions (not labels) are used so duplicated timestamps in df are written back correctly
+    positions = np.flatnonzero(missing_data_mask)
+    row_times = pd.DatetimeIndex(pd.to_datetime(df.index[positions])).astype('datetime64[ns]').asi8
+
+    if len(baro_times) > 0:
+        # Sorted merge: locate each row between its two neighbouring baro readings in one pass
+        right = np.searchsorted(baro_times, row_times, side='left').clip(0, len(baro_times) - 1)
+        left = (right - 1).clip(0, len(baro_times) - 1)
+        # Ties resolve to the later reading, matching Index.get_indexer(method='nearest')
+        nearest = np.where(np.abs(baro_times[right] - row_times) <= np.abs(row_times - baro_times[left]), right, left)
+        found = np.abs(baro_times[nearest] - row_times) <= pd.Timedelta(tolerance).value
+    else:
+        nearest = np.zeros(len(positions), dtype=np.intp)
+        found = np.zeros(len(positions), dtype=bool)
+
+    corrected_positions = positions[found]
+    diff_pressure = absolute_pressure[corrected_positions] - baro_values[nearest[found]]
+
+    column_idx = df.columns.get_loc('Differential Pressure (kPa)')
+    df.iloc[corrected_positions, column_idx] = diff_pressure
+
+    corrected_baro_count = int(found.sum())
+    failed_baro_count = int(len(found) - corrected_baro_count)
 
     return df, corrected_baro_count, failed_baro_count
 
-def calculate_water_level(df, g=9.81):
+def interpolate_baro_to_grid(baro, grid_times, max_gap=pd.Timedelta(minutes=20)):
+    """
+    Time-interpolates a barometric series onto grid timestamps, leaving gaps longer than max_gap empty.
+
+    Parameters:
+    - baro (pd.Series): Barometric pressures from prepare_baro_series.
+    - grid_times (np.ndarray): Grid timestamps as int64 nanoseconds.
+    - max_gap (pd.Timedelta): Longest gap between two readings that is bridged by interpolation.
+
+    Returns:
+    - values (np.ndarray): Interpolated pressures on the grid (NaN where no valid reading brackets the point).
+    """
+    times = baro.index.asi8
+    values = baro.to_numpy(dtype='float64')
+    grid_values = np.full(len(grid_times), np.nan)
+    if len(times) == 0:
+        return grid_values
+
+    right = np.searchsorted(times, grid_times, side='left')
+    exact = (right < len(times)) & (times[right.clip(0, len(times) - 1)] == grid_times)
+    grid_values[exact] = values[right[exact]]
+
+    # Linear interpolation between the two readings bracketing each grid point
+    inside = ~exact & (right > 0) & (right < len(times))
+    left_idx, right_idx = right[inside] - 1, right[inside]
+    span = times[right_idx] - times[left_idx]
+    bridged = span <= pd.Timedelta(max_gap).value
+    weight = (grid_times[inside] - times[left_idx]) / span
+    interpolated = values[left_idx] + weight * (values[right_idx] - values[left_idx])
+    grid_values[np.flatnonzero(inside)[bridged]] = interpolated[bridged]
+    return grid_values
+
+def build_baro_grid(sources, freq='1min', max_gap=pd.Timedelta(minutes=20), align_offsets=True):
+    """
+    Builds a regularly gridded barometric series from one or more sources in priority order.
+
+    Parameters:
+    - sources (list): (name, pd.Series) pairs from prepare_baro_series, highest priority first.
+    - freq (str): Grid spacing, default is 1 minute.
+    - max_gap (pd.Timedelta): Longest gap within one source that is bridged by interpolation.
+    - align_offsets (bool): Shift each fallback source by its median difference to the already filled
+                            grid on their overlap, so elevation differences between loggers do not
+                            introduce steps where gaps are filled.
+
+    Returns:
+    - baro_grid (dict or None): 'start' and 'step' (int nanoseconds), 'values' (float array),
+                                'source' (index into 'source_names' per grid point, -1 if empty) and
+                                'source_names'. None if no source holds data.
+    """
+    sources = [(name, baro) for name, baro in sources if baro is not None and len(baro) > 0]
+    if not sources:
+        return None
+
+    step = pd.Timedelta(freq).value
+    start = min(baro.index[0] for _, baro in sources).floor(freq).value
+    end = max(baro.index[-1] for _, baro in sources).ceil(freq).value
+    grid_times = np.arange(start, end + step, step, dtype='int64')
+
+    values = np.full(len(grid_times), np.nan)
+    source = np.full(len(grid_times), -1, dtype='int8')
+    for source_idx, (_, baro) in enumerate(sources):
+        source_values = interpolate_baro_to_grid(baro, grid_times, max_gap)
+        if source_idx > 0 and align_offsets:
+            overlap = ~np.isnan(values) & ~np.isnan(source_values)
+            if overlap.any():
+                source_values += np.median(values[overlap] - source_values[overlap])
+        # Fill only the points not covered by a higher priority source
+        fill = np.isnan(values) & ~np.isnan(source_values)
+        values[fill] = source_values[fill]
+        source[fill] = source_idx
+
+    return {'start': start, 'step': step, 'values': values, 'source': source,
+            'source_names': [name for name, _ in sources]}
+
+def lookup_baro_grid(baro_grid, times):
+    """
+    Looks up barometric pressures for timestamps by index arithmetic on the grid (no searching).
+
+    Parameters:
+    - baro_grid (dict): Grid from build_baro_grid.
+    - times (array-like): Timestamps to look up.
+
+    Returns:
+    - values (np.ndarray): Pressures linearly interpolated between the two neighbouring grid points
+                           (NaN outside the grid or in gaps).
+    """
+    times = pd.DatetimeIndex(pd.to_datetime(times)).astype('datetime64[ns]').asi8
+    grid_values = baro_grid['values']
+    position = (times - baro_grid['start']) / baro_grid['step']
+    values = np.full(len(times), np.nan)
+
+    valid = (position >= 0) & (position <= len(grid_values) - 1)
+    lower = np.floor(position[valid]).astype(np.intp).clip(0, max(len(grid_values) - 2, 0))
+    upper = (lower + 1).clip(0, len(grid_values) - 1)
+    weight = position[valid] - lower
+    values[valid] = grid_values[lower] * (1 - weight) + grid_values[upper] * weight
+    # Points falling exactly on a grid point do not depend on the neighbouring value
+    on_grid = weight == 0
+    values[np.flatnonzero(valid)[on_grid]] = grid_values[lower[on_grid]]
+    return values
+
+def get_baro_grid(site_name, root=None, freq='1min', max_gap=pd.Timedelta(minutes=20), refresh=False):
+    """
+    Returns the gridded barometric series for a site, building it once per session.
+
+    The BT records listed in BARO_SOURCES are merged in priority order. The grid is cached, so every
+    file corrected in a session (or batch) reuses it; sites sharing the same sources share one grid.
+    The cached grid is rebuilt once any source's stored partitions change, including writes by another
+    process (e.g. batch_process_stage_data.py while the Streamlit app is running).
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+    - freq (str): Grid spacing, default is 1 minute.
+    - max_gap (pd.Timedelta): Longest gap within one source that is bridged by interpolation.
+    - refresh (bool): Rebuild the grid even if it is cached.
+
+    Returns:
+    - baro_grid (dict or None): Grid from build_baro_grid, or None if the site has no barometric source.
+    """
+    source_sites = BARO_SOURCES.get(site_name)
+    if source_sites is None:
+        return None
+
+    cache_key = (tuple(source_sites), str(root), freq, pd.Timedelta(max_gap))
+    # Taken before reading, so a write during the build invalidates the grid on the next call
+    signature = tuple(stage_site_signature(baro_site, root) for baro_site in source_sites)
+    cached = _BARO_GRID_CACHE.get(cache_key)
+    if refresh or cached is None or cached[0] != signature:
+        sources = []
+        for baro_site in source_sites:
+            df_baro = load_stage_master(baro_site, root=root, columns=['Barometric Pressure (kPa)'])
+            if df_baro is not None:
+                sources.append((baro_site, prepare_baro_series(df_baro)))
+        cached = (signature, build_baro_grid(sources, freq=freq, max_gap=max_gap))
+        _BARO_GRID_CACHE[cache_key] = cached
+
+    return cached[1]
+
+def clear_baro_grid_cache():
+    """Drops all cached barometric grids (e.g. after new BT data has been saved)."""
+    _BARO_GRID_CACHE.clear()
+
+def calculate_differential_pressure_grid(df, baro_grid):
+    """
+    Calculates missing Differential Pressure (kPa) from Absolute Pressure and a gridded barometric series.
+
+    Parameters:
+    - df (pd.DataFrame): DataFrame containing 'Absolute Pressure (kPa)' and 'Differential Pressure (kPa)' columns.
+    - baro_grid (dict): Grid from get_baro_grid or build_baro_grid.
+
+    Returns:
+    - df (pd.DataFrame): DataFrame with 'Differential Pressure (kPa)' filled for missing values.
+    - corrected_baro_count (int): Number of corrections made.
+    - failed_baro_count (int): Number of corrections that failed because the grid has no value at that time.
+    """
+    if 'Differential Pressure (kPa)' not in df.columns:
+        return df, 0, 0
+
+    absolute_pressure = pd.to_numeric(df['Absolute Pressure (kPa)'], errors='coerce').to_numpy(dtype='float64')
+    missing_data_mask = df['Differential Pressure (kPa)'].isna().to_numpy() & ~np.isnan(absolute_pressure)
+    if not missing_data_mask.any():
+        return df, 0, 0
+
+    positions = np.flatnonzero(missing_data_mask)
+    barometric_pressure = lookup_baro_grid(baro_grid, df.index[positions])
+    found = ~np.isnan(barometric_pressure)
+
+    column_idx = df.columns.get_loc('Differential Pressure (kPa)')
+    df.iloc[positions[found], column_idx] = absolute_pressure[positions[found]] - barometric_pressure[found]
+
+    corrected_baro_count = int(found.sum())
+    return df, corrected_baro_count, int(len(found) - corrected_baro_count)
+
+def water_density_linear(T):
+    """Simplified linear density of freshwater (kg/m³) for temperature T (°C)."""
+    return 999.84 - 0.067 * np.asarray(T, dtype='float64')
+
+def water_density_freshwater(T):
+    """
+    Temperature-dependent density of air-free freshwater (kg/m³) for temperature T (°C).
+
+    Uses the Thiesen-Scheel-Diesselhorst equation, valid between 0 and 40 °C.
+    """
+    T = np.asarray(T, dtype='float64')
+    return 1000.0 * (1.0 - (T + 288.9414) / (508929.2 * (T + 68.12963)) * (T - 3.9863) ** 2)
+
+# Precomputed density lookup table (0.1 °C steps) built from the freshwater equation
+DENSITY_TABLE_T = np.round(np.arange(-5.0, 45.0 + 0.1, 0.1), 1)
+DENSITY_TABLE_RHO = water_density_freshwater(DENSITY_TABLE_T)
+
+def water_density_lookup(T):
+    """Freshwater density (kg/m³) interpolated from the precomputed temperature table."""
+    return np.interp(np.asarray(T, dtype='float64'), DENSITY_TABLE_T, DENSITY_TABLE_RHO)
+
+# Available water-density models for the water level calculation
+DENSITY_MODELS = {
+    'linear': water_density_linear,
+    'freshwater': water_density_freshwater,
+    'lookup': water_density_lookup,
+}
+
+def calculate_water_level(df, g=9.81, density_model='linear'):
     """
     Calculates Water Level (m) from Differential Pressure (kPa) and temperature.
     
     Parameters:
     - df (pd.DataFrame): DataFrame containing 'Differential Pressure (kPa)' and 'Temperature (°C)' columns.
     - g (float): Gravitational acceleration (m/s^2), default is 9.81 m/s^2.
+    - density_model (str or callable): Water density model, either a key of DENSITY_MODELS
+                                       ('linear', 'freshwater', 'lookup') or a function mapping a
+                                       temperature array (°C) to density (kg/m³). Default is 'linear'.
     
     Returns:
     - df (pd.DataFrame): DataFrame with 'Water Level (m)' filled for missing values.
@@ -232,22 +1037,225 @@ def calculate_water_level(df, g=9.81):
     """
     corrected_water_level_count = 0
 
+    # Resolve the density model
+    if callable(density_model):
+        density = density_model
+    elif density_model in DENSITY_MODELS:
+        density = DENSITY_MODELS[density_model]
+    else:
+        raise ValueError(f"Unknown density model: {density_model}. Expected one of {list(DENSITY_MODELS)} or a callable.")
+
     # Apply correction only to rows where 'Water Level (m)' is missing
-    if 'Water Level (m)' in df.columns:
-        missing_data_mask = df['Water Level (m)'].isna()
-
-        # If there are rows with missing data
-        if missing_data_mask.any():
-            for idx, row in df[missing_data_mask].iterrows():
-                # Calculate the water level for missing values
-                if pd.isna(row['Water Level (m)']) and pd.notna(row['Differential Pressure (kPa)']):
-                    T = row['Temperature (°C)']
-                    rho = 999.84 - 0.067 * T  # Simplified density formula for freshwater (kg/m³)
-                    df.at[idx, 'Water Level (m)'] = (row['Differential Pressure (kPa)'] * 1000) / (rho * g)
-                    corrected_water_level_count += 1
+    if 'Water Level (m)' not in df.columns:
+        return df, corrected_water_level_count
+
+    diff_pressure = pd.to_numeric(df['Differential Pressure (kPa)'], errors='coerce').to_numpy(dtype='float64')
+    missing_data_mask = df['Water Level (m)'].isna().to_numpy() & ~np.isnan(diff_pressure)
+
+    # If there are rows with missing data
+    if missing_data_mask.any():
+        T = pd.to_numeric(df['Temperature (°C)'], errors='coerce').to_numpy(dtype='float64')[missing_data_mask]
+        rho = density(T)
+        water_level = (diff_pressure[missing_data_mask] * 1000) / (rho * g)
+
+        column_idx = df.columns.get_loc('Water Level (m)')
+        df.iloc[np.flatnonzero(missing_data_mask), column_idx] = water_level
+        corrected_water_level_count = int(missing_data_mask.sum())
 
     return df, corrected_water_level_count
 
+def remove_fill_values(df, min_water_level=-200, max_water_level=10):
+    """
+    Blanks rows whose Water Level (m) is a logger fill value (outside the plausible range).
+
+    Parameters:
+    - df (pd.DataFrame): Stage data containing a 'Water Level (m)' column.
+    - min_water_level (float): Values below this are treated as fill values, default is -200 m.
+    - max_water_level (float): Values above this are treated as fill values, default is 10 m.
+
+    Returns:
+    - df (pd.DataFrame): DataFrame with fill-value rows set to missing.
+    - n_fill (int): Number of fill values removed.
+    """
+    water_level = pd.to_numeric(df['Water Level (m)'], errors='coerce')
+    fill_mask = (water_level < min_water_level) | (water_level > max_water_level)
+    df.loc[fill_mask, :] = np.nan
+    return df, int(fill_mask.sum())
+
+def apply_water_level_offsets(site_name, df_new, root=None, high_water_mark=None):
+    """
+    Applies site-specific water level offsets to newly downloaded data (see project data notes).
+
+    northfield_poolBT: after 2024-12-17 13:42 the logger's water level restarts from zero, so new rows
+    after that time and after the site's high-water mark are shifted by the last stored water level.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - df_new (pd.DataFrame): Newly read stage data.
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+    - high_water_mark (pd.Timestamp): High-water mark before the ingest. None reads it from the store
+                                      (pass it when the download is ingested chunk by chunk).
+
+    Returns:
+    - df_new (pd.DataFrame): Data with the offset applied (a copy if an offset was applied).
+    - offset (float or None): The offset added to the water level, or None if none applied.
+    """
+    if site_name != 'northfield_poolBT':
+        return df_new, None
+
+    if high_water_mark is None:
+        high_water_mark = get_high_water_mark(site_name, root)
+    if high_water_mark is None:
+        return df_new, None
+
+    correction_time = pd.to_datetime("2024-12-17 13:42:00")
+    offset = read_stage_data(site_name, start=high_water_mark, end=high_water_mark, columns=['Water Level (m)'], root=root)['Water Level (m)'].iloc[-1]
+    df_new = df_new.copy()
+    df_new.loc[(df_new.index > correction_time) & (df_new.index > high_water_mark), 'Water Level (m)'] += offset
+    return df_new, offset
+
+def process_stage_window(site_name, df_new, root=None, baro_grid=None, df_baro=None, baro_tolerance=pd.Timedelta(minutes=10), density_model='linear'):
+    """
+    Prepares an incremental stage ingest: corrects only the new rows and the stored rows they overlap.
+
+    Rows after the site's high-water mark are new by definition, so the store is only read when the
+    download overlaps existing data. Barometric correction, water level, duplicate averaging and the
+    fill-value scrub run on this window alone, so the cost scales with the download, not the record.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - df_new (pd.DataFrame): Newly read stage data (e.g. from read_stage_file).
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+    - baro_grid (dict): Gridded barometric series (e.g. shared across a batch). If neither baro_grid nor
+                        df_baro is given, the site's cached grid from get_baro_grid is used.
+    - df_baro (pd.DataFrame): Barometric data for a nearest-neighbour correction instead of the grid.
+    - baro_tolerance (pd.Timedelta): Nearest-time tolerance of the nearest-neighbour correction.
+    - density_model (str or callable): Water density model passed to calculate_water_level.
+
+    Returns:
+    - df_window (pd.DataFrame): Corrected, deduplicated and sorted window ready for save_stage_master.
+    - df_unique (pd.DataFrame): Rows of df_new whose timestamps were not yet in the store.
+    - summary (dict): Counts of the processing steps, the site's high-water mark before the ingest and
+                      'recorrected_rows', the stored rows whose corrected values changed (e.g. after late
+                      BT data arrived). df_window must be saved when either new_rows or recorrected_rows is set.
+    """
+    summary = {
+        'high_water_mark': None, 'new_rows': 0, 'recorrected_rows': 0, 'baro_site_found': None,
+        'corrected_baro_count': 0, 'failed_baro_count': 0,
+        'corrected_water_level_count': 0, 'duplicates_averaged': 0, 'fill_values_removed': 0,
+    }
+
+    df_new = to_stage_frame(df_new)
+    df_new = df_new[df_new.index.notna()]
+    window_start, window_end = df_new.index.min(), df_new.index.max()
+
+    # Existing rows overlapping the download (none if the download starts after the high-water mark)
+    import_legacy_stage_master(site_name, root=root)
+    high_water_mark = get_high_water_mark(site_name, root)
+    summary['high_water_mark'] = high_water_mark
+    if high_water_mark is not None and window_start <= high_water_mark:
+        df_overlap = read_stage_data(site_name, start=window_start, end=window_end, root=root)
+    else:
+        df_overlap = None
+
+    if df_overlap is not None and not df_overlap.empty:
+        df_unique = df_new[~df_new.index.isin(df_overlap.index)]
+        df_window = pd.concat([df_overlap, df_unique])
+    else:
+        df_unique = df_new
+        df_window = df_new.copy()
+    summary['new_rows'] = len(df_unique)
+
+    if 'BT' not in site_name:
+        if df_baro is None and baro_grid is None:
+            baro_grid = get_baro_grid(site_name, root=root)
+        summary['baro_site_found'] = df_baro is not None or baro_grid is not None
+        if df_baro is not None:
+            df_window, summary['corrected_baro_count'], summary['failed_baro_count'] = calculate_differential_pressure(df_window, df_baro, tolerance=baro_tolerance)
+        elif baro_grid is not None:
+            df_window, summary['corrected_baro_count'], summary['failed_baro_count'] = calculate_differential_pressure_grid(df_window, baro_grid)
+        if summary['baro_site_found']:
+            df_window, summary['corrected_water_level_count'] = calculate_water_level(df_window, density_model=density_model)
+
+    # Take the mean of duplicate timestamps (these exist straight from the hobo sensors)
+    len_preclean = len(df_window)
+    df_window = df_window.groupby(df_window.index).mean()
+    summary['duplicates_averaged'] = len_preclean - len(df_window)
+
+    df_window, summary['fill_values_removed'] = remove_fill_values(df_window)
+    df_window.sort_index(inplace=True)
+
+    if df_overlap is not None and not df_overlap.empty:
+        summary['recorrected_rows'] = _count_changed_rows(df_overlap, df_window)
+
+    return df_window, df_unique, summary
+
+def _count_changed_rows(df_stored, df_window):
+    """
+    Counts the stored rows whose values differ in a re-corrected window (NaN equals NaN).
+
+    Parameters:
+    - df_stored (pd.DataFrame): Rows read from the stage store.
+    - df_window (pd.DataFrame): Corrected window from process_stage_window.
+
+    Returns:
+    - n_changed (int): Number of timestamps present in both frames with at least one differing value.
+    """
+    common = df_stored.index.intersection(df_window.index)
+    if common.empty:
+        return 0
+    stored = to_stage_frame(df_stored.loc[common]).to_numpy()
+    window = to_stage_frame(df_window.loc[common]).to_numpy()
+    same = (stored == window) | (np.isnan(stored) & np.isnan(window))
+    return int((~same.all(axis=1)).sum())
+
+def ingest_stage_chunks(site_name, chunks, root=None, baro_grid=None, dry_run=False):
+    """
+    Ingests a stream of stage chunks (e.g. from iter_stage_file) into the stage store one chunk at a time.
+
+    Each chunk goes through apply_water_level_offsets, process_stage_window and save_stage_master, so
+    memory stays bounded by the chunk size rather than the length of the download.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - chunks (iterable): Stage DataFrames in time order.
+    - root (Path or str): Stage store root directory. Defaults to stage_store.STAGE_STORE_DIRECTORY.
+    - baro_grid (dict): Gridded barometric series. None uses the site's cached grid from get_baro_grid.
+    - dry_run (bool): Process the chunks without writing to the stage store.
+
+    Returns:
+    - summary (dict): process_stage_window counts summed over the chunks, the high-water mark before the
+                      ingest, the water level offset applied and the month keys of the written partitions.
+    """
+    summary = {
+        'high_water_mark': get_high_water_mark(site_name, root), 'new_rows': 0, 'recorrected_rows': 0, 'baro_site_found': None,
+        'corrected_baro_count': 0, 'failed_baro_count': 0,
+        'corrected_water_level_count': 0, 'duplicates_averaged': 0, 'fill_values_removed': 0,
+        'water_level_offset': None, 'written_partitions': [],
+    }
+    if 'BT' not in site_name and baro_grid is None:
+        baro_grid = get_baro_grid(site_name, root=root)
+
+    for df_chunk in chunks:
+        # The offset refers to the record before the ingest, not to the chunks already written
+        df_chunk, offset = apply_water_level_offsets(site_name, df_chunk, root=root, high_water_mark=summary['high_water_mark'])
+        if offset is not None:
+            summary['water_level_offset'] = offset
+
+        df_window, df_unique, chunk_summary = process_stage_window(site_name, df_chunk, root=root, baro_grid=baro_grid)
+        for key in ('new_rows', 'recorrected_rows', 'corrected_baro_count', 'failed_baro_count', 'corrected_water_level_count',
+                    'duplicates_averaged', 'fill_values_removed'):
+            summary[key] += chunk_summary[key]
+        summary['baro_site_found'] = chunk_summary['baro_site_found']
+
+        # Stored rows re-corrected in the overlap (e.g. after late BT data) are written as well as new rows
+        if not dry_run and (chunk_summary['new_rows'] or chunk_summary['recorrected_rows']):
+            for month in save_stage_master(site_name, df_window, root=root):
+                if month not in summary['written_partitions']:
+                    summary['written_partitions'].append(month)
+
+    return summary
+
 def save_formatted_excel(df, output_path):
     """
     Save DataFrame to Excel with standard formatting.
@@ -301,7 +1309,25 @@ def autodetect_stage_site(file):
     else:
         return None  # Default case if no match is found
     
-def get_salt_dump_times(site_name):
+def get_salt_dump_times(site_name, offline=False, refresh=False, client=None, database=None, index_file=None):
+    """
+    Returns the salt dump times recorded in the field forms for a site.
+
+    The times are looked up in the salt dump time index (see field_forms.salt_dump_index), which is served
+    from memory or from its file on disk while it is recent, and otherwise rebuilt from the two sheet columns
+    it needs.
+
+    Parameters:
+    - site_name (str): 'northfield', 'chase_bridge' or 'cat_beacons'.
+    - offline (bool): Do not contact the sheet (existing index, or the local mirror of the field forms).
+    - refresh (bool): Rebuild the index from the sheet even if a recent one exists.
+    - client: gspread client or stub (see field_forms.open_field_forms_sheet).
+    - database (Path or str): Mirror database used offline. Defaults to field_forms.FIELD_FORMS_DATABASE.
+    - index_file (Path or str): Index file. Defaults to field_forms.SALT_DUMP_INDEX_FILE.
+
+    Returns:
+    - salt_dump_times (list): Recorded dump times (pd.Timestamp), in sheet order.
+    """
     # Mapping of input site_name to sheet's Site_Name values
     site_name_mapping = {
         'northfield': 'Northfield',
@@ -316,33 +1342,8 @@ def get_salt_dump_times(site_name):
     # Get the corresponding sheet Site_Name
     mapped_site_name = site_name_mapping[site_name]
 
-    # Connect to Google Sheets
-    gc = gspread.service_account_from_dict(credentials)
-
-    # Open the Google Sheet by URL
-    sheet_url = "https://docs.google.com/spreadsheets/d/1JLbDJq4qAfAyzEpOuxYYjhfXd4FxvotUc8JaBCsSdKE/edit?gid=748389405"
-    sh = gc.open_by_url(sheet_url)
-
-    # List to hold all salt dump times
-    salt_dump_times = []
-
-    # Read all worksheets into memory at once (optimized)
-    worksheets = sh.worksheets()
-
-    for ws in worksheets:
-        # Read worksheet into DataFrame
-        df_ws = pd.DataFrame(ws.get_all_records())
-
-        # Filter rows where 'Site_Name' matches the mapped site_name
-        filtered_df = df_ws[df_ws['Site_Name'] == mapped_site_name]
-
-        # Filter out rows where 'Salt_Dump.Time_of_Salt_Dump' is NaN or empty
-        valid_salt_dump_times = filtered_df['Salt_Dump.Time_of_Salt_Dump'].dropna()
-
-        # Convert the valid 'Salt_Dump.Time_of_Salt_Dump' values to datetime
-        salt_dump_times.extend(pd.to_datetime(valid_salt_dump_times, errors='coerce'))
-
-    return salt_dump_times
+    df_index = salt_dump_index(refresh=refresh, offline=offline, client=client, database=database, index_file=index_file)
+    return list(df_index.loc[df_index['site_name'] == mapped_site_name, 'time'])
 
 
     
\ No newline at end of file
@@ -0,0 +1,71 @@
+import pandas as pd
+from ec_store import EC_TIME_COLUMN, read_ec_data
+from stage_store import read_stage_data
+
+# Record kinds that can be queried, with the name of their time column in the query results
+RECORD_KINDS = {
+    'ec': EC_TIME_COLUMN,
+    'stage': 'Datetime',
+}
+
+def record_name(site, sensor=None):
+    """
+    Returns the store record name of a site and sensor (e.g. 'northfield', 'longterm' -> 'northfield_longterm').
+
+    Stage records are named by site and location ('chase', 'us' -> 'chase_us'); a record can also be
+    addressed directly by passing its full name as the site and no sensor.
+    """
+    return f"{site}_{sensor}" if sensor else site
+
+def query_record(site, sensor=None, start=None, end=None, columns=None, kind='ec', root=None, as_arrays=False):
+    """
+    Reads a time range of a continuous EC or stage record from its store.
+
+    Only the monthly partitions overlapping the range are opened, the rows are located by binary search on
+    each partition's cached time index, and only the Parquet row groups containing them are decoded, so a
+    short window of a long record costs about the same as reading a small file.
+
+    Parameters:
+    - site (str): Site name, or the full record name if sensor is None.
+    - sensor (str): Sensor or location suffix of the record (see record_name).
+    - start, end (str or pd.Timestamp): Inclusive time range. None leaves that side open.
+    - columns (list): Columns to read besides the time column. None reads every stored column.
+    - kind (str): 'ec' (EC store) or 'stage' (stage store).
+    - root (Path or str): Store root directory. Defaults to the store's own directory.
+    - as_arrays (bool): Return a dict of typed NumPy arrays instead of a DataFrame.
+
+    Returns:
+    - df (pd.DataFrame): Rows within the range sorted on time, with the time as a column
+                         ('DT' for EC records, 'Datetime' for stage records).
+      or
+    - arrays (dict): Column name -> np.ndarray (datetime64[ns] for the time column, float64 for readings).
+    """
+    if kind not in RECORD_KINDS:
+        raise ValueError(f"Invalid record kind: {kind}. Expected one of {list(RECORD_KINDS)}.")
+
+    name = record_name(site, sensor)
+    if kind == 'ec':
+        df = read_ec_data(name, start=start, end=end, columns=columns, root=root)
+    else:
+        df = read_stage_data(name, start=start, end=end, columns=columns, root=root).reset_index()
+
+    time_column = RECORD_KINDS[kind]
+    df[time_column] = pd.to_datetime(df[time_column])
+    if as_arrays:
+        return {col: df[col].to_numpy() for col in df.columns}
+    return df
+
+def query_window(site, sensor=None, center=None, before=pd.Timedelta(minutes=30), after=pd.Timedelta(hours=1.5),
+                 columns=None, kind='ec', root=None, as_arrays=False):
+    """
+    Reads the window of a record around an event (e.g. a salt dump time), see query_record.
+
+    Parameters:
+    - center (str or pd.Timestamp): Event time.
+    - before, after (pd.Timedelta): Extent of the window before and after the event.
+
+    Other parameters and the return value are those of query_record.
+    """
+    center = pd.Timestamp(center)
+    return query_record(site, sensor, start=center - pd.Timedelta(before), end=center + pd.Timedelta(after),
+                        columns=columns, kind=kind, root=root, as_arrays=as_arrays)
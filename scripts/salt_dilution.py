@@ -0,0 +1,731 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from project_utils import sniff_ec_file, iter_ec_file, EC_FILE_FORMATS
+
+# Root of the manual salt dilution data (EC dumps, CF tables and field metadata)
+SALT_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Manual_salt")
+CF_DIRECTORY = SALT_DIRECTORY / "CF"
+METADATA_DIRECTORY = SALT_DIRECTORY / "metadata"
+
+# File names written by select_saltwaves and select-saltwaves-streamlit.py
+DUMP_FILE_PATTERN = re.compile(r"^(?P<site>.+)_(?P<date>\d{8})_dump(?P<dump>[^_]*)_(?P<location>[^_]+)_(?P<sensor>.+)\.xlsx$")
+BASELINE_FILE_PATTERN = re.compile(r"^(?P<site>.+)_(?P<date>\d{8})_(?P<location>baseline[^_]*)_(?P<sensor>.+)\.xlsx$", re.IGNORECASE)
+
+# File names written by process-cf-streamlit.py
+CF_FILE_PATTERN = re.compile(r"^(?P<site>.+)_(?P<date>\d{8})_(?P<sensor>.+)_CFvals\.xlsx$")
+
+# Columns of the CF catalog (one row per CF file, see update_cf_catalog)
+CF_CATALOG_COLUMNS = [
+    'site', 'sensor', 'date', 'calibration_date', 'lab_field', 'primary_solution',
+    'cf', 'intercept', 'r2', 'n', 'path', 'size', 'mtime', 'error',
+]
+
+# Columns of the discharge results table
+DISCHARGE_COLUMNS = [
+    'site', 'date', 'dump', 'location', 'sensor', 'start', 'end', 'n_points', 'salt_mass_g',
+    'cf', 'cf_r2', 'background_method', 'background_ec', 'peak_ec', 'ec_integral', 'discharge_m3s',
+    'dump_file', 'baseline_file', 'cf_file', 'metadata_file', 'error',
+]
+
+def parse_salt_filename(file):
+    """
+    Parses the site, date, dump number, sensor location and sensor name from a processed EC file name.
+
+    Parameters:
+    - file (Path or str): Dump file ({site}_{date}_dump{n}_{location}_{sensor}.xlsx) or
+                          baseline file ({site}_{date}_{baselineX}_{sensor}.xlsx).
+
+    Returns:
+    - info (dict or None): Parsed fields ('dump' is None for baseline files), or None if the name does not match.
+    """
+    name = Path(file).name
+    match = BASELINE_FILE_PATTERN.match(name)
+    if match:
+        return {**match.groupdict(), 'dump': None}
+    match = DUMP_FILE_PATTERN.match(name)
+    if match:
+        return match.groupdict()
+    return None
+
+def read_ec_series(file):
+    """
+    Reads the datetime and EC.T columns of a processed EC file.
+
+    The layout (headers in the first row, or logger metadata rows above the header row as in QiQuac
+    exports) is identified with project_utils.sniff_ec_file. If a compact .parquet or .csv copy of an
+    Excel file exists next to it (see project_utils.write_ec_dump), the copy is read instead.
+
+    Parameters:
+    - file (Path or str): Processed dump or baseline file (.xlsx, or a .parquet/.csv copy).
+
+    Returns:
+    - df (pd.DataFrame): 'Datetime' (datetime64, sorted) and 'EC.T' (float64) columns, without missing rows.
+
+    Raises:
+    - ValueError: If no datetime or EC.T column is found.
+    """
+    file = Path(file)
+    copies = [file.with_suffix(suffix) for suffix in ('.parquet', '.csv') if file.suffix.lower() == '.xlsx']
+    copy_file = next((copy for copy in copies if copy.exists()), file if file.suffix.lower() in ('.parquet', '.csv') else None)
+
+    if copy_file is not None:
+        # Compact copy written by project_utils.write_ec_dump (data columns only)
+        df = pd.read_parquet(copy_file) if copy_file.suffix.lower() == '.parquet' else pd.read_csv(copy_file)
+        dt_col = next((descriptor['dt_col'] for descriptor in EC_FILE_FORMATS if descriptor['dt_col'] in df.columns), None)
+        ec_col = next((col for col in df.columns if str(col).startswith('EC.T')), None)
+        if dt_col is None or ec_col is None:
+            raise ValueError(f"No datetime and EC.T columns found in {copy_file}.")
+    else:
+        layout = sniff_ec_file(file)
+        dt_col, ec_col = layout['dt_col'], layout['ec_col']
+        if ec_col is None:
+            raise ValueError(f"No datetime and EC.T columns found in {file}.")
+        chunks = list(iter_ec_file(file, columns=[dt_col, ec_col], dt_col=dt_col, header_row=layout['header_row']))
+        df = pd.concat(chunks) if chunks else pd.DataFrame({col: pd.Series(dtype='float64') for col in [dt_col, ec_col]})
+
+    df = df[[dt_col, ec_col]].rename(columns={dt_col: 'Datetime', ec_col: 'EC.T'})
+    df['EC.T'] = pd.to_numeric(df['EC.T'], errors='coerce')
+    df['Datetime'] = pd.to_datetime(df['Datetime'])
+    df = df.dropna().sort_values('Datetime', kind='stable').reset_index(drop=True)
+    df['EC.T'] = df['EC.T'].astype('float64')
+    return df
+
+def read_cf_file(file):
+    """
+    Reads a *_CFvals.xlsx file written by process-cf-streamlit.py.
+
+    Parameters:
+    - file (Path or str): CF file (header fields, an empty row, then the calibration table).
+
+    Returns:
+    - header (dict): Header fields (e.g. 'Site', 'Sensor', 'Primary solution [g/m3]').
+    - df_cf (pd.DataFrame): Calibration table ('Vol. [ml]', 'Vol. salt solution added [ml]', 'EC [uS/cm]', ...).
+    """
+    df_raw = pd.read_excel(file, header=None)
+
+    # Header fields run down to the first empty row
+    header = {}
+    row_idx = 0
+    while row_idx < len(df_raw) and pd.notna(df_raw.iloc[row_idx, 0]):
+        header[str(df_raw.iloc[row_idx, 0]).strip()] = df_raw.iloc[row_idx, 1]
+        row_idx += 1
+
+    # The calibration table starts at the next non-empty row
+    while row_idx < len(df_raw) and df_raw.iloc[row_idx].isna().all():
+        row_idx += 1
+    df_cf = df_raw.iloc[row_idx + 1:].copy()
+    df_cf.columns = [str(col).strip() for col in df_raw.iloc[row_idx]]
+    df_cf = df_cf.apply(pd.to_numeric, errors='coerce').reset_index(drop=True)
+    return header, df_cf
+
+def calculate_cf(df_cf, primary_solution):
+    """
+    Calculates the calibration factor (CF) as the slope of salt concentration against EC.
+
+    The concentration after each addition is primary_solution * added volume / total volume, so the
+    slope has units of (g/m3) / (uS/cm).
+
+    Parameters:
+    - df_cf (pd.DataFrame): Calibration table with 'Vol. [ml]', 'Vol. salt solution added [ml]' and 'EC [uS/cm]'.
+    - primary_solution (float): Concentration of the primary salt solution [g/m3].
+
+    Returns:
+    - cf (dict): 'cf' (slope), 'intercept', 'r2' and 'n' (number of calibration points used).
+                 Values are NaN if fewer than two points are available.
+    """
+    concentration = float(primary_solution) * df_cf['Vol. salt solution added [ml]'] / df_cf['Vol. [ml]']
+    ec = df_cf['EC [uS/cm]']
+    valid = (concentration.notna() & ec.notna()).to_numpy()
+    x, y = ec.to_numpy(dtype='float64')[valid], concentration.to_numpy(dtype='float64')[valid]
+
+    if len(x) < 2 or np.ptp(x) == 0:
+        return {'cf': np.nan, 'intercept': np.nan, 'r2': np.nan, 'n': int(len(x))}
+
+    slope, intercept = np.polyfit(x, y, 1)
+    residuals = y - (slope * x + intercept)
+    total = ((y - y.mean()) ** 2).sum()
+    r2 = 1 - (residuals ** 2).sum() / total if total > 0 else np.nan
+    return {'cf': float(slope), 'intercept': float(intercept), 'r2': float(r2), 'n': int(len(x))}
+
+def detect_cf_plateaus(ec, n_plateaus=6, min_length=10, smooth_window=5, tolerance=None, min_ec=None):
+    """
+    Finds the stable EC plateaus of a CF calibration time series, one per salt solution addition.
+
+    Readings of the sensor out of the water (below min_ec) are dropped first. Readings whose step from the
+    previous (median-smoothed) reading stays within the tolerance form stable runs; neighbouring runs are merged
+    when their levels match within the reading noise (a noise spike splits a plateau), and the longest rising
+    staircase of n_plateaus runs of at least min_length readings is kept. The smallest rise between plateaus is
+    a quarter of the calibration step, taken as the median rise between consecutive runs so that it does not
+    depend on readings outside the plateaus. Plateau levels are medians and their spread is the scaled median
+    absolute deviation, so mixing transients and spikes are ignored.
+
+    Parameters:
+    - ec (array-like): EC.T values [uS/cm] in logger order.
+    - n_plateaus (int): Number of plateaus expected (initial volume plus one per addition).
+    - min_length (int): Fewest readings in a plateau.
+    - smooth_window (int): Rolling median window (readings) applied before the step test.
+    - tolerance (float): Largest step [uS/cm] between readings of a plateau. None derives it from the noise
+                         and the overall EC rise.
+    - min_ec (float): Lowest EC [uS/cm] of a reading in the water. None uses 10 % of the 95th percentile of the
+                      readings (sensor in air or before immersion reads near zero).
+
+    Returns:
+    - df_plateaus (pd.DataFrame): One row per plateau in time order: start, end (row positions, inclusive),
+                                  n_points, ec_median and ec_spread [uS/cm]. Fewer rows than n_plateaus are
+                                  returned if the series does not hold that many plateaus.
+    """
+    plateau_columns = ['start', 'end', 'n_points', 'ec_median', 'ec_spread']
+    ec = np.asarray(ec, dtype='float64')
+    valid = ~np.isnan(ec)
+    if valid.sum() < min_length:
+        return pd.DataFrame(columns=plateau_columns)
+
+    # Readings out of the water (sensor in air or not yet immersed) are not part of any plateau
+    if min_ec is None:
+        min_ec = 0.1 * np.nanpercentile(ec, 95)
+    valid &= ec >= min_ec
+    if valid.sum() < min_length:
+        return pd.DataFrame(columns=plateau_columns)
+
+    # Noise of the readings and of the steps tested below (between smoothed readings)
+    smoothed = pd.Series(np.where(valid, ec, np.nan)).rolling(smooth_window, center=True, min_periods=1).median().to_numpy()
+    reading_noise = 1.4826 * np.median(np.abs(np.diff(ec[valid]))) / np.sqrt(2)
+    differences = np.diff(smoothed[valid])
+    noise = 1.4826 * np.median(np.abs(differences - np.median(differences))) if len(differences) else 0.0
+    if tolerance is None:
+        overall_step = (np.nanpercentile(smoothed, 95) - np.nanpercentile(smoothed, 5)) / max(n_plateaus - 1, 1)
+        tolerance = max(3 * noise, 0.02 * overall_step, 1e-6)
+    same_level = max(3 * reading_noise, 3 * tolerance)
+
+    # Stable runs in one pass over the steps
+    stable = np.r_[False, np.abs(np.diff(smoothed)) <= tolerance] & valid
+    edges = np.diff(np.r_[0, stable.astype(np.int8), 0])
+    run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+    # Merge neighbouring runs at the same level (within the reading noise)
+    runs = []
+    for start, end in zip(run_starts, run_ends):
+        level = np.median(ec[start:end + 1])
+        if runs and abs(level - runs[-1]['level']) <= same_level:
+            runs[-1]['end'] = end
+            runs[-1]['length'] += end - start + 1
+            runs[-1]['level'] = np.median(ec[runs[-1]['start']:end + 1][stable[runs[-1]['start']:end + 1]])
+        else:
+            runs.append({'start': start, 'end': end, 'length': end - start + 1, 'level': level})
+    runs = [run for run in runs if run['length'] >= min_length]
+    if not runs:
+        return pd.DataFrame(columns=plateau_columns)
+
+    # Calibration step: median rise between consecutive plateau candidates
+    rises = np.diff([run['level'] for run in runs])
+    rises = rises[rises > same_level]
+    expected_step = np.median(rises) if len(rises) else 0.0
+
+    # Longest rising staircase of up to n_plateaus runs (dynamic programming over the candidate runs)
+    min_rise = max(0.25 * expected_step, same_level)
+    n_runs = len(runs)
+    levels = np.array([run['level'] for run in runs])
+    lengths = np.array([run['length'] for run in runs], dtype='float64')
+    best = np.full((n_plateaus, n_runs), -np.inf)
+    previous = np.full((n_plateaus, n_runs), -1)
+    best[0] = lengths
+    for k in range(1, n_plateaus):
+        for j in range(n_runs):
+            candidates = best[k - 1, :j] + np.where(levels[:j] + min_rise < levels[j], 0, -np.inf)
+            if j and np.isfinite(candidates).any():
+                i = int(np.argmax(candidates))
+                best[k, j], previous[k, j] = candidates[i] + lengths[j], i
+    k = max(k for k in range(n_plateaus) if np.isfinite(best[k]).any())
+    j = int(np.argmax(best[k]))
+    chosen = []
+    while j >= 0:
+        chosen.append(j)
+        j, k = previous[k, j], k - 1
+    chosen = chosen[::-1]
+
+    plateaus = []
+    for j in chosen:
+        start, end = runs[j]['start'], runs[j]['end']
+        values = ec[start:end + 1][stable[start:end + 1]]
+        median = np.median(values)
+        plateaus.append({'start': int(start), 'end': int(end), 'n_points': int(len(values)), 'ec_median': float(median),
+                         'ec_spread': float(1.4826 * np.median(np.abs(values - median)))})
+    return pd.DataFrame(plateaus, columns=plateau_columns)
+
+def read_salt_dumps(metadata_file):
+    """
+    Reads the salt dump table of a field metadata file written by fetch-ec-metadata.py.
+
+    Parameters:
+    - metadata_file (Path or str): {site}_{date}_metadata_{submissionid}.xlsx file.
+
+    Returns:
+    - df_dumps (pd.DataFrame): 'Dump Number' (float), 'Dump Time' (datetime64) and 'Salt Mass (g)' (float).
+    """
+    df_dumps = pd.read_excel(metadata_file, sheet_name='Metadata', header=13)
+    df_dumps = pd.DataFrame({
+        'Dump Number': pd.to_numeric(df_dumps['Dump Number'], errors='coerce'),
+        'Dump Time': pd.to_datetime(df_dumps['Dump Time'], errors='coerce'),
+        'Salt Mass (g)': pd.to_numeric(df_dumps['Salt Mass (g)'], errors='coerce'),
+    })
+    return df_dumps[df_dumps['Dump Number'].notna()].reset_index(drop=True)
+
+def find_metadata_file(site, date, metadata_directory=None):
+    """Returns the field metadata file of a site visit ({site}_{date}_metadata_*.xlsx), or None."""
+    metadata_directory = Path(metadata_directory if metadata_directory is not None else METADATA_DIRECTORY)
+    files = sorted((metadata_directory / site).glob(f"{site}_{date}_metadata_*.xlsx"))
+    return files[0] if files else None
+
+def find_cf_file(site, date, sensor, cf_directory=None, search_directories=()):
+    """
+    Returns the CF file of a sensor for a site visit ({site}_{date}_{sensor}_CFvals.xlsx), or None.
+
+    The CF tree (CF_DIRECTORY/{site}/{date}) is searched first, then the extra search directories.
+    """
+    cf_directory = Path(cf_directory if cf_directory is not None else CF_DIRECTORY)
+    file_name = f"{site}_{date}_{sensor}_CFvals.xlsx"
+    for directory in [cf_directory / site / date, *map(Path, search_directories)]:
+        if (directory / file_name).exists():
+            return directory / file_name
+    return None
+
+def _cf_catalog_file(cf_directory=None):
+    """Returns the catalog file of a CF tree."""
+    return Path(cf_directory if cf_directory is not None else CF_DIRECTORY) / "cf_catalog.csv"
+
+def _catalog_cf_file(file):
+    """Reads one CF file into a catalog row (failures are recorded in the 'error' field)."""
+    info = CF_FILE_PATTERN.match(file.name).groupdict()
+    stat = os.stat(file)
+    row = dict.fromkeys(CF_CATALOG_COLUMNS)
+    row.update({'site': info['site'], 'sensor': info['sensor'], 'date': pd.to_datetime(info['date'], format='%Y%m%d'),
+                'path': str(file), 'size': stat.st_size, 'mtime': float(stat.st_mtime), 'error': ''})
+    try:
+        header, df_cf = read_cf_file(file)
+        row.update({
+            'calibration_date': pd.to_datetime(header.get('Calibration Date'), errors='coerce'),
+            'lab_field': header.get('Lab/Field'),
+            'primary_solution': pd.to_numeric(header.get('Primary solution [g/m3]'), errors='coerce'),
+        })
+        row.update(calculate_cf(df_cf, row['primary_solution']))
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+def load_cf_catalog(cf_directory=None):
+    """
+    Reads the CF catalog of a CF tree (see update_cf_catalog) without opening any CF file.
+
+    Returns:
+    - df_catalog (pd.DataFrame): Catalog sorted by sensor and date (empty if the catalog does not exist).
+    """
+    catalog_file = _cf_catalog_file(cf_directory)
+    if not catalog_file.exists():
+        return pd.DataFrame(columns=CF_CATALOG_COLUMNS)
+    df_catalog = pd.read_csv(catalog_file, parse_dates=['date', 'calibration_date'], dtype={'site': str, 'sensor': str})
+    df_catalog['error'] = df_catalog['error'].fillna('')
+    return df_catalog
+
+def update_cf_catalog(cf_directory=None):
+    """
+    Indexes every *_CFvals.xlsx file of a CF tree into a compact catalog (cf_catalog.csv at the tree root).
+
+    Only files that are new or whose size or modification time changed since the last update are read;
+    rows of deleted files are dropped.
+
+    Parameters:
+    - cf_directory (Path or str): Root of the CF tree ({site}/{date}/{site}_{date}_{sensor}_CFvals.xlsx).
+                                  Defaults to CF_DIRECTORY.
+
+    Returns:
+    - df_catalog (pd.DataFrame): One row per CF file (see CF_CATALOG_COLUMNS), sorted by sensor and date.
+    """
+    cf_directory = Path(cf_directory if cf_directory is not None else CF_DIRECTORY)
+    files = [file for file in sorted(cf_directory.glob("*/*/*_CFvals.xlsx")) if not file.name.startswith('~') and CF_FILE_PATTERN.match(file.name)]
+
+    df_catalog = load_cf_catalog(cf_directory)
+    known = {(path, size, mtime) for path, size, mtime in zip(df_catalog['path'], df_catalog['size'], df_catalog['mtime'])}
+    current = {}
+    for file in files:
+        stat = os.stat(file)
+        current[str(file)] = (str(file), stat.st_size, float(stat.st_mtime)) in known
+
+    unchanged = df_catalog.loc[[current.get(path, False) for path in df_catalog['path']]]
+    new_rows = [_catalog_cf_file(Path(path)) for path, is_known in current.items() if not is_known]
+    if not new_rows and len(unchanged) == len(df_catalog):
+        return df_catalog
+
+    frames = [df for df in (unchanged, pd.DataFrame(new_rows, columns=CF_CATALOG_COLUMNS)) if not df.empty]
+    df_catalog = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CF_CATALOG_COLUMNS)
+    df_catalog = df_catalog.sort_values(['sensor', 'date', 'site'], kind='stable').reset_index(drop=True)
+
+    catalog_file = _cf_catalog_file(cf_directory)
+    os.makedirs(catalog_file.parent, exist_ok=True)
+    temp_file = catalog_file.with_suffix('.csv.tmp')
+    df_catalog[CF_CATALOG_COLUMNS].to_csv(temp_file, index=False)
+    os.replace(temp_file, catalog_file)
+    return df_catalog
+
+def find_best_cf(df_catalog, sensor, time, site=None, lab_field=None, max_age=None, min_r2=None):
+    """
+    Returns the calibration of a sensor closest in time to a measurement, from a CF catalog.
+
+    The catalog is sorted by sensor and date, so the sensor's rows and the nearest dates are found by
+    binary search. A calibration of the same site wins over one of another site at the same distance.
+
+    Parameters:
+    - df_catalog (pd.DataFrame): CF catalog (see load_cf_catalog / update_cf_catalog).
+    - sensor (str): Sensor name (e.g. 'AT200').
+    - time (str or pd.Timestamp): Measurement time (the site visit date for a dump).
+    - site (str): Site of the measurement. None ignores the site.
+    - lab_field (str): Only use 'Lab' or 'Field' calibrations. None uses both.
+    - max_age (pd.Timedelta): Largest distance between the calibration date and the time. None for no limit.
+    - min_r2 (float): Smallest R² of a usable calibration. None for no limit.
+
+    Returns:
+    - cf (dict or None): Catalog row of the best calibration ('cf', 'r2', 'path', ...), or None if none qualifies.
+    """
+    sensors = df_catalog['sensor'].to_numpy(dtype=str)
+    lo, hi = np.searchsorted(sensors, sensor, side='left'), np.searchsorted(sensors, sensor, side='right')
+    df_sensor = df_catalog.iloc[lo:hi]
+    usable = df_sensor['cf'].notna() & np.isfinite(pd.to_numeric(df_sensor['cf'], errors='coerce'))
+    if lab_field is not None:
+        usable &= df_sensor['lab_field'].astype(str).str.lower() == lab_field.lower()
+    if min_r2 is not None:
+        usable &= df_sensor['r2'] >= min_r2
+    df_sensor = df_sensor[usable]
+    if df_sensor.empty:
+        return None
+
+    # The nearest calibration is next to the insertion point of the time in the sorted dates
+    time = np.datetime64(pd.Timestamp(time), 'ns')
+    dates = df_sensor['date'].to_numpy(dtype='datetime64[ns]')
+    distances = np.abs(dates - time)
+    position = int(np.searchsorted(dates, time))
+    nearest = min(distances[i] for i in (position - 1, position) if 0 <= i < len(dates))
+    if max_age is not None and nearest > np.timedelta64(pd.Timedelta(max_age).value, 'ns'):
+        return None
+
+    # Same site first among equally near calibrations
+    candidates = list(np.flatnonzero(distances == nearest))
+    if site is not None:
+        same_site = [i for i in candidates if df_sensor['site'].iloc[i] == site]
+        candidates = same_site or candidates
+    return df_sensor.iloc[candidates[0]].to_dict()
+
+def integrate_ec(times, ec, background):
+    """
+    Integrates background-subtracted EC over time with the trapezoid rule.
+
+    Parameters:
+    - times (array-like): Sorted timestamps (datetime64).
+    - ec (array-like): EC.T values [uS/cm].
+    - background (float or array-like): Background EC.T, a constant or one value per timestamp [uS/cm].
+
+    Returns:
+    - integral (float): Integral of (EC.T - background) over time [uS/cm * s].
+    """
+    seconds = (np.asarray(times, dtype='datetime64[ns]') - np.asarray(times, dtype='datetime64[ns]')[0]) / np.timedelta64(1, 's')
+    excess = np.asarray(ec, dtype='float64') - np.asarray(background, dtype='float64')
+    if len(seconds) < 2:
+        return 0.0
+    return float(np.sum(0.5 * (excess[1:] + excess[:-1]) * np.diff(seconds)))
+
+def estimate_background(df_dump, df_baseline=None, method='baseline', edge_points=5):
+    """
+    Estimates the background EC.T under a salt wave.
+
+    Parameters:
+    - df_dump (pd.DataFrame): Dump window ('Datetime', 'EC.T').
+    - df_baseline (pd.DataFrame): Baseline record ('Datetime', 'EC.T'). Required for method 'baseline'.
+    - method (str): 'baseline' interpolates the baseline record onto the dump timestamps (its median is used
+                    where the record does not cover them); 'edges' draws a line between the means of the first
+                    and last edge_points readings of the dump window.
+    - edge_points (int): Number of readings averaged at each end of the window for method 'edges'.
+
+    Returns:
+    - background (np.ndarray): Background EC.T per dump timestamp [uS/cm].
+    """
+    times = df_dump['Datetime'].to_numpy(dtype='datetime64[ns]').astype('int64')
+
+    if method == 'baseline':
+        if df_baseline is None or df_baseline.empty:
+            raise ValueError("A baseline record is required for the 'baseline' background method.")
+        baseline_times = df_baseline['Datetime'].to_numpy(dtype='datetime64[ns]').astype('int64')
+        baseline_ec = df_baseline['EC.T'].to_numpy(dtype='float64')
+        background = np.interp(times, baseline_times, baseline_ec)
+        outside = (times < baseline_times[0]) | (times > baseline_times[-1])
+        background[outside] = np.median(baseline_ec)
+        return background
+
+    if method == 'edges':
+        ec = df_dump['EC.T'].to_numpy(dtype='float64')
+        n_edge = max(1, min(edge_points, len(ec) // 2))
+        start_ec, end_ec = ec[:n_edge].mean(), ec[-n_edge:].mean()
+        if times[-1] == times[0]:
+            return np.full(len(ec), start_ec)
+        return start_ec + (end_ec - start_ec) * (times - times[0]) / (times[-1] - times[0])
+
+    raise ValueError(f"Invalid background method: {method}. Expected 'baseline' or 'edges'.")
+
+def calculate_discharge(dump_file, baseline_file=None, cf_file=None, salt_mass=None, metadata_file=None, background_method=None, cf_calibration=None):
+    """
+    Calculates discharge from one salt dump with the salt dilution (slug injection) method.
+
+    Q = M / (CF * integral of (EC.T - background) dt), with M the salt mass [g], CF the calibration factor
+    [(g/m3) / (uS/cm)] and the integral in [uS/cm * s], giving Q in m3/s.
+
+    Parameters:
+    - dump_file (Path or str): Processed dump file (see parse_salt_filename).
+    - baseline_file (Path or str): Baseline file of the same visit.
+    - cf_file (Path or str): *_CFvals.xlsx file of the dump's sensor.
+    - salt_mass (float): Salt mass [g]. None reads it from metadata_file for the dump number.
+    - metadata_file (Path or str): Field metadata file of the visit.
+    - background_method (str): 'baseline' or 'edges' (see estimate_background). None uses 'baseline' when a
+                               baseline file is given, otherwise 'edges'.
+    - cf_calibration (dict): CF catalog row of the sensor (see find_best_cf). When given, its 'cf' and 'r2'
+                             are used and cf_file is not opened.
+
+    Returns:
+    - result (dict): One row of the discharge results table (see DISCHARGE_COLUMNS).
+    """
+    info = parse_salt_filename(dump_file) or {}
+    result = dict.fromkeys(DISCHARGE_COLUMNS)
+    result.update({key: info.get(key) for key in ('site', 'date', 'dump', 'location', 'sensor')})
+    result.update({
+        'dump_file': str(dump_file), 'baseline_file': str(baseline_file) if baseline_file else None,
+        'cf_file': str(cf_file) if cf_file else None, 'metadata_file': str(metadata_file) if metadata_file else None,
+        'error': '',
+    })
+
+    df_dump = read_ec_series(dump_file)
+    if len(df_dump) < 2:
+        raise ValueError(f"{Path(dump_file).name} holds fewer than two EC.T readings.")
+    result.update({'start': df_dump['Datetime'].iloc[0], 'end': df_dump['Datetime'].iloc[-1], 'n_points': len(df_dump)})
+
+    # Calibration factor
+    if cf_calibration is not None:
+        cf = cf_calibration
+    elif cf_file is not None:
+        header, df_cf = read_cf_file(cf_file)
+        cf = calculate_cf(df_cf, header.get('Primary solution [g/m3]'))
+    else:
+        raise ValueError(f"No CF file found for sensor {info.get('sensor')}.")
+    result['cf'], result['cf_r2'] = cf['cf'], cf['r2']
+
+    # Salt mass of the dump
+    if salt_mass is None:
+        if metadata_file is None:
+            raise ValueError("No salt mass given and no metadata file found.")
+        df_dumps = read_salt_dumps(metadata_file)
+        dump_number = pd.to_numeric(info.get('dump'), errors='coerce')
+        salt_masses = df_dumps.loc[df_dumps['Dump Number'] == dump_number, 'Salt Mass (g)']
+        if salt_masses.empty:
+            raise ValueError(f"Dump {info.get('dump')} not found in {Path(metadata_file).name}.")
+        salt_mass = salt_masses.iloc[0]
+    result['salt_mass_g'] = float(salt_mass)
+
+    # Background-subtracted EC.T integral
+    if background_method is None:
+        background_method = 'baseline' if baseline_file is not None else 'edges'
+    df_baseline = read_ec_series(baseline_file) if background_method == 'baseline' else None
+    background = estimate_background(df_dump, df_baseline, method=background_method)
+    integral = integrate_ec(df_dump['Datetime'], df_dump['EC.T'], background)
+    result.update({
+        'background_method': background_method, 'background_ec': float(np.mean(background)),
+        'peak_ec': float(df_dump['EC.T'].max()), 'ec_integral': integral,
+    })
+
+    if not integral > 0 or not np.isfinite(result['cf']):
+        raise ValueError(f"Invalid EC.T integral ({integral:.1f} uS/cm*s) or CF ({result['cf']}).")
+    result['discharge_m3s'] = result['salt_mass_g'] / (result['cf'] * integral)
+    return result
+
+def detect_salt_waves(times, ec, dump_times, baseline_window=pd.Timedelta(minutes=5), max_duration=pd.Timedelta(minutes=45),
+                      padding=pd.Timedelta(minutes=1), rise_fraction=0.05, return_fraction=0.02, min_snr=5.0):
+    """
+    Suggests a salt wave window for each recorded dump time in an EC.T series.
+
+    A trailing rolling median and rolling MAD give the background and noise just before each dump. The
+    peak is the maximum between the dump and the next dump (or max_duration), the rise is the last reading
+    before the peak at or below rise_fraction of the peak excess, and the return is the first reading after
+    the peak at or below return_fraction of it (or the noise level). Every reading is visited a constant
+    number of times, so the cost is O(n).
+
+    Parameters:
+    - times (array-like): Sorted timestamps (datetime64).
+    - ec (array-like): EC.T values [uS/cm].
+    - dump_times (list): Field-recorded salt dump times.
+    - baseline_window (pd.Timedelta): Length of the trailing rolling background window.
+    - max_duration (pd.Timedelta): Longest wave searched after a dump.
+    - padding (pd.Timedelta): Background kept on each side of the wave in the suggested window.
+    - rise_fraction (float): Fraction of the peak excess marking the start of the rise.
+    - return_fraction (float): Fraction of the peak excess marking the return to background.
+    - min_snr (float): Peak excess over noise below which no wave is reported (confidence 0).
+
+    Returns:
+    - df_waves (pd.DataFrame): One row per dump time in the series: dump_time, start, end (suggested window,
+                               snapped to timestamps of the series), rise_time, peak_time, return_time,
+                               baseline_ec, peak_ec, noise, returned (bool) and confidence (0-1).
+    """
+    wave_columns = ['dump_time', 'start', 'end', 'rise_time', 'peak_time', 'return_time',
+                    'baseline_ec', 'peak_ec', 'noise', 'returned', 'confidence']
+    times = pd.DatetimeIndex(pd.to_datetime(times))
+    ec = np.asarray(ec, dtype='float64')
+    dump_times = sorted(pd.Timestamp(dump_time) for dump_time in dump_times if pd.notna(dump_time))
+    dump_times = [dump_time for dump_time in dump_times if len(times) and times[0] <= dump_time <= times[-1]]
+    if len(times) < 2 or not dump_times:
+        return pd.DataFrame(columns=wave_columns)
+
+    # Trailing rolling background and noise (median and median absolute deviation)
+    series = pd.Series(ec, index=times)
+    rolling_median = series.rolling(baseline_window, min_periods=1).median().to_numpy()
+    rolling_mad = (series - rolling_median).abs().rolling(baseline_window, min_periods=1).median().to_numpy()
+
+    time_values = times.to_numpy(dtype='datetime64[ns]')
+    dump_positions = np.searchsorted(time_values, np.array(dump_times, dtype='datetime64[ns]'))
+    end_positions = np.searchsorted(time_values, np.array([dump_time + max_duration for dump_time in dump_times], dtype='datetime64[ns]'))
+    # A wave search never runs into the next dump
+    end_positions = np.minimum(end_positions, np.r_[dump_positions[1:], len(ec)])
+    padding_ns = np.timedelta64(pd.Timedelta(padding).value, 'ns')
+
+    waves = []
+    for dump_time, i0, i1 in zip(dump_times, dump_positions, end_positions):
+        reference = max(i0 - 1, 0)
+        baseline, noise = rolling_median[reference], max(1.4826 * rolling_mad[reference], 1e-6)
+        wave = dict.fromkeys(wave_columns)
+        wave.update({'dump_time': dump_time, 'baseline_ec': baseline, 'noise': noise, 'returned': False, 'confidence': 0.0})
+        if i1 <= i0:
+            waves.append(wave)
+            continue
+
+        excess = ec[i0:i1] - baseline
+        peak = int(np.nanargmax(excess))
+        peak_excess = excess[peak]
+        wave.update({'peak_time': times[i0 + peak], 'peak_ec': ec[i0 + peak]})
+        snr = peak_excess / noise
+        if not snr >= min_snr:
+            waves.append(wave)
+            continue
+
+        # Rise: last reading before the peak close to the background
+        below = np.flatnonzero(excess[:peak] <= rise_fraction * peak_excess)
+        rise = below[-1] if len(below) else 0
+
+        # Return: first reading after the peak back at the background
+        return_level = max(return_fraction * peak_excess, 3 * noise)
+        back = np.flatnonzero(excess[peak:] <= return_level)
+        returned = len(back) > 0
+        ret = peak + back[0] if returned else len(excess) - 1
+
+        start_position = np.searchsorted(time_values, time_values[i0 + rise] - padding_ns)
+        end_position = min(np.searchsorted(time_values, time_values[i0 + ret] + padding_ns, side='right'), i1) - 1
+
+        # Confidence: signal to noise, return to background, and how close the window ends to the background
+        tail_excess = abs(np.nanmean(excess[ret:ret + 5])) if ret < len(excess) else peak_excess
+        confidence = min(1.0, snr / (4 * min_snr)) * (1.0 if returned else 0.5) * max(0.0, 1 - tail_excess / peak_excess)
+        wave.update({
+            'start': times[start_position], 'end': times[max(end_position, start_position)],
+            'rise_time': times[i0 + rise], 'return_time': times[i0 + ret],
+            'returned': returned, 'confidence': round(float(confidence), 3),
+        })
+        waves.append(wave)
+
+    return pd.DataFrame(waves, columns=wave_columns)
+
+def find_campaign_files(campaign_directory, cf_directory=None, metadata_directory=None, cf_catalog=None):
+    """
+    Pairs every dump file of a campaign directory with its baseline, CF and metadata files.
+
+    The baseline of a dump is the baseline file of the same site and date recorded by the same sensor if
+    there is one, otherwise the first baseline file of the visit. With a CF catalog, the sensor's
+    calibration of the same visit is taken from the catalog; failing that, a CF file next to the dump
+    files, and then the sensor's nearest calibration in the catalog.
+
+    Parameters:
+    - campaign_directory (Path or str): Directory of processed EC files (searched recursively).
+    - cf_directory (Path or str): Root of the CF tree. Defaults to CF_DIRECTORY.
+    - metadata_directory (Path or str): Root of the metadata tree. Defaults to METADATA_DIRECTORY.
+    - cf_catalog (pd.DataFrame): CF catalog (see update_cf_catalog). None looks up CF files by name only.
+
+    Returns:
+    - jobs (list): One dict per dump file with 'dump_file', 'baseline_file', 'cf_file', 'metadata_file'
+                   and 'cf_calibration' (catalog row, or None).
+    """
+    campaign_directory = Path(campaign_directory)
+    dump_files, baseline_files = [], {}
+    for file in sorted(campaign_directory.rglob("*.xlsx")):
+        info = parse_salt_filename(file)
+        if file.name.startswith('~') or info is None:
+            continue
+        if info['dump'] is None:
+            baseline_files.setdefault((info['site'], info['date']), []).append((info['sensor'], file))
+        else:
+            dump_files.append((info, file))
+
+    jobs = []
+    for info, file in dump_files:
+        baselines = baseline_files.get((info['site'], info['date']), [])
+        same_sensor = [baseline for sensor, baseline in baselines if sensor == info['sensor']]
+        baseline_file = same_sensor[0] if same_sensor else (baselines[0][1] if baselines else None)
+        visit_date = pd.to_datetime(info['date'], format='%Y%m%d')
+        cf_calibration, cf_file = None, None
+        if cf_catalog is not None:
+            cf_calibration = find_best_cf(cf_catalog, info['sensor'], visit_date, site=info['site'], max_age=pd.Timedelta(0))
+        if cf_calibration is None:
+            cf_file = find_cf_file(info['site'], info['date'], info['sensor'], cf_directory, [file.parent, campaign_directory])
+        if cf_calibration is None and cf_file is None and cf_catalog is not None:
+            cf_calibration = find_best_cf(cf_catalog, info['sensor'], visit_date, site=info['site'])
+        if cf_calibration is not None:
+            cf_file = cf_calibration['path']
+        jobs.append({
+            'dump_file': file,
+            'baseline_file': baseline_file,
+            'cf_file': cf_file,
+            'metadata_file': find_metadata_file(info['site'], info['date'], metadata_directory),
+            'cf_calibration': cf_calibration,
+        })
+    return jobs
+
+def _calculate_discharge_job(job, background_method=None):
+    """Runs calculate_discharge for one job and records failures in the result row. Runs in a worker process."""
+    try:
+        return calculate_discharge(**job, background_method=background_method)
+    except Exception as e:
+        info = parse_salt_filename(job['dump_file']) or {}
+        result = dict.fromkeys(DISCHARGE_COLUMNS)
+        result.update({key: info.get(key) for key in ('site', 'date', 'dump', 'location', 'sensor')})
+        result.update({key: str(value) if value is not None else None for key, value in job.items() if key != 'cf_calibration'})
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+def process_campaign(campaign_directory, cf_directory=None, metadata_directory=None, background_method=None, max_workers=None, cf_catalog=None):
+    """
+    Calculates discharge for every dump and sensor of a campaign directory, processing files in parallel.
+
+    Parameters:
+    - campaign_directory (Path or str): Directory of processed EC files (searched recursively).
+    - cf_directory (Path or str): Root of the CF tree. Defaults to CF_DIRECTORY.
+    - metadata_directory (Path or str): Root of the metadata tree. Defaults to METADATA_DIRECTORY.
+    - background_method (str): Background method passed to calculate_discharge.
+    - max_workers (int): Number of worker processes. None uses the number of CPUs.
+    - cf_catalog (pd.DataFrame): CF catalog used to find calibrations without opening CF files (see find_campaign_files).
+
+    Returns:
+    - df_results (pd.DataFrame): One row per dump file (see DISCHARGE_COLUMNS), sorted by site, date, dump and location.
+    """
+    jobs = find_campaign_files(campaign_directory, cf_directory, metadata_directory, cf_catalog)
+    if not jobs:
+        return pd.DataFrame(columns=DISCHARGE_COLUMNS)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_calculate_discharge_job, jobs, [background_method] * len(jobs)))
+
+    df_results = pd.DataFrame(results, columns=DISCHARGE_COLUMNS)
+    df_results['dump_number'] = pd.to_numeric(df_results['dump'], errors='coerce')
+    df_results = df_results.sort_values(['site', 'date', 'dump_number', 'location', 'sensor'], kind='stable')
+    return df_results.drop(columns='dump_number').reset_index(drop=True)
@@ -1,122 +1,141 @@
+import hashlib
+import io
 import streamlit as st
+import numpy as np
 import pandas as pd
 import os
 import matplotlib.pyplot as plt
-from datetime import datetime
-from openpyxl import load_workbook
-from openpyxl.styles import Font
-from project_utils import get_salt_dump_times
+from ec_store import list_ec_records
+from project_utils import decimate_minmax, get_salt_dump_times, sniff_ec_file, unstack_ec_timestamps, write_ec_dump
+from record_query import query_record
+from salt_dilution import detect_salt_waves
+
+# Maximum number of points drawn per series (the plots are decimated to this size)
+MAX_PLOT_POINTS = 4000
+
+# Column mapping of the supported EC exports to the app's column names
+EC_COLUMN_NAMES = {
+    'EC': 'EC',                  # AT exports
+    'RTCTmp': 'Temp',
+    'EC(uS/cm)': 'EC',           # QiQuac exports
+    'Temp(oC)': 'Temp',
+    'DT': 'Datetime',            # EC store records
+}
+
+
+@st.cache_data(show_spinner="Reading file...")
+def load_ec_upload(content_hash, _data, file_name):
+    """
+    Parses an uploaded EC export and runs the duplicate-timestamp correction once per file content.
+
+    The cache is keyed by the SHA-256 of the upload, so Streamlit reruns (every widget change) reuse the
+    parsed and corrected data instead of re-reading the workbook.
+    """
+    layout = sniff_ec_file(io.BytesIO(_data))
+    if layout['ec_col'] is None:
+        return None
+
+    df = pd.read_excel(io.BytesIO(_data), header=layout['header_row'])
+    df = df.rename(columns={layout['dt_col']: 'Datetime', layout['ec_col']: 'EC.T', **EC_COLUMN_NAMES})
+    df = df.reindex(columns=['Datetime', 'EC.T', 'EC', 'Temp'])
+    df['Datetime'] = pd.to_datetime(df['Datetime'], errors='coerce')
+    df = df[df['Datetime'].notna()].reset_index(drop=True)
+
+    # Auto-detect sensor name from the file name (AT exports) or the logger metadata (QiQuac exports)
+    sensor_name = None
+    if 'AT' in file_name:
+        start_idx = file_name.find('AT')
+        sensor_name = file_name[start_idx:start_idx + 5]
+    elif len(layout['metadata']) > 1:
+        sensor_name = layout['metadata'][1][0]  # Cell A2 value
+
+    df_corrected, unstack_report = unstack_ec_timestamps(df, dt_col='Datetime', interval=pd.Timedelta(seconds=5))
+    return df, df_corrected, unstack_report, sensor_name
+
+
+@st.cache_data(show_spinner="Reading record...", ttl=3600)
+def load_ec_record(record, day):
+    """
+    Reads one day of an EC store record and runs the duplicate-timestamp correction once per record and day.
+
+    Only the monthly partition and row groups holding the day are decoded (see record_query.query_record),
+    so a day of a multi-year record loads about as fast as a single logger export.
+    """
+    day = pd.Timestamp(day)
+    df = query_record(record, start=day, end=day + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns'), columns=['EC.T', 'EC', 'RTCTmp'])
+    df = df.rename(columns=EC_COLUMN_NAMES).reindex(columns=['Datetime', 'EC.T', 'EC', 'Temp'])
+    if df['EC.T'].isna().all():
+        return None
+    df_corrected, unstack_report = unstack_ec_timestamps(df, dt_col='Datetime', interval=pd.Timedelta(seconds=5))
+    return df, df_corrected, unstack_report, None
+
+
+@st.cache_data(show_spinner="Detecting salt waves...")
+def detect_waves(content_hash, corrected, dump_times, _times, _ec):
+    """Runs the salt wave detector once per file content, correction choice and set of dump times."""
+    return detect_salt_waves(_times, _ec, list(dump_times))
+
+
+def plot_decimated(ax, times, values, start=0, end=None, **kwargs):
+    """Plots rows start..end of a series, decimated to at most MAX_PLOT_POINTS points."""
+    end = len(values) if end is None else end
+    indices = start + decimate_minmax(values[start:end], MAX_PLOT_POINTS)
+    ax.plot(times[indices], values[indices], **kwargs)
 
 
 # Title of the app
 st.title("CHRL Saltwave Selection")
 
-# File upload widget
-uploaded_file = st.file_uploader("Upload your Excel file", type="xlsx")
-
-# Processing the file if uploaded
-if uploaded_file is not None:
-    # First try reading just the headers to detect file format
-    df_preview = pd.read_excel(uploaded_file, nrows=0)
-
-    if 'EC.T' in df_preview.columns:
-        # File Type 1: Headers in the first row
-        uploaded_file.seek(0)  # Reset file pointer
-        df = pd.read_excel(uploaded_file)
-
-        # Column Mapping for File Type 1
-        df.rename(columns={
-            'DT': 'Datetime',        # Rename DT to Datetime
-            'EC': 'EC',              # Rename EC to EC
-            'RTCTmp': 'Temp',        # Rename RTCTmp to Temp
-            'EC.T': 'EC.T'           # Keep EC.T as EC.T
-        }, inplace=True)
-        
-        # Auto-detect sensor name from file path (File Type 1)
-        if 'AT' in uploaded_file.name:
-            start_idx = uploaded_file.name.find('AT')
-            sensor_name = uploaded_file.name[start_idx:start_idx + 5]
-        else:
-            sensor_name = None  # User will specify later if not detected
-
-    elif 'EC.T(uS/cm)' in df_preview.columns:
-        # File Type 2 (headers removed before upload)
-        uploaded_file.seek(0)  # Reset file pointer
-        df = pd.read_excel(uploaded_file)
-
-        # Column Mapping for File Type 2 (headers removed before upload)
-        df.rename(columns={
-            'DateTime': 'Datetime',              # Rename DateTime to Datetime
-            'EC(uS/cm)': 'EC',                  # Rename EC(uS/cm) to EC
-            'Temp(oC)': 'Temp',                 # Rename Temp(oC) to Temp
-            'EC.T(uS/cm)': 'EC.T'               # Rename EC.T(uS/cm) to EC.T
-        }, inplace=True)
-
-    else:
-        # Try File Type 2: Headers in row 4
-        uploaded_file.seek(0)  # Reset file pointer
-        df_preview = pd.read_excel(uploaded_file, header=3, nrows=0)
-
-        if 'EC.T(uS/cm)' in df_preview.columns:
-            uploaded_file.seek(0)  # Reset file pointer
-            df = pd.read_excel(uploaded_file, header=3)
-
-            # Column Mapping for File Type 2
-            df.rename(columns={
-                'DateTime': 'Datetime',              # Rename DateTime to Datetime
-                'EC(uS/cm)': 'EC',                  # Rename EC(uS/cm) to EC
-                'Temp(oC)': 'Temp',                 # Rename Temp(oC) to Temp
-                'EC.T(uS/cm)': 'EC.T'               # Rename EC.T(uS/cm) to EC.T
-            }, inplace=True)
-
-            # Auto-detect sensor name from A2 cell (File Type 2)
-            df_meta = pd.read_excel(uploaded_file, header=None, nrows=2)
-            sensor_name = df_meta.iloc[1, 0]  # Cell A2 value
-        else:
+# Data source: an uploaded logger export, or one day of a continuous record of the EC store
+loaded = None
+source = st.radio("Data source", ["Upload a file", "EC store record"], horizontal=True)
+if source == "Upload a file":
+    # File upload widget
+    uploaded_file = st.file_uploader("Upload your Excel file", type="xlsx")
+    if uploaded_file is not None:
+        # Parse and correct once per file content
+        data = uploaded_file.getvalue()
+        content_hash = hashlib.sha256(data).hexdigest()
+        loaded = load_ec_upload(content_hash, data, uploaded_file.name)
+        if loaded is None:
             st.error("The uploaded file doesn't match any expected format. Please ensure it contains either 'EC.T' or 'EC.T(uS/cm)' columns.")
             st.stop()
+else:
+    record = st.selectbox("EC store record", list_ec_records(), index=None)
+    day = st.date_input("Date", value=None)
+    if record and day:
+        content_hash = f"{record}/{day:%Y-%m-%d}"
+        loaded = load_ec_record(record, day)
+        if loaded is None:
+            st.error(f"No EC.T readings stored in {record} on {day:%Y-%m-%d}.")
+            st.stop()
+
+# Processing the data once loaded
+if loaded is not None:
+    df, df_corrected, unstack_report, sensor_name = loaded
 
-    # remove unwanted columns amd arrange in desired order
-    df = df[['Datetime', 'EC.T', 'EC', 'Temp']]
     # Define the datetime column (dt_col)
-    dt_col = 'Datetime'  # Now it's 'Datetime' after renaming
-    df[dt_col] = pd.to_datetime(df['Datetime'], errors='coerce')
+    dt_col = 'Datetime'
 
     # Extract the first timestamp as a date string for file naming
     first_timestamp = df[dt_col].iloc[0]
     date_str = first_timestamp.strftime('%Y%m%d')
 
-    # Detect duplicated timestamps
-    duplicated_timestamps = df[df.duplicated('Datetime', keep=False)]
-
-    if not duplicated_timestamps.empty:
+    # Stacked timestamps were detected (and their retimed version built) while loading
+    corrected = False
+    if not unstack_report.empty:
         st.warning("Duplicated timestamps detected. Would you like to apply a correction?")
         proceed_with_correction = st.radio("Apply correction?", ['Yes', 'No'])
 
         if proceed_with_correction == 'Yes':
-            # Correction routine based on your provided script
-            df_original = df.copy()
-            df_corrected = df.copy()
-
-            for i in range(len(duplicated_timestamps)):
-                stacked_start_index = duplicated_timestamps.index[i]
-                gap_start = df_original['Datetime'].iloc[stacked_start_index - 1]
-                gap_end = df_original['Datetime'].iloc[stacked_start_index]
-                time_grid = pd.date_range(gap_start + pd.Timedelta(seconds=5), gap_end, freq='5s')
-
-                # Unstack the duplicated data
-                for column in ['EC', 'Temp', 'EC.T']:
-                    stacked_data = df_original.loc[stacked_start_index:stacked_start_index + len(time_grid) - 1, column].values
-                    df_corrected.loc[stacked_start_index:stacked_start_index + len(time_grid) - 1, 'Datetime'] = time_grid
-                    df_corrected.loc[stacked_start_index:stacked_start_index + len(time_grid) - 1, column] = stacked_data
-
             # Display correction applied
             st.success("Correction applied. Please review the result in the figure below.")
+            st.dataframe(unstack_report)
 
             # Plot the original vs corrected data
             fig, ax = plt.subplots(figsize=(10, 6))
-            ax.plot(df_original['Datetime'], df_original['EC.T'], label="Original EC.T(uS/cm)", color='red', linestyle='--')
-            ax.plot(df_corrected['Datetime'], df_corrected['EC.T'], label="Corrected EC.T(uS/cm)", color='blue')
+            plot_decimated(ax, df[dt_col].to_numpy(), df['EC.T'].to_numpy(dtype='float64'), label="Original EC.T(uS/cm)", color='red', linestyle='--')
+            plot_decimated(ax, df_corrected[dt_col].to_numpy(), df_corrected['EC.T'].to_numpy(dtype='float64'), label="Corrected EC.T(uS/cm)", color='blue')
             ax.set_xlabel('Time')
             ax.set_ylabel('Electrical Conductivity (EC.T(uS/cm))')
             ax.set_title('Original vs Corrected EC Time Series')
@@ -124,21 +143,31 @@ if uploaded_file is not None:
             ax.grid(True)
             plt.xticks(rotation=45)
             st.pyplot(fig)
+            plt.close(fig)
 
             proceed_with_corrected_data = st.radio("Are you happy with the correction?", ['Yes', 'No'])
             if proceed_with_corrected_data == 'Yes':
                 st.success("Proceeding with the corrected data.")
                 # Proceed with the corrected data to the next part of the app
                 df = df_corrected
+                corrected = True
             elif proceed_with_corrected_data == 'No':
                 st.warning("Correction aborted. Proceeding with the original data.")
-                df = df_original
         else:
             st.warning("Correction not applied. Proceeding with the original data.")
 
     else:
         st.success("No duplicated timestamps found. Proceeding with the original data.")
 
+    # Arrays used by the range selection and the plots (times must be sorted for the binary search)
+    df = df.sort_values(dt_col, kind='stable').reset_index(drop=True)
+    times = df[dt_col].to_numpy(dtype='datetime64[ns]')
+    ec_values = df['EC.T'].to_numpy(dtype='float64')
+    n_rows = len(times)
+    if n_rows == 0:
+        st.error("The data contains no timestamped readings.")
+        st.stop()
+
     # Dynamic Inputs Section (appears after file upload)
     st.subheader("User Inputs")
     
@@ -175,8 +204,10 @@ if uploaded_file is not None:
     
     # Ensure salt dump times are retrieved and stored in session state
     if stn and stn != "Other" and sensor_loc != 'baseline':
-        if not st.session_state.get('dump_times_retrieved', False):
-            salt_dump_times = get_salt_dump_times(stn)
+        # Recorded dump times are cached for an hour, a refresh picks up field forms submitted since
+        refresh_dump_times = st.button("Refresh salt dump times")
+        if refresh_dump_times or not st.session_state.get('dump_times_retrieved', False):
+            salt_dump_times = get_salt_dump_times(stn, refresh=refresh_dump_times)
             filtered_salt_dump_times = [sdt for sdt in salt_dump_times if min_time <= sdt <= max_time]
             st.session_state['filtered_salt_dump_times'] = filtered_salt_dump_times  # Store in session state
             st.session_state['dump_times_retrieved'] = True  # Set the flag
@@ -184,41 +215,65 @@ if uploaded_file is not None:
             # If already retrieved, just use the stored values
             filtered_salt_dump_times = st.session_state.get('filtered_salt_dump_times', [])
 
-    # Plot the data
-    fig, ax = plt.subplots(figsize=(10, 6))
+    # Suggest windows from the recorded dump times (as row positions, found by binary search on the times)
+    default_range = (0, n_rows - 1)
+    if 'filtered_salt_dump_times' in locals() and filtered_salt_dump_times:
+        df_waves = detect_waves(content_hash, corrected, tuple(filtered_salt_dump_times), df[dt_col], df['EC.T'])
+        st.write("Detected salt waves")
+        st.dataframe(df_waves[['dump_time', 'start', 'end', 'peak_time', 'peak_ec', 'confidence']], hide_index=True)
+        detected_waves = df_waves[df_waves['start'].notna()]
+        if not detected_waves.empty:
+            wave_idx = st.selectbox(
+                "Pre-select detected wave",
+                detected_waves.index,
+                format_func=lambda i: f"Dump at {df_waves.loc[i, 'dump_time']:%Y-%m-%d %H:%M:%S} (confidence {df_waves.loc[i, 'confidence']:.2f})"
+            )
+            wave_start = np.datetime64(detected_waves.loc[wave_idx, 'start'], 'ns')
+            wave_end = np.datetime64(detected_waves.loc[wave_idx, 'end'], 'ns')
+            default_range = (int(np.searchsorted(times, wave_start, side='left')),
+                             int(np.searchsorted(times, wave_end, side='right')) - 1)
+
+    # Range selection on row positions (the slider does not hold one option per sample)
+    if n_rows < 2:
+        # A slider needs distinct bounds, a single reading is selected as a whole
+        st.info("The data contains a single reading, it is selected as a whole.")
+        start_idx, end_idx = 0, n_rows - 1
+    else:
+        start_idx, end_idx = st.slider("Select time range (rows)", 0, n_rows - 1, value=default_range)
+    start_time, end_time = pd.Timestamp(times[start_idx]), pd.Timestamp(times[end_idx])
+    st.caption(f"Selected {start_time:%Y-%m-%d %H:%M:%S} to {end_time:%Y-%m-%d %H:%M:%S} ({end_idx - start_idx + 1} rows)")
 
-    # Plot the time series (using the detected EC column)
+    # Plot the data: decimated overview of the whole file, and a view of the selection that refines as it narrows
     ec_col = 'EC.T'
-    ax.plot(df[dt_col], df[ec_col], label=f"{ec_col} vs Time")
-    ax.set_xlabel('Time')
-    ax.set_ylabel(ec_col)
-    ax.grid(True)
-
-    # Plot vertical lines for each salt dump time within the selected range
-    if 'filtered_salt_dump_times' in locals() and filtered_salt_dump_times:
-        for sdt in filtered_salt_dump_times:
-            ax.axvline(x=sdt, color='red', linestyle='--', label="Salt Dump")
-
-    # Use select_slider with human-readable labels
-    start_time, end_time = st.select_slider(
-        "Select time range",
-        options=df[dt_col],
-        value=(min_time, max_time),
-        format_func=lambda x: x.strftime('%Y-%m-%d %H:%M:%S')
-    )
-
-    # Highlight the selected range on the plot
-    ax.axvspan(start_time, end_time, color='orange', alpha=0.3, label="Selected Range")
+    fig, (ax, ax_zoom) = plt.subplots(2, 1, figsize=(10, 9))
+    plot_decimated(ax, times, ec_values, label=f"{ec_col} vs Time")
+    zoom_margin = max((end_idx - start_idx) // 10, 1)
+    zoom_start, zoom_end = max(start_idx - zoom_margin, 0), min(end_idx + zoom_margin + 1, n_rows)
+    plot_decimated(ax_zoom, times, ec_values, zoom_start, zoom_end, label=f"{ec_col} (selection)")
+    for axis in (ax, ax_zoom):
+        axis.set_xlabel('Time')
+        axis.set_ylabel(ec_col)
+        axis.grid(True)
+
+        # Plot vertical lines for each salt dump time within the plotted range
+        if 'filtered_salt_dump_times' in locals() and filtered_salt_dump_times:
+            for sdt in filtered_salt_dump_times:
+                axis.axvline(x=sdt, color='red', linestyle='--', label="Salt Dump")
+
+        # Highlight the selected range on the plot
+        axis.axvspan(start_time, end_time, color='orange', alpha=0.3, label="Selected Range")
+    ax_zoom.set_xlim(times[zoom_start], times[zoom_end - 1])
     ax.legend()
 
     # Show plot in Streamlit
     st.pyplot(fig)
+    plt.close(fig)
 
     # Editable current dump counter
     current_dump = st.text_input("Current dump counter", value=None)
 
-    # Filter data based on selected time range
-    filtered_df = df[(df[dt_col] >= start_time) & (df[dt_col] <= end_time)]
+    # Filter data based on selected row range
+    filtered_df = df.iloc[start_idx:end_idx + 1]
 
     # User-defined output directory
     output_directory = st.text_input('\Hydrology_Shared Output Directory', value=f"H:\\tire-toxin\\data\\Discharge\\Manual_salt\\EC\\processed\\{stn}\\{date_str}")
@@ -233,5 +288,5 @@ if uploaded_file is not None:
     # Option to save the subset as a new Excel file
     if st.button(f"Save {filename} to \Hydrology_Shared"):
         os.makedirs(output_directory, exist_ok=True)
-        filtered_df.to_excel(output_file, index=False)
+        write_ec_dump(filtered_df, output_file)
         st.success(f"Subset saved to {output_file}")
@@ -1,12 +1,27 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Cursor
 from matplotlib.dates import num2date
-from openpyxl import load_workbook
-from openpyxl.styles import Font
+from project_utils import sniff_ec_file, write_ec_dump
+from salt_dilution import detect_salt_waves
+
+def select_saltwaves(file_path, stn, sensor_loc, initial_dump_number=1, date='', sensor_name='', output_directory=None, dump_times=None, min_confidence=0.5, copy_format=None, windows=None):
+    """
+    Cuts salt wave windows out of an EC logger file and saves one file per dump.
+
+    Windows are selected with two clicks per wave on the plot, taken from windows (a list of (start, end)
+    pairs, numbered from initial_dump_number), or, if the field-recorded dump times are given, detected
+    automatically with salt_dilution.detect_salt_waves. Detected windows below min_confidence are reported
+    and left for manual selection. copy_format ('parquet' or 'csv') also writes a compact copy of every
+    file for the discharge computation.
+
+    Without the plot (baseline files, windows or dump_times), returns a DataFrame of the files written
+    ('dump', 'start', 'end', 'confidence', 'output_file').
+    """
+    file_path = str(file_path)
 
-def select_saltwaves(file_path, stn, sensor_loc, initial_dump_number=1, date='', sensor_name='', output_directory=None):
     # If output_directory is not provided, use the current directory
     if output_directory is None:
         output_directory = os.getcwd()
@@ -14,44 +29,31 @@ def select_saltwaves(file_path, stn, sensor_loc, initial_dump_number=1, date='',
         # Ensure the directory exists, or create it
         os.makedirs(output_directory, exist_ok=True)
 
-    # Dynamically identify the first row containing a datetime value
-    data_preview = pd.read_excel(file_path, header=None)
-    first_data_row = None
-
-    # Identify the first row containing a valid datetime value in any column
-    for i, row in data_preview.iterrows():
-        # Apply pd.to_datetime to each cell and check for valid datetimes
-        converted_row = row.apply(lambda x: pd.to_datetime(x, errors='coerce'))
-
-        # Check if any value is a valid datetime AND within a reasonable range
-        is_datetime_row = converted_row.notna().any() and (converted_row.dt.year > 2020).any()
-        if is_datetime_row:
-            first_data_row = i
-            break
-
-    if first_data_row is None:
-        raise ValueError("No datetime values found in the file. Please check the file format.")
+    # Identify the layout from the first rows only (logger metadata, header row, datetime and EC.T columns)
+    layout = sniff_ec_file(file_path)
+    header_row = layout['header_row']
 
     # Store metadata (all lines above column names) in a dataframe
-    metadata = data_preview.iloc[:first_data_row - 2]
+    metadata = pd.DataFrame(layout['metadata'])
 
     # Load data with identified column names and skipping metadata rows
-    df = pd.read_excel(file_path, header=first_data_row-1)
+    df = pd.read_excel(file_path, header=header_row)
 
     # Ensure datetime column is parsed as datetime and naive
-    dt_col = 'DT' if 'DT' in df.columns else 'DateTime'
+    dt_col = layout['dt_col']
     df[dt_col] = pd.to_datetime(df[dt_col]).dt.tz_localize(None)
 
     # Identify plot column
-    plot_col = 'EC.T' if 'EC.T' in df.columns else 'EC.T(uS/cm)'
+    plot_col = layout['ec_col'] if layout['ec_col'] is not None else 'EC.T'
     
     # Handle sensor name detection
     if not sensor_name:
         if 'AT' in file_path:
             start_idx = file_path.find('AT')
             sensor_name = file_path[start_idx:start_idx + 5]
-        elif 'TM7.' in metadata.iloc[-1, 0]:
-            sensor_name = 'TM7.' + metadata.iloc[-1, 0].split('TM7.')[1]
+        elif any('TM7.' in str(value) for value in metadata.get(0, [])):
+            sensor_line = next(str(value) for value in metadata[0] if 'TM7.' in str(value))
+            sensor_name = 'TM7.' + sensor_line.split('TM7.')[1]
 
     # Handle date detection
     if not date:
@@ -64,12 +66,56 @@ def select_saltwaves(file_path, stn, sensor_loc, initial_dump_number=1, date='',
             f"{stn}_{date}_{sensor_loc}_{sensor_name}.xlsx"
         )
 
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            metadata.to_excel(writer, index=False, header=False)
-            df.to_excel(writer, index=False, startrow=first_data_row)
+        write_ec_dump(df, output_file, metadata_rows=layout['metadata'], header_row=header_row, copy_format=copy_format)
 
         print(f"{sensor_loc} file saved: {output_file}")
-        return  # Skip the interactive plotting for 'baselineX'
+        # Skip the interactive plotting for 'baselineX'
+        return pd.DataFrame([{'dump': None, 'start': df[dt_col].min(), 'end': df[dt_col].max(), 'confidence': None, 'output_file': output_file}])
+
+    # Dump files are written on a background worker, so the click handler returns immediately
+    writer = ThreadPoolExecutor(max_workers=1)
+
+    def report_saved(future, output_file):
+        try:
+            future.result()
+            print(f"Saved: {output_file}")
+        except Exception as e:
+            print(f"Failed to save {output_file}: {type(e).__name__}: {e}")
+
+    def save_saltwave(new_df, output_file):
+        """Queues one wave window (metadata rows, plain header and data, written in one pass)."""
+        future = writer.submit(write_ec_dump, new_df.copy(), output_file, layout['metadata'], header_row, copy_format)
+        future.add_done_callback(lambda future: report_saved(future, output_file))
+        return future
+
+    # Cut the given windows, or the windows detected from the recorded dump times
+    if windows is not None or dump_times is not None:
+        if windows is not None:
+            cuts = [{'start': pd.Timestamp(start), 'end': pd.Timestamp(end), 'confidence': None} for start, end in windows]
+        else:
+            df_waves = detect_salt_waves(df[dt_col], df[plot_col], dump_times)
+            cuts = df_waves[['dump_time', 'start', 'end', 'confidence']].to_dict('records')
+
+        futures = []
+        for dump_counter, cut in enumerate(cuts, start=initial_dump_number):
+            cut['dump'] = dump_counter
+            if cut['confidence'] is not None and cut['confidence'] < min_confidence:
+                print(f"Dump at {cut['dump_time']}: no clear wave detected (confidence {cut['confidence']:.2f}), select it manually.")
+                continue
+            new_df = df[(df[dt_col] >= cut['start']) & (df[dt_col] <= cut['end'])]
+            cut['output_file'] = os.path.join(
+                output_directory,
+                f"{stn}_{date}_dump{dump_counter}_{sensor_loc}_{sensor_name}.xlsx"
+            )
+            if cut['confidence'] is not None:
+                print(f"Dump at {cut['dump_time']}: window {cut['start']} to {cut['end']} (confidence {cut['confidence']:.2f})")
+            futures.append(save_saltwave(new_df, cut['output_file']))
+
+        # Wait for the queued files and surface any write error
+        writer.shutdown(wait=True)
+        for future in futures:
+            future.result()
+        return pd.DataFrame(cuts, columns=['dump', 'start', 'end', 'confidence', 'output_file'])
 
     # Plot the time series
     fig, ax = plt.subplots()
@@ -106,24 +152,14 @@ def select_saltwaves(file_path, stn, sensor_loc, initial_dump_number=1, date='',
                     output_directory, 
                     f"{stn}_{date}_dump{dump_counter}_{sensor_loc}_{sensor_name}.xlsx"
                 )
+                save_saltwave(new_df, output_file)
 
-                # Write the file
-                with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                    metadata.to_excel(writer, index=False, header=False)
-                    new_df.to_excel(writer, index=False, startrow=first_data_row)
-
-                # Remove any formatting applied to headers
-                workbook = load_workbook(output_file)
-                sheet = workbook.active
-                for cell in sheet[1]:  # Assuming the first row is the header row
-                    cell.font = Font(bold=False)  # Remove bold formatting
-
-                workbook.save(output_file)
-
-                print(f"Saved: {output_file}")
                 dump_counter += 1
                 points.clear()
                 subset_times.clear()
 
     fig.canvas.mpl_connect('button_press_event', on_click)
     plt.show()
+
+    # Wait for the queued dump files once the plot is closed
+    writer.shutdown(wait=True)
@@ -0,0 +1,251 @@
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from partition_store import PARTITION_ROW_GROUP_SIZE, clear_partition_index_cache, read_partition_range, store_lock
+
+# Root directory of the columnar stage store (one sub-directory per site, one Parquet file per month)
+STAGE_STORE_DIRECTORY = Path(r"H:\tire-toxin\data\Discharge\Stage\processed\store")
+
+# Column order of the master stage records
+STAGE_COLUMNS = ['Differential Pressure (kPa)', 'Absolute Pressure (kPa)', 'Temperature (°C)',
+                 'Barometric Pressure (kPa)', 'Water Level (m)']
+
+# Typed schema of a stage partition
+STAGE_SCHEMA = pa.schema(
+    [pa.field('Datetime', pa.timestamp('ns'), nullable=False)]
+    + [pa.field(col, pa.float64()) for col in STAGE_COLUMNS]
+)
+
+def _site_directory(site_name, root=None):
+    """Returns the partition directory for a site."""
+    return Path(root if root is not None else STAGE_STORE_DIRECTORY) / site_name
+
+def _partition_path(site_name, month, root=None):
+    """Returns the Parquet file path for a site and month ('YYYY-MM')."""
+    return _site_directory(site_name, root) / f"{month}.parquet"
+
+def stage_site_lock(site_name, root=None, timeout=600, poll_interval=0.5):
+    """Holds the store lock on a site's partitions so concurrent writers are serialized, see partition_store.store_lock."""
+    return store_lock(_site_directory(site_name, root), timeout=timeout, poll_interval=poll_interval)
+
+
+def list_stage_partitions(site_name, root=None):
+    """
+    Lists the monthly partitions stored for a site.
+
+    Parameters:
+    - site_name (str): Stage site name (e.g. 'chase_us', 'chase_usBT').
+    - root (Path or str): Store root directory. Defaults to STAGE_STORE_DIRECTORY.
+
+    Returns:
+    - partitions (list): Sorted list of month keys ('YYYY-MM') present in the store.
+    """
+    site_directory = _site_directory(site_name, root)
+    if not site_directory.exists():
+        return []
+    return sorted(path.stem for path in site_directory.glob("*.parquet"))
+
+def stage_site_signature(site_name, root=None):
+    """
+    Returns a signature of a site's stored partitions that changes whenever any partition is written.
+
+    Partitions are replaced by rename on every write, so their modification times and sizes are enough to
+    tell whether data cached from the site (e.g. a barometric grid) is still current, also across processes.
+
+    Returns:
+    - signature (tuple): (month, mtime_ns, size) of each partition, empty if nothing is stored.
+    """
+    signature = []
+    for month in list_stage_partitions(site_name, root):
+        try:
+            stat = os.stat(_partition_path(site_name, month, root))
+        except FileNotFoundError:
+            continue
+        signature.append((month, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def stage_site_exists(site_name, root=None):
+    """Checks whether any stage data is stored for a site."""
+    return len(list_stage_partitions(site_name, root)) > 0
+
+def to_stage_frame(df, float_dtype='float64'):
+    """
+    Enforces the stage schema: datetime64 index named 'Datetime' and typed float master columns in master order.
+
+    Missing values are stored as NaN in contiguous float arrays, so downstream corrections, groupby
+    and fill-value scrubs never operate on boxed Python objects.
+
+    Parameters:
+    - df (pd.DataFrame): Stage data with a datetime index. Missing master columns are added as NaN.
+    - float_dtype (str): 'float64' (default) or 'float32' for a compact in-memory frame.
+
+    Returns:
+    - df (pd.DataFrame): Copy of the data with the typed master columns in master order.
+
+    Raises:
+    - ValueError: If float_dtype is not supported or index values cannot be parsed as datetimes.
+    """
+    if float_dtype not in ('float64', 'float32'):
+        raise ValueError(f"Invalid float dtype: {float_dtype}. Expected 'float64' or 'float32'.")
+
+    # Validate the datetime index
+    index = pd.to_datetime(df.index, errors='coerce')
+    n_invalid = int((index.isna() & pd.notna(df.index)).sum())
+    if n_invalid > 0:
+        raise ValueError(f"{n_invalid} index values could not be parsed as datetimes.")
+
+    df_typed = pd.DataFrame(index=pd.DatetimeIndex(index).astype('datetime64[ns]'))
+    df_typed.index.name = 'Datetime'
+    for col in STAGE_COLUMNS:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors='coerce')
+            n_coerced = int((values.isna() & df[col].notna()).sum())
+            if n_coerced > 0:
+                print(f"Warning: {n_coerced} non-numeric values in '{col}' were set to missing.")
+            df_typed[col] = values.to_numpy(dtype=float_dtype, na_value=np.nan)
+        else:
+            df_typed[col] = np.full(len(df_typed), np.nan, dtype=float_dtype)
+    return df_typed
+
+def stage_memory_report(df):
+    """
+    Reports the in-memory footprint of a stage DataFrame per column.
+
+    Parameters:
+    - df (pd.DataFrame): Stage data.
+
+    Returns:
+    - report (pd.DataFrame): dtype and memory (MB, including boxed objects) of the index and each column,
+                             with a 'Total' row.
+    """
+    usage = df.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({
+        'dtype': [str(df.index.dtype)] + [str(dtype) for dtype in df.dtypes],
+        'memory (MB)': usage.to_numpy() / 1e6,
+    }, index=['Index'] + list(df.columns))
+    report.loc['Total'] = ['', report['memory (MB)'].sum()]
+    return report
+
+def _read_partition(path, columns=None):
+    """Reads one monthly partition into a DataFrame indexed by Datetime."""
+    read_columns = None if columns is None else ['Datetime'] + list(columns)
+    table = pq.read_table(path, columns=read_columns)
+    return table.to_pandas().set_index('Datetime')
+
+def _write_partition(df, path):
+    """Writes one monthly partition atomically (temporary file + rename)."""
+    os.makedirs(path.parent, exist_ok=True)
+    table = pa.Table.from_pandas(df.reset_index(), schema=STAGE_SCHEMA, preserve_index=False)
+    temp_path = path.with_suffix('.parquet.tmp')
+    pq.write_table(table, temp_path, row_group_size=PARTITION_ROW_GROUP_SIZE)
+    os.replace(temp_path, path)
+    clear_partition_index_cache(path)
+
+def append_stage_data(site_name, df, root=None, keep='new'):
+    """
+    Appends stage data to the store, rewriting only the monthly partitions whose content changes.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - df (pd.DataFrame): Stage data with a datetime index.
+    - root (Path or str): Store root directory. Defaults to STAGE_STORE_DIRECTORY.
+    - keep (str): Which record wins when a timestamp already exists in the store, 'new' (default) or 'existing'.
+
+    Returns:
+    - written_partitions (list): Month keys ('YYYY-MM') of the partitions that were written.
+    """
+    if keep not in ('new', 'existing'):
+        raise ValueError(f"Invalid keep option: {keep}. Expected 'new' or 'existing'.")
+
+    df = to_stage_frame(df)
+    df = df[df.index.notna()]
+    if df.empty:
+        return []
+
+    written_partitions = []
+    months = df.index.strftime('%Y-%m')
+    with stage_site_lock(site_name, root):
+        for month, df_month in df.groupby(months):
+            path = _partition_path(site_name, month, root)
+            df_existing = _read_partition(path) if path.exists() else None
+            if df_existing is not None:
+                df_month = pd.concat([df_existing, df_month] if keep == 'new' else [df_month, df_existing])
+            # Stable sort keeps the concatenation order for equal timestamps, so 'last' is the winner
+            df_month = df_month.sort_index(kind='stable')
+            df_month = df_month[~df_month.index.duplicated(keep='last')]
+            # Leave partitions whose content is unchanged untouched
+            if df_existing is not None and df_month.equals(df_existing):
+                continue
+            _write_partition(df_month, path)
+            written_partitions.append(month)
+
+    return written_partitions
+
+def read_stage_data(site_name, start=None, end=None, columns=None, root=None):
+    """
+    Reads stage data for a site, opening only the monthly partitions and row groups that overlap the requested range.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - start (str or pd.Timestamp): Inclusive start of the time range. None reads from the first record.
+    - end (str or pd.Timestamp): Inclusive end of the time range. None reads to the last record.
+    - columns (list): Subset of STAGE_COLUMNS to read. None reads all master columns.
+    - root (Path or str): Store root directory. Defaults to STAGE_STORE_DIRECTORY.
+
+    Returns:
+    - df (pd.DataFrame): Sorted stage data indexed by Datetime (empty if nothing is stored).
+    """
+    columns = STAGE_COLUMNS if columns is None else list(columns)
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    # Partition pruning on the month keys
+    partitions = list_stage_partitions(site_name, root)
+    if start is not None:
+        partitions = [month for month in partitions if month >= start.strftime('%Y-%m')]
+    if end is not None:
+        partitions = [month for month in partitions if month <= end.strftime('%Y-%m')]
+
+    tables = [read_partition_range(_partition_path(site_name, month, root), start, end, columns) for month in partitions]
+    tables = [table for table in tables if table is not None]
+    if not tables:
+        df = pd.DataFrame(columns=columns, dtype='float64', index=pd.DatetimeIndex([], name='Datetime'))
+        return df
+
+    df = pa.concat_tables(tables).to_pandas().set_index('Datetime')
+    return df[columns]
+
+def get_high_water_mark(site_name, root=None):
+    """
+    Returns the latest timestamp stored for a site, reading only the last monthly partition.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - root (Path or str): Store root directory. Defaults to STAGE_STORE_DIRECTORY.
+
+    Returns:
+    - high_water_mark (pd.Timestamp or None): Latest stored timestamp, or None if nothing is stored.
+    """
+    partitions = list_stage_partitions(site_name, root)
+    if not partitions:
+        return None
+    df_last = _read_partition(_partition_path(site_name, partitions[-1], root), columns=[])
+    return df_last.index.max() if len(df_last.index) > 0 else None
+
+def import_stage_master(site_name, master_file, root=None):
+    """
+    Imports an existing *_stage_master.xlsx file into the store.
+
+    Parameters:
+    - site_name (str): Stage site name.
+    - master_file (Path or str): Path of the Excel master file.
+    - root (Path or str): Store root directory. Defaults to STAGE_STORE_DIRECTORY.
+
+    Returns:
+    - written_partitions (list): Month keys ('YYYY-MM') of the partitions that were written.
+    """
+    df_master = pd.read_excel(master_file, header=0, index_col=0, parse_dates=True)
+    return append_stage_data(site_name, df_master, root=root, keep='existing')
@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from project_utils import unstack_ec_timestamps
 
 # REAL DATA
 filename = 'test_data/unstack-ec-timeseries/QQM_CH0_20241217_1051.xlsx'
@@ -10,38 +11,17 @@ df_original = pd.read_excel(filename, skiprows=3)
 df_original = df_original[['DateTime', 'EC(uS/cm)',	'Temp(oC)',	'EC.T(uS/cm)']]
 df_original['DateTime'] = pd.to_datetime(df_original['DateTime'])
 
-# Identify duplicated timestamps (stacked data points)
-duplicated_timestamps = df_original[df_original.duplicated('DateTime', keep=False)]
+# Logger interval of the QiQuac sensors
+interval = pd.Timedelta(seconds=5)
 
-if duplicated_timestamps.empty:
+# Retime each run of duplicated timestamps (stacked data points) across the gap before it
+df_corrected, unstack_report = unstack_ec_timestamps(df_original, dt_col='DateTime', interval=interval)
+
+if unstack_report.empty:
     print('No duplicated timestamps detected.')
 else:
-    # Initialize the corrected DataFrame as a copy of the original
-    df_corrected = df_original.copy()
-
-    # Iterate through each duplicated timestamp range
-    for i in range(len(duplicated_timestamps)):
-        stacked_start_index = duplicated_timestamps.index[i]
-
-        # Find the first duplicated timestamp and the preceding timestamp
-        gap_start = df_original['DateTime'].iloc[stacked_start_index - 1]
-        gap_end = df_original['DateTime'].iloc[stacked_start_index]
-        gap_duration = (gap_end - gap_start).total_seconds()
-
-        # Print gap details
-        print(f"\nGap Start: {gap_start}")
-        print(f"Gap End: {gap_end}")
-        print(f"Gap Duration (seconds): {gap_duration}")
-
-        # Create a 5-second time grid across the gap
-        time_grid = pd.date_range(gap_start + pd.Timedelta(seconds=5), gap_end, freq='5S')
-
-        # Unstack the stacked data for all columns
-        for column in ['EC(uS/cm)',	'Temp(oC)',	'EC.T(uS/cm)']:
-            stacked_data = df_original.loc[stacked_start_index:stacked_start_index + len(time_grid) - 1, column].values
-            # Update the corrected DataFrame with the unstacked data
-            df_corrected.loc[stacked_start_index:stacked_start_index + len(time_grid) - 1, "DateTime"] = time_grid
-            df_corrected.loc[stacked_start_index:stacked_start_index + len(time_grid) - 1, column] = stacked_data
+    # Print gap details
+    print(unstack_report.to_string(index=False))
 
     # Plot the original and corrected time series with x-axis in minutes:seconds for 'EC.T(uS/cm)'
     plt.figure(figsize=(10, 6))
@@ -65,10 +45,10 @@ else:
         "Uncorrected EC.T(uS/cm)": df_original['EC.T(uS/cm)'],
         "Corrected Time": df_corrected['DateTime'],
         "Corrected EC.T(uS/cm)": df_corrected['EC.T(uS/cm)'],
-        "Uncorrected Temp_oC_": df_original['Temp_oC_'],
-        "Corrected Temp_oC_": df_corrected['Temp_oC_'],
-        "Uncorrected EC_T_uS_cm_": df_original['EC_T_uS_cm_'],
-        "Corrected EC_T_uS_cm_": df_corrected['EC_T_uS_cm_']
+        "Uncorrected Temp(oC)": df_original['Temp(oC)'],
+        "Corrected Temp(oC)": df_corrected['Temp(oC)'],
+        "Uncorrected EC(uS/cm)": df_original['EC(uS/cm)'],
+        "Corrected EC(uS/cm)": df_corrected['EC(uS/cm)']
     })
 
     # Save the comparison table to an Excel file
@@ -0,0 +1,88 @@
+import re
+import gspread
+
+def _column_index(letters):
+    """Returns the 0-based position of an A1 column (e.g. 'AB' -> 27)."""
+    position = 0
+    for letter in letters:
+        position = position * 26 + ord(letter) - ord('A') + 1
+    return position - 1
+
+class StubWorksheet:
+    """In-memory worksheet with the gspread methods used by field_forms, recording every request."""
+
+    def __init__(self, title, header, rows):
+        self.title = title
+        self.header = list(header)
+        self.rows = [list(row) for row in rows]
+        self.requests = []
+        self.errors = []  # Raised (and consumed) one per request before the request is served
+
+    def _serve(self, request):
+        self.requests.append(request)
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def row_values(self, row):
+        self._serve(('row_values', row))
+        return list(self.header) if row == 1 else list(self.rows[row - 2])
+
+    def get_values(self, range_name):
+        self._serve(('get_values', range_name))
+        first_row, last_column = re.fullmatch(r"A(\d+):([A-Z]+)", range_name).groups()
+        return [row[:_column_index(last_column) + 1] for row in self.rows[int(first_row) - 2:]]
+
+    def batch_get(self, ranges):
+        self._serve(('batch_get', tuple(ranges)))
+        value_ranges = []
+        for range_name in ranges:
+            column, first_row, _ = re.fullmatch(r"([A-Z]+)(\d+):([A-Z]+)", range_name).groups()
+            position = _column_index(column)
+            cells = [[row[position]] if position < len(row) and row[position] != '' else []
+                     for row in self.rows[int(first_row) - 2:]]
+            # Like the Sheets API, trailing empty rows are omitted
+            while cells and not cells[-1]:
+                cells.pop()
+            value_ranges.append(cells)
+        return value_ranges
+
+class StubSpreadsheet:
+    def __init__(self, worksheets):
+        self._worksheets = worksheets
+
+    def worksheets(self):
+        return list(self._worksheets)
+
+class StubClient:
+    """Stands in for a gspread client: open_by_url returns the stub spreadsheet."""
+
+    def __init__(self, worksheets):
+        self.spreadsheet = StubSpreadsheet(worksheets)
+        self.opened = 0
+
+    def open_by_url(self, url):
+        self.opened += 1
+        return self.spreadsheet
+
+class OfflineClient:
+    """Client whose every request fails as without network access."""
+
+    def __init__(self):
+        self.opened = 0
+
+    def open_by_url(self, url):
+        self.opened += 1
+        raise ConnectionError("No network access.")
+
+class _Response:
+    """Minimal HTTP response for gspread.exceptions.APIError."""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'Stub error.', 'status': 'STUB'}}
+
+def api_error(status_code):
+    """Returns a gspread APIError with the given HTTP status (e.g. 429 rate limit, 404 not found)."""
+    return gspread.exceptions.APIError(_Response(status_code))
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+
+pytest.importorskip("matplotlib")  # select_saltwaves plots the interactive selection
+import batch_process_ec_saltwaves as batch
+
+DUMP_TIMES = {'northfield': [pd.Timestamp('2024-11-04 10:00')], 'chase_bridge': []}
+
+def fake_select_saltwaves(file, stn, sensor_loc, dump_times=None, windows=None, output_directory=None, **kwargs):
+    """Writes nothing, one cut per dump time or window."""
+    cuts = windows if windows is not None else dump_times
+    return pd.DataFrame({'output_file': [f"{stn}_dump{i}.xlsx" for i, _ in enumerate(cuts or [], start=1)]})
+
+def fake_get_salt_dump_times(station):
+    if station not in DUMP_TIMES:
+        raise ValueError(f"Invalid site name: {station}.")
+    return DUMP_TIMES[station]
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'select_saltwaves', fake_select_saltwaves)
+    monkeypatch.setattr(batch, 'get_salt_dump_times', fake_get_salt_dump_times)
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    manifest_file = tmp_path / "manifest.csv"
+    pd.DataFrame([
+        {'file': 'a.xlsx', 'station': 'northfield', 'location': 'RL', 'auto': 'yes', 'windows': ''},
+        {'file': 'b.xlsx', 'station': 'unknown_site', 'location': 'RL', 'auto': 'yes', 'windows': ''},
+        {'file': 'c.xlsx', 'station': 'chase_bridge', 'location': 'RR', 'auto': 'yes', 'windows': ''},
+        {'file': 'd.xlsx', 'station': 'unknown_site', 'location': 'RR', 'auto': '',
+         'windows': '2024-11-04 10:20/2024-11-04 10:45'},
+    ]).to_csv(manifest_file, index=False)
+    return manifest_file
+
+def test_station_failures_are_logged(manifest, tmp_path):
+    df_log = batch.run_manifest(manifest, tmp_path / "out", max_workers=2)
+    assert df_log['status'].tolist() == ['ok', 'failed', 'no_dumps', 'ok']
+    assert df_log['files_written'].tolist() == [1, 0, 0, 1]
+    assert 'Invalid site name' in df_log.loc[1, 'error']
+    assert df_log.loc[2, 'error'] == "No salt dump times recorded for this station."
+    assert len(list((tmp_path / "out").glob("run_log_*.csv"))) == 1
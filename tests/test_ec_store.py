@@ -0,0 +1,75 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from ec_store import (_spool_directory, ingest_ec_files, list_ec_partitions, read_ec_data, read_ec_manifest,
+                      spool_ec_export)
+
+RECORD = 'northfield_test'
+
+def write_export(path, start, periods, freq='10min', offset=0.0):
+    """Writes an AT-series style logger export (DT / EC.T in the first row)."""
+    times = pd.date_range(start, periods=periods, freq=freq)
+    pd.DataFrame({'DT': times, 'EC.T': np.arange(periods) + offset, 'PrbTmp': 5.0}).to_excel(path, index=False)
+    return path
+
+@pytest.fixture
+def exports(tmp_path):
+    # The second export repeats the last day of the first one with other readings
+    return [write_export(tmp_path / "a.xlsx", '2024-11-25', 1000),
+            write_export(tmp_path / "b.xlsx", '2024-12-01 21:30', 500, offset=1000.0)]
+
+def test_spool_splits_chunks_by_month(exports, tmp_path):
+    spooled = spool_ec_export(exports[0], tmp_path / "spool", columns=['EC.T'], chunk_size=100)
+    assert spooled['rows'] == 1000
+    assert spooled['start'] == pd.Timestamp('2024-11-25')
+    assert spooled['end'] == pd.Timestamp('2024-11-25') + 999 * pd.Timedelta('10min')
+    months = [month for month, _ in spooled['parts']]
+    assert months == sorted(months) and set(months) == {'2024-11', '2024-12'}
+    assert len(spooled['parts']) == 11  # ten chunks, one of them across the month boundary
+    df_part = pd.read_parquet(spooled['parts'][0][1])
+    assert df_part.columns.tolist() == ['DT', 'EC.T']
+
+def test_ingest_merges_files_by_month(exports, tmp_path):
+    root = tmp_path / "store"
+    df_ingested, written = ingest_ec_files(RECORD, exports, root=root, columns=['EC.T'], max_workers=2)
+    assert df_ingested['rows'].tolist() == [1000, 500]
+    assert written == ['2024-11', '2024-12']
+    assert list_ec_partitions(RECORD, root) == ['2024-11', '2024-12']
+    assert not _spool_directory(RECORD, root).exists()
+
+    df = read_ec_data(RECORD, root=root)
+    assert df['DT'].is_monotonic_increasing and not df['DT'].duplicated().any()
+    # Overlapping timestamps keep the readings of the earlier file
+    overlap = df['DT'] == pd.Timestamp('2024-12-01 22:00')
+    assert df.loc[overlap, 'EC.T'].item() == (pd.Timestamp('2024-12-01 22:00') - pd.Timestamp('2024-11-25')) / pd.Timedelta('10min')
+    assert len(df) == 1000 + 500 - 7
+
+    # Nothing is read again on a second run
+    df_ingested, written = ingest_ec_files(RECORD, exports, root=root, columns=['EC.T'], max_workers=2)
+    assert df_ingested.empty and written == []
+    assert len(read_ec_manifest(RECORD, root)) == 2
+
+def test_ingest_copies_of_one_export_once(exports, tmp_path):
+    root = tmp_path / "store"
+    copy_directory = tmp_path / "redownload"
+    copy_directory.mkdir()
+    copy = copy_directory / "a.xlsx"
+    copy.write_bytes(exports[0].read_bytes())
+
+    df_ingested, written = ingest_ec_files(RECORD, [exports[0], copy], root=root, columns=['EC.T'], max_workers=2)
+    assert written == ['2024-11', '2024-12']
+    assert len(read_ec_data(RECORD, root=root)) == 1000
+    # Both paths are in the manifest, so neither is hashed again on the next run
+    assert df_ingested['path'].tolist() == [str(exports[0]), str(copy)]
+    assert df_ingested['sha256'].nunique() == 1 and df_ingested['rows'].tolist() == [1000, 1000]
+    df_ingested, written = ingest_ec_files(RECORD, [exports[0], copy], root=root, columns=['EC.T'], max_workers=2)
+    assert df_ingested.empty and written == []
+
+def test_spool_directories_are_per_file(exports, tmp_path):
+    spool_directory = tmp_path / "spool"
+    first = spool_ec_export(exports[0], spool_directory, columns=['EC.T'], spool_name='00000')
+    second = spool_ec_export(exports[0], spool_directory, columns=['EC.T'], spool_name='00001')
+    assert first['sha256'] == second['sha256']
+    # Spooling the second copy leaves the parts of the first one in place
+    assert all(Path(path).exists() for _, path in first['parts'] + second['parts'])
@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+from field_forms import load_field_forms, read_field_forms, sync_field_forms
+from gspread_stub import OfflineClient, StubClient, StubWorksheet
+
+HEADER = ['submissionid', 'Site_Name', 'Arrival_Time_to_Site', 'Salt_Dump.Time_of_Salt_Dump']
+
+def form_rows():
+    return [
+        ['101', 'Northfield', '2024-11-04 09:00:00', '2024-11-04 10:00:00'],
+        ['101', 'Northfield', '2024-11-04 09:00:00', '2024-11-04 10:30:00'],
+        ['102', 'Chase Bridge', '2024-11-05 09:00:00', ''],
+        ['103', 'Northfield', '2024-12-02 08:00:00', '2024-12-02 09:00:00'],
+    ]
+
+@pytest.fixture
+def sheet():
+    worksheets = [StubWorksheet('v1', HEADER, form_rows()),
+                  StubWorksheet('v2', HEADER[:3] + ['Notes'], [['201', 'Cat Creek (Beaconsfield)', '2025-01-10 12:00:00', 'ice']])]
+    return StubClient(worksheets)
+
+@pytest.fixture
+def database(tmp_path):
+    return tmp_path / "field_forms.sqlite"
+
+def test_incremental_sync(sheet, database):
+    assert sync_field_forms(sheet, database) == {'v1': 4, 'v2': 1}
+    v1 = sheet.spreadsheet.worksheets()[0]
+    assert ('get_values', 'A2:D') in v1.requests
+
+    # Only the rows below those already mirrored are requested
+    v1.rows.append(['104', 'Northfield', '2025-02-01 10:00:00', '2025-02-01 10:15:00'])
+    v1.requests.clear()
+    assert sync_field_forms(sheet, database) == {'v1': 1, 'v2': 0}
+    assert ('get_values', 'A6:D') in v1.requests
+
+    df_forms = read_field_forms(database=database)
+    assert len(df_forms) == 6
+    assert df_forms.loc[df_forms['worksheet'] == 'v1', 'submissionid'].tolist() == ['101', '101', '102', '103', '104']
+
+def test_header_change_forces_full_sync(sheet, database):
+    sync_field_forms(sheet, database)
+    v1 = sheet.spreadsheet.worksheets()[0]
+    v1.header.append('Notes')
+    v1.rows = [row + ['new column'] for row in v1.rows]
+    v1.requests.clear()
+
+    assert sync_field_forms(sheet, database)['v1'] == 4
+    assert ('get_values', 'A2:E') in v1.requests
+    df_v1 = read_field_forms(worksheet='v1', database=database)
+    assert len(df_v1) == 4
+    assert (df_v1['Notes'] == 'new column').all()
+
+def test_offline_fallback(sheet, database, capsys):
+    sync_field_forms(sheet, database)
+    df_forms = load_field_forms(client=OfflineClient(), database=database)
+    assert len(df_forms) == 5
+    assert "Using the local mirror" in capsys.readouterr().out
+
+    # offline does not contact the sheet at all
+    client = OfflineClient()
+    assert len(load_field_forms(offline=True, client=client, database=database)) == 5
+    assert client.opened == 0
+
+def test_offline_fallback_without_mirror(database):
+    with pytest.raises(ConnectionError):
+        load_field_forms(client=OfflineClient(), database=database)
+
+def test_read_filters(sheet, database):
+    sync_field_forms(sheet, database)
+
+    df_site = read_field_forms(site_name='Northfield', database=database)
+    assert df_site['submissionid'].tolist() == ['101', '101', '103']
+
+    df_window = read_field_forms(start='2024-11-05', end=pd.Timestamp('2025-01-10 12:00'), database=database)
+    assert df_window['submissionid'].tolist() == ['102', '103', '201']
+
+    df_site_window = read_field_forms(site_name='Northfield', start='2024-12-01', database=database)
+    assert df_site_window['submissionid'].tolist() == ['103']
+
+    df_ids = read_field_forms(submissionids=[101, '201'], database=database)
+    assert df_ids['submissionid'].tolist() == ['101', '101', '201']
+
+    assert read_field_forms(site_name='Nowhere', database=database).empty
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+from flowtracker import (compare_with_salt_dilution, find_flowtracker_exports, ingest_flowtracker_exports,
+                         midsection_discharge, read_flowtracker_export, summarize_flowtracker_visits)
+
+STATIONS = [  # location [m], depth [m], mean velocity [m/s]
+    (0.5, 0.0, 0.0),
+    (1.0, 0.4, 0.20),
+    (2.0, 0.6, 0.30),
+    (3.5, 0.0, 0.0),
+]
+
+def expected_discharge():
+    """Mid-section station discharges of STATIONS worked out by hand (edge widths are half the first gap)."""
+    widths = [0.25, 0.75, 1.25, 0.75]
+    return np.array([velocity * depth * width for (_, depth, velocity), width in zip(STATIONS, widths)])
+
+def write_flowtracker2_export(path):
+    """Writes a FlowTracker2-style workbook: summary pairs above the station table and a totals row below it."""
+    rows = [
+        ['Site Name', 'chase_us', None, None, None, None, None],
+        ['Start Time', '2024-11-04 10:15:00', None, None, None, None, None],
+        ['End Time', '2024-11-04 10:55:00', None, None, None, None, None],
+        ['Total Discharge (m3/s)', 0.123, None, None, None, None, None],
+        ['Total Width (m)', 3.0, None, None, None, None, None],
+        [None] * 7,
+        ['Station #', 'Time', 'Location (m)', 'Method', 'Depth (m)', 'Velocity (m/s)', 'Discharge (m3/s)'],
+    ]
+    rows += [[i, f"10:{15 + i:02d}", location, '0.6', depth, velocity, None] for i, (location, depth, velocity) in enumerate(STATIONS)]
+    rows += [['Total', None, None, None, None, None, 0.123]]
+    pd.DataFrame(rows).to_excel(path, header=False, index=False, sheet_name='Measurement')
+    return path
+
+def write_ascii_export(dis_path):
+    """Writes a FlowTracker ASCII discharge file (.DIS) and its summary (.SUM)."""
+    lines = ["St  Loc (m)  Method  Depth (m)  %Dep  MeanV (m/s)  Area (m2)  Flow (m3/s)  %Q"]
+    for i, (location, depth, velocity) in enumerate(STATIONS):
+        lines.append(f"{i}  {location:.2f}  0.6\t{depth:.3f}  0.6  {velocity:.4f}  0.000  0.0000  0.0")
+    dis_path.write_text("\n".join(lines) + "\n", encoding='latin-1')
+    dis_path.with_suffix('.SUM').write_text(
+        "Site Name:  northfield\n"
+        "Start Date and Time  2024/11/05 09:00:00\n"
+        "Total Discharge (m3/s)  0.0987\n"
+        "Total Area (m2)  0.75\n", encoding='latin-1')
+    return dis_path
+
+def test_midsection_discharge_edges():
+    location, depth, velocity = map(list, zip(*STATIONS))
+    np.testing.assert_allclose(midsection_discharge(location, depth, velocity), expected_discharge())
+    # Measured from the other bank the station widths are the same
+    np.testing.assert_allclose(midsection_discharge(location[::-1], depth[::-1], velocity[::-1]), expected_discharge()[::-1])
+    assert midsection_discharge([1.0], [0.5], [0.2]).tolist() == [0.0]
+
+def test_read_flowtracker2_export(tmp_path):
+    summary, df_stations = read_flowtracker_export(write_flowtracker2_export(tmp_path / "chase_us_20241104_FT.xlsx"))
+    assert summary['site_name'] == 'chase_us'
+    assert summary['total_discharge'] == 0.123
+    assert pd.Timestamp(summary['end_time']) == pd.Timestamp('2024-11-04 10:55')
+    # The totals row has no location and is dropped
+    assert df_stations['location'].tolist() == [location for location, _, _ in STATIONS]
+    assert df_stations['velocity'].tolist() == [velocity for _, _, velocity in STATIONS]
+    assert df_stations['time'].tolist()[:2] == ['10:15', '10:16']
+
+def test_read_ascii_export_with_summary(tmp_path):
+    summary, df_stations = read_flowtracker_export(write_ascii_export(tmp_path / "northfield_20241105.DIS"))
+    assert summary['site_name'] == 'northfield'
+    assert pd.Timestamp(summary['start_time']) == pd.Timestamp('2024-11-05 09:00')
+    assert float(summary['total_discharge']) == pytest.approx(0.0987)
+    assert float(summary['total_area']) == pytest.approx(0.75)
+    assert df_stations['station'].tolist() == [0, 1, 2, 3]
+    assert df_stations['depth'].tolist() == [depth for _, depth, _ in STATIONS]
+    assert df_stations['fraction_depth'].tolist() == [0.6] * 4
+    assert df_stations['velocity'].tolist() == [velocity for _, _, velocity in STATIONS]
+
+def test_ingest_and_summarize(tmp_path):
+    write_flowtracker2_export(tmp_path / "chase_us_20241104_FT.xlsx")
+    write_ascii_export(tmp_path / "northfield_20241105.DIS")
+    (tmp_path / "notes_20241106.dis").write_text("no stations here\n")
+
+    files = find_flowtracker_exports(tmp_path)
+    df_flowtracker, errors = ingest_flowtracker_exports(files, output_file=tmp_path / "stations.parquet", max_workers=2)
+    assert list(errors) == [str(tmp_path / "notes_20241106.dis")]
+    assert len(pd.read_parquet(tmp_path / "stations.parquet")) == 2 * len(STATIONS)
+
+    df_visits = summarize_flowtracker_visits(df_flowtracker)
+    assert df_visits['site'].tolist() == ['chase_us', 'northfield']
+    assert df_visits['date'].tolist() == ['20241104', '20241105']
+    np.testing.assert_allclose(df_visits['midsection_discharge'], expected_discharge().sum())
+    np.testing.assert_allclose(df_visits['total_discharge'], [0.123, 0.0987])
+    assert df_visits['n_stations'].tolist() == [4, 4]
+    assert df_visits['total_width'].tolist() == [3.0, 3.0]
+
+def test_compare_with_salt_dilution_joins_site_and_date():
+    df_visits = pd.DataFrame({
+        'site': ['chase_us', 'chase_us', 'northfield'], 'date': ['20241104', '20241111', '20241104'],
+        'file': ['a.xlsx', 'b.xlsx', 'c.DIS'], 'start_time': pd.to_datetime(['2024-11-04 10:15', '2024-11-11 09:00', '2024-11-04 12:00']),
+        'total_discharge': [np.nan, 0.5, 0.3], 'midsection_discharge': [0.2, 0.45, 0.28],
+    })
+    df_results = pd.DataFrame({'site': ['Chase_US', 'Chase_US', 'cat_beacons'], 'date': [20241104, 20241104, 20241104],
+                               'dump': [1, 2, 1], 'discharge_m3s': [0.22, 0.18, 0.1]})
+
+    df_comparison = compare_with_salt_dilution(df_results, df_visits)
+    # Site names match regardless of case and integer dates match the YYYYMMDD strings
+    assert df_comparison['dump'].tolist() == [1, 2]
+    assert df_comparison['flowtracker_file'].tolist() == ['a.xlsx', 'a.xlsx']
+    # No reported total, so the mid-section sum is the FlowTracker discharge
+    np.testing.assert_allclose(df_comparison['flowtracker_discharge'], [0.2, 0.2])
+    np.testing.assert_allclose(df_comparison['discharge_ratio'], [1.1, 0.9])
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ec_store import append_ec_data, list_ec_records
+from partition_store import PARTITION_ROW_GROUP_SIZE
+from record_query import query_record, query_window
+from stage_store import append_stage_data
+
+@pytest.fixture
+def ec_root(tmp_path):
+    # Two months of 30 s readings, two row groups per partition
+    times = pd.date_range('2024-11-01', '2024-12-31 23:59:30', freq='30s')
+    assert len(times) > 2 * PARTITION_ROW_GROUP_SIZE
+    append_ec_data('northfield_longterm', pd.DataFrame({'DT': times, 'EC.T': np.arange(len(times), dtype='float64'),
+                                                        'PrbTmp': 5.0}), root=tmp_path)
+    return tmp_path
+
+def test_list_ec_records(ec_root):
+    assert list_ec_records(ec_root) == ['northfield_longterm']
+
+def test_query_window(ec_root):
+    center = pd.Timestamp('2024-11-20 10:00')
+    df = query_window('northfield', 'longterm', center, columns=['EC.T'], root=ec_root)
+    assert df.columns.tolist() == ['DT', 'EC.T']
+    assert df['DT'].iloc[0] == center - pd.Timedelta(minutes=30)
+    assert df['DT'].iloc[-1] == center + pd.Timedelta(hours=1.5)
+    assert len(df) == 2 * 120 + 1
+    # Values are the row positions in the record
+    assert df['EC.T'].iloc[0] == (center - pd.Timedelta(minutes=30) - pd.Timestamp('2024-11-01')) / pd.Timedelta('30s')
+
+def test_query_across_partitions(ec_root):
+    arrays = query_record('northfield_longterm', start='2024-11-30 23:00', end='2024-12-01 01:00', root=ec_root, as_arrays=True)
+    assert arrays['DT'].dtype == np.dtype('datetime64[ns]')
+    assert len(arrays['DT']) == 2 * 120 + 1
+    assert np.all(np.diff(arrays['EC.T']) == 1)
+    assert query_record('northfield_longterm', start='2025-01-05', root=ec_root).empty
+
+def test_query_stage_record(tmp_path):
+    times = pd.date_range('2024-11-01', periods=100, freq='15min')
+    append_stage_data('chase_us', pd.DataFrame({'Water Level (m)': np.linspace(0.5, 0.6, 100)}, index=times), root=tmp_path)
+    df = query_record('chase', 'us', start=times[10], end=times[19], columns=['Water Level (m)'], kind='stage', root=tmp_path)
+    assert df.columns.tolist() == ['Datetime', 'Water Level (m)']
+    assert df['Datetime'].tolist() == list(times[10:20])
+    with pytest.raises(ValueError):
+        query_record('chase', 'us', kind='flow', root=tmp_path)
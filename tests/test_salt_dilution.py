@@ -0,0 +1,166 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from salt_dilution import (calculate_discharge, detect_cf_plateaus, estimate_background, find_best_cf, integrate_ec,
+                           load_cf_catalog, update_cf_catalog)
+
+CF_LEVELS = [100, 104, 108, 112, 116, 120]
+
+def calibration_series(levels, air=20, ramp=0, noise=0.2, length=30, seed=0):
+    """Synthetic CF calibration: sensor in air, then one noisy plateau per level with optional mixing ramps."""
+    rng = np.random.default_rng(seed)
+    parts = [rng.normal(0.3, 0.1, air)]
+    for i, level in enumerate(levels):
+        if i and ramp:
+            parts.append(np.linspace(levels[i - 1] + 1, level - 1, ramp))
+        parts.append(rng.normal(level, noise, length))
+    return np.concatenate(parts)
+
+def test_plateaus_after_air_segment():
+    # Readings in air used to inflate the calibration step and merge neighbouring plateaus
+    df_plateaus = detect_cf_plateaus(calibration_series(CF_LEVELS))
+    assert len(df_plateaus) == 6
+    np.testing.assert_allclose(df_plateaus['ec_median'], CF_LEVELS, atol=0.5)
+    assert (df_plateaus['ec_spread'] < 0.5).all()
+    assert df_plateaus['start'].iloc[0] >= 20
+
+def test_plateaus_with_mixing_ramps():
+    df_plateaus = detect_cf_plateaus(calibration_series(CF_LEVELS, ramp=3))
+    np.testing.assert_allclose(df_plateaus['ec_median'], CF_LEVELS, atol=0.5)
+
+def test_plateaus_of_quantized_readings():
+    df_plateaus = detect_cf_plateaus(np.round(calibration_series(CF_LEVELS, ramp=3)))
+    np.testing.assert_allclose(df_plateaus['ec_median'], CF_LEVELS)
+
+def test_plateaus_explicit_min_ec():
+    ec = calibration_series(CF_LEVELS)
+    ec[:20] = 30.0  # sensor in the sample cup before the primary solution
+    df_plateaus = detect_cf_plateaus(ec, min_ec=50)
+    np.testing.assert_allclose(df_plateaus['ec_median'], CF_LEVELS, atol=0.5)
+
+def test_fewer_plateaus_than_expected():
+    df_plateaus = detect_cf_plateaus(calibration_series(CF_LEVELS[:3]), n_plateaus=6)
+    assert len(df_plateaus) == 3
+
+def test_too_short_series():
+    assert detect_cf_plateaus(np.full(5, 100.0)).empty
+
+def salt_wave(start='2024-11-04 10:00', step_s=5, background=100.0, peak=200.0, rise_s=60, fall_s=60, edge_s=30):
+    """Triangular salt wave over a constant background, sampled so that the trapezoid rule is exact."""
+    seconds = np.arange(0, edge_s + rise_s + fall_s + edge_s + step_s, step_s)
+    t = seconds - edge_s
+    excess = np.where((t > 0) & (t <= rise_s), peak * t / rise_s, 0.0)
+    excess = np.where((t > rise_s) & (t < rise_s + fall_s), peak * (rise_s + fall_s - t) / fall_s, excess)
+    times = pd.Timestamp(start) + pd.to_timedelta(seconds, unit='s')
+    return pd.DataFrame({'Datetime': times, 'EC.T': background + excess})
+
+def write_cf_file(path, cf, intercept=50.0, primary_solution=2000.0, calibration_date=None, lab_field='Lab'):
+    """Writes a *_CFvals.xlsx file whose calibration points lie exactly on concentration = cf * (EC - intercept)."""
+    added = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    concentration = primary_solution * added / 1000.0
+    rows = [['Site', path.name.split('_')[0]], ['Calibration Date', calibration_date], ['Lab/Field', lab_field],
+            ['Primary solution [g/m3]', primary_solution], [None, None, None],
+            ['Vol. [ml]', 'Vol. salt solution added [ml]', 'EC [uS/cm]']]
+    rows += [[1000.0, a, c / cf + intercept] for a, c in zip(added, concentration)]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows).to_excel(path, header=False, index=False)
+    return path
+
+def test_integrate_ec_trapezoid():
+    df = salt_wave()
+    # Triangle of 120 s base and 200 uS/cm height
+    assert integrate_ec(df['Datetime'], df['EC.T'], 100.0) == pytest.approx(12000.0)
+    assert integrate_ec(df['Datetime'], df['EC.T'], np.full(len(df), 100.0)) == pytest.approx(12000.0)
+    # Uneven sampling: the integral of a piecewise linear signal is exact at its vertices
+    uneven = df.iloc[[0, 6, 18, 30, len(df) - 1]]
+    assert integrate_ec(uneven['Datetime'], uneven['EC.T'], 100.0) == pytest.approx(12000.0)
+    assert integrate_ec(df['Datetime'][:1], df['EC.T'][:1], 100.0) == 0.0
+
+def test_estimate_background_baseline():
+    df_dump = salt_wave(background=0.0)
+    # Baseline record drifting from 100 to 110 uS/cm over the first minute of the dump only
+    df_baseline = pd.DataFrame({'Datetime': df_dump['Datetime'].iloc[:13], 'EC.T': np.linspace(100.0, 110.0, 13)})
+    background = estimate_background(df_dump, df_baseline, method='baseline')
+    np.testing.assert_allclose(background[:13], np.linspace(100.0, 110.0, 13))
+    # Outside the baseline record its median is used
+    np.testing.assert_allclose(background[13:], 105.0)
+    with pytest.raises(ValueError):
+        estimate_background(df_dump, None, method='baseline')
+
+def test_estimate_background_edges():
+    df_dump = salt_wave(background=0.0)
+    # Background drifting linearly from 100 to 124 uS/cm under the wave
+    drift = np.linspace(100.0, 124.0, len(df_dump))
+    df_dump['EC.T'] += drift
+    background = estimate_background(df_dump, method='edges', edge_points=5)
+    # Straight line from the mean of the first five readings to the mean of the last five, across the window
+    start_ec, end_ec = df_dump['EC.T'].iloc[:5].mean(), df_dump['EC.T'].iloc[-5:].mean()
+    np.testing.assert_allclose(background, np.linspace(start_ec, end_ec, len(df_dump)))
+    assert integrate_ec(df_dump['Datetime'], df_dump['EC.T'], background) == pytest.approx(12000.0, rel=0.05)
+
+def test_calculate_discharge_synthetic_wave(tmp_path):
+    dump_file = tmp_path / "chase_us_20241104_dump1_ds_AT200.xlsx"
+    baseline_file = tmp_path / "chase_us_20241104_baseline_AT200.xlsx"
+    # Compact copies next to the (absent) Excel files are read instead
+    salt_wave().to_csv(dump_file.with_suffix('.csv'), index=False)
+    pd.DataFrame({'Datetime': pd.date_range('2024-11-04 09:50', periods=60, freq='5s'), 'EC.T': 100.0}).to_csv(
+        baseline_file.with_suffix('.csv'), index=False)
+    cf_file = write_cf_file(tmp_path / "chase_us_20241104_AT200_CFvals.xlsx", cf=0.5)
+
+    result = calculate_discharge(dump_file, baseline_file, cf_file, salt_mass=1200.0)
+    assert result['cf'] == pytest.approx(0.5) and result['cf_r2'] == pytest.approx(1.0)
+    assert result['background_method'] == 'baseline' and result['background_ec'] == pytest.approx(100.0)
+    assert result['ec_integral'] == pytest.approx(12000.0)
+    # Q = M / (CF * integral) = 1200 g / (0.5 (g/m3)/(uS/cm) * 12000 uS/cm*s)
+    assert result['discharge_m3s'] == pytest.approx(0.2)
+    assert (result['site'], result['date'], result['dump'], result['sensor']) == ('chase_us', '20241104', '1', 'AT200')
+
+    # A catalog calibration replaces the CF file
+    result = calculate_discharge(dump_file, salt_mass=1200.0, cf_calibration={'cf': 0.25, 'r2': 0.99})
+    assert result['background_method'] == 'edges'
+    assert result['discharge_m3s'] == pytest.approx(0.4)
+
+    with pytest.raises(ValueError):
+        calculate_discharge(dump_file, baseline_file, salt_mass=1200.0)
+
+@pytest.fixture
+def cf_tree(tmp_path):
+    cf_directory = tmp_path / "CF"
+    for site, date, sensor, cf in [('chase_us', '20241001', 'AT200', 0.50), ('chase_us', '20241101', 'AT200', 0.52),
+                                   ('northfield', '20241101', 'AT200', 0.54), ('chase_us', '20241201', 'AT300', 0.60)]:
+        write_cf_file(cf_directory / site / date / f"{site}_{date}_{sensor}_CFvals.xlsx", cf=cf)
+    return cf_directory
+
+def test_update_cf_catalog_is_incremental(cf_tree):
+    df_catalog = update_cf_catalog(cf_tree)
+    assert df_catalog['sensor'].tolist() == ['AT200', 'AT200', 'AT200', 'AT300']
+    np.testing.assert_allclose(df_catalog['cf'], [0.50, 0.52, 0.54, 0.60])
+    assert (df_catalog['error'] == '').all()
+    assert load_cf_catalog(cf_tree)['path'].tolist() == df_catalog['path'].tolist()
+
+    # Only changed files are read again, deleted files are dropped
+    changed = cf_tree / "chase_us" / "20241001" / "chase_us_20241001_AT200_CFvals.xlsx"
+    write_cf_file(changed, cf=0.45)
+    os.utime(changed, (changed.stat().st_atime, changed.stat().st_mtime + 10))
+    (cf_tree / "northfield" / "20241101" / "northfield_20241101_AT200_CFvals.xlsx").unlink()
+    df_catalog = update_cf_catalog(cf_tree)
+    np.testing.assert_allclose(df_catalog['cf'], [0.45, 0.52, 0.60])
+
+def test_find_best_cf_nearest_date(cf_tree):
+    df_catalog = update_cf_catalog(cf_tree)
+    # 2024-10-20 is 12 days before the November calibrations and 19 days after the October one
+    assert find_best_cf(df_catalog, 'AT200', '2024-10-20', site='chase_us')['cf'] == pytest.approx(0.52)
+    assert find_best_cf(df_catalog, 'AT200', '2024-10-20', site='northfield')['cf'] == pytest.approx(0.54)
+    assert find_best_cf(df_catalog, 'AT200', '2024-10-10')['cf'] == pytest.approx(0.50)
+    # After the last calibration the latest one is used
+    assert find_best_cf(df_catalog, 'AT200', '2025-03-01', site='chase_us')['cf'] == pytest.approx(0.52)
+
+def test_find_best_cf_without_earlier_calibration(cf_tree):
+    df_catalog = update_cf_catalog(cf_tree)
+    # AT300 was first calibrated after the measurement, so the later calibration is the nearest
+    best = find_best_cf(df_catalog, 'AT300', '2024-11-20')
+    assert best['cf'] == pytest.approx(0.60) and best['date'] == pd.Timestamp('2024-12-01')
+    assert find_best_cf(df_catalog, 'AT300', '2024-11-20', max_age=pd.Timedelta(days=7)) is None
+    assert find_best_cf(df_catalog, 'AT100', '2024-11-20') is None
+    assert find_best_cf(df_catalog, 'AT300', '2024-11-20', lab_field='Field') is None
@@ -0,0 +1,143 @@
+import os
+import time
+import pandas as pd
+import pytest
+import field_forms
+from field_forms import clear_salt_dump_index_cache, fetch_field_form_columns, salt_dump_index, sync_field_forms
+from gspread_stub import OfflineClient, StubClient, StubWorksheet, api_error
+from project_utils import get_salt_dump_times
+
+HEADER = ['submissionid', 'Site_Name', 'Arrival_Time_to_Site', 'Notes', 'Salt_Dump.Time_of_Salt_Dump']
+
+@pytest.fixture
+def sheet():
+    worksheets = [
+        StubWorksheet('v1', HEADER, [
+            ['101', 'Northfield', '2024-11-04 09:00:00', 'first dump', '2024-11-04 10:00:00'],
+            ['101', 'Northfield', '2024-11-04 09:00:00', '', '2024-11-04 10:30:00'],
+            ['102', 'Chase Bridge', '2024-11-05 09:00:00', 'no dump', ''],
+        ]),
+        # Later form version: other column order and time format
+        StubWorksheet('v2', ['submissionid', 'Salt_Dump.Time_of_Salt_Dump', 'Site_Name'], [
+            ['201', '11/06/2024 10:30', 'Northfield'],
+            ['202', '11/07/2024 11:00', 'Cat Creek (Beaconsfield)'],
+        ]),
+    ]
+    return StubClient(worksheets)
+
+@pytest.fixture
+def paths(tmp_path):
+    clear_salt_dump_index_cache()
+    yield {'index_file': tmp_path / "salt_dump_times.csv", 'database': tmp_path / "field_forms.sqlite"}
+    clear_salt_dump_index_cache()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the backoff delays instead of waiting."""
+    delays = []
+    monkeypatch.setattr(field_forms.time, 'sleep', delays.append)
+    return delays
+
+def northfield_times(**kwargs):
+    return get_salt_dump_times('northfield', **kwargs)
+
+def test_retry_with_backoff(sheet, sleeps):
+    v1 = sheet.spreadsheet.worksheets()[0]
+    v1.errors = [api_error(429), ConnectionError("reset"), api_error(503)]
+    df_forms = fetch_field_form_columns(field_forms.SALT_DUMP_COLUMNS, sheet)
+    assert len(df_forms) == 5
+    assert sleeps == [1.0, 2.0, 4.0]
+
+def test_non_transient_error_is_not_retried(sheet, sleeps):
+    v1 = sheet.spreadsheet.worksheets()[0]
+    v1.errors = [api_error(404)]
+    with pytest.raises(field_forms.gspread.exceptions.APIError):
+        fetch_field_form_columns(field_forms.SALT_DUMP_COLUMNS, sheet)
+    assert sleeps == []
+    assert len(v1.requests) == 1
+
+def test_retries_give_up(sleeps):
+    attempts = []
+    def request():
+        attempts.append(1)
+        raise api_error(500)
+    with pytest.raises(field_forms.gspread.exceptions.APIError):
+        field_forms._request(request, max_attempts=3, retry_delay=0.5)
+    assert len(attempts) == 3
+    assert sleeps == [0.5, 1.0]
+
+def test_only_needed_columns_are_requested(sheet):
+    df_forms = fetch_field_form_columns(field_forms.SALT_DUMP_COLUMNS, sheet)
+    v1, v2 = sheet.spreadsheet.worksheets()
+    assert v1.requests == [('row_values', 1), ('batch_get', ('B2:B', 'E2:E'))]
+    assert v2.requests == [('row_values', 1), ('batch_get', ('C2:C', 'B2:B'))]
+    assert df_forms.columns.tolist() == field_forms.SALT_DUMP_COLUMNS + ['worksheet']
+    assert df_forms['Salt_Dump.Time_of_Salt_Dump'].tolist() == ['2024-11-04 10:00:00', '2024-11-04 10:30:00', '',
+                                                                '11/06/2024 10:30', '11/07/2024 11:00']
+
+def test_index_parsed_per_worksheet(sheet, paths):
+    expected = [pd.Timestamp('2024-11-04 10:00'), pd.Timestamp('2024-11-04 10:30'), pd.Timestamp('2024-11-06 10:30')]
+    assert northfield_times(client=sheet, **paths) == expected
+    assert get_salt_dump_times('chase_bridge', client=sheet, **paths) == []
+    with pytest.raises(ValueError):
+        get_salt_dump_times('nowhere', client=sheet, **paths)
+
+def test_memory_then_disk_then_ttl(sheet, paths):
+    times = northfield_times(client=sheet, **paths)
+    assert sheet.opened == 1
+    assert paths['index_file'].exists()
+
+    # Served from memory
+    assert northfield_times(client=sheet, **paths) == times
+    assert sheet.opened == 1
+
+    # Served from the file on disk within the TTL
+    clear_salt_dump_index_cache()
+    assert northfield_times(client=OfflineClient(), **paths) == times
+    assert sheet.opened == 1
+
+    # Rebuilt from the sheet once the TTL has passed
+    v1 = sheet.spreadsheet.worksheets()[0]
+    v1.rows.append(['103', 'Northfield', '2024-12-02 08:00:00', '', '2024-12-02 09:00:00'])
+    clear_salt_dump_index_cache()
+    expired = time.time() - field_forms.SALT_DUMP_INDEX_TTL.total_seconds() - 60
+    os.utime(paths['index_file'], (expired, expired))
+    assert northfield_times(client=sheet, **paths) == times[:2] + [pd.Timestamp('2024-12-02 09:00')] + times[2:]
+    assert sheet.opened == 2
+
+def test_memory_entry_expires(sheet, paths):
+    salt_dump_index(client=sheet, **paths)
+    salt_dump_index(ttl=pd.Timedelta(0), client=sheet, **paths)
+    assert sheet.opened == 2
+
+def test_refresh_bypasses_cache(sheet, paths):
+    times = northfield_times(client=sheet, **paths)
+    v2 = sheet.spreadsheet.worksheets()[1]
+    v2.rows.append(['203', '12/01/2024 14:00', 'Northfield'])
+
+    assert northfield_times(client=sheet, **paths) == times
+    assert northfield_times(client=sheet, refresh=True, **paths) == times + [pd.Timestamp('2024-12-01 14:00')]
+    assert sheet.opened == 2
+
+    # The refreshed index is also the one served from disk
+    clear_salt_dump_index_cache()
+    assert len(northfield_times(client=OfflineClient(), **paths)) == 4
+
+def test_offline_uses_mirror(sheet, paths):
+    sync_field_forms(sheet, paths['database'])
+    client = OfflineClient()
+    times = northfield_times(offline=True, client=client, **paths)
+    assert times == [pd.Timestamp('2024-11-04 10:00'), pd.Timestamp('2024-11-04 10:30'), pd.Timestamp('2024-11-06 10:30')]
+    assert client.opened == 0
+
+    # An existing index is served offline whatever its age
+    clear_salt_dump_index_cache()
+    os.utime(paths['index_file'], (0, 0))
+    assert northfield_times(offline=True, client=client, **paths) == times
+    assert client.opened == 0
+
+def test_unreachable_sheet_falls_back_to_mirror(sheet, paths, capsys):
+    sync_field_forms(sheet, paths['database'])
+    times = northfield_times(client=OfflineClient(), **paths)
+    assert len(times) == 3
+    assert "Using the local mirror" in capsys.readouterr().out
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from project_utils import build_baro_grid, get_baro_grid, ingest_stage_chunks, lookup_baro_grid, process_stage_window
+from stage_store import append_stage_data, read_stage_data
+
+
+def _stage_download(start='2024-11-01', periods=120):
+    index = pd.date_range(start, periods=periods, freq='15min', name='Datetime')
+    return pd.DataFrame({
+        'Absolute Pressure (kPa)': np.full(periods, 110.0),
+        'Temperature (°C)': np.full(periods, 5.0),
+        'Differential Pressure (kPa)': np.nan,
+        'Water Level (m)': np.nan,
+    }, index=index)
+
+
+def _baro_grid(start, end):
+    baro = pd.Series(100.0, index=pd.date_range(start, end, freq='15min', name='Datetime'))
+    return build_baro_grid([('chase_usBT', baro)])
+
+
+def test_late_baro_data_rewrites_overlap(tmp_path):
+    df_download = _stage_download()
+    midpoint = df_download.index[59]
+
+    # First ingest: the BT record only covers the first half of the download
+    summary = ingest_stage_chunks('chase_us', [df_download], root=tmp_path,
+                                  baro_grid=_baro_grid(df_download.index[0], midpoint))
+    assert summary['new_rows'] == 120
+    assert read_stage_data('chase_us', root=tmp_path)['Water Level (m)'].isna().sum() == 60
+
+    # Re-ingesting the same download after the BT record caught up re-corrects the stored gap
+    summary = ingest_stage_chunks('chase_us', [df_download], root=tmp_path,
+                                  baro_grid=_baro_grid(df_download.index[0], df_download.index[-1]))
+    assert summary['new_rows'] == 0
+    assert summary['recorrected_rows'] == 60
+    assert summary['written_partitions'] == ['2024-11']
+
+    df_stored = read_stage_data('chase_us', root=tmp_path)
+    assert df_stored['Water Level (m)'].notna().all()
+    np.testing.assert_allclose(df_stored['Differential Pressure (kPa)'], 10.0)
+
+
+def test_unchanged_overlap_is_not_recorrected(tmp_path):
+    df_download = _stage_download()
+    baro_grid = _baro_grid(df_download.index[0], df_download.index[-1])
+    ingest_stage_chunks('chase_us', [df_download], root=tmp_path, baro_grid=baro_grid)
+
+    _, df_unique, summary = process_stage_window('chase_us', df_download, root=tmp_path, baro_grid=baro_grid)
+    assert df_unique.empty
+    assert summary['recorrected_rows'] == 0
+
+    summary = ingest_stage_chunks('chase_us', [df_download], root=tmp_path, baro_grid=baro_grid)
+    assert summary['written_partitions'] == []
+
+
+def _bt_download(start, periods):
+    index = pd.date_range(start, periods=periods, freq='15min', name='Datetime')
+    return pd.DataFrame({'Barometric Pressure (kPa)': np.full(periods, 100.0)}, index=index)
+
+
+def test_baro_grid_follows_bt_writes_from_other_processes(tmp_path):
+    append_stage_data('chase_usBT', _bt_download('2024-11-01', 96), root=tmp_path)
+    baro_grid = get_baro_grid('chase_us', root=tmp_path)
+    assert get_baro_grid('chase_us', root=tmp_path) is baro_grid
+
+    # Written straight to the store (as by another process), so clear_baro_grid_cache never runs here
+    append_stage_data('chase_usBT', _bt_download('2024-11-02', 96), root=tmp_path)
+    rebuilt = get_baro_grid('chase_us', root=tmp_path)
+    assert rebuilt is not baro_grid
+    assert np.isfinite(lookup_baro_grid(rebuilt, [pd.Timestamp('2024-11-02 12:00')])).all()